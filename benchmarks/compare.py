@@ -0,0 +1,44 @@
+"""
+Compares the wall time and the number of calls of the scenarios in two result files:
+
+    python -m benchmarks.compare BASELINE.json RESULTS.json
+"""
+import json
+import sys
+
+
+def load_cycles(path):
+    with open(path) as results_file:
+        report = json.load(results_file)
+    cycles = {}
+    for result in report["scenarios"]:
+        for index, cycle in enumerate(result["cycles"]):
+            cycles[(result["name"], result["engine"], index)] = cycle
+    return report["version"], cycles
+
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    baseline_version, baseline = load_cycles(sys.argv[1])
+    version, results = load_cycles(sys.argv[2])
+    print("%s -> %s" % (baseline_version["commit"], version["commit"]))
+    for key in sorted(set(baseline) & set(results)):
+        before, after = baseline[key], results[key]
+        print(
+            "%-18s %-7s cycle %s: %8.2f s -> %8.2f s (x%.2f), %8s -> %8s calls, %8s -> %8s KB"
+            % (
+                *key,
+                before["wall_time"],
+                after["wall_time"],
+                after["wall_time"] / before["wall_time"] if before["wall_time"] else 0,
+                before["calls"],
+                after["calls"],
+                before["peak_memory_kb"],
+                after["peak_memory_kb"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
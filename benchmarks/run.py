@@ -0,0 +1,195 @@
+"""
+Runs the sync against local stubs of the upstreams and saves the results as JSON:
+
+    python -m benchmarks.run [SCENARIO ...] [--engine threads|async] [--cycles N] [--shards N] [--output PATH]
+
+The first cycle creates all the objects in the stubs, the next ones find them up to date.
+With several shards a publisher process is started per shard, as the replicas of a StatefulSet,
+and they run every cycle at the same time.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from . import stubs
+from .scenarios import DEFAULT_SCENARIOS, SCENARIOS
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# The rate limit would dominate the results, it is benchmarked separately by the throttling of the stubs
+DEFAULT_ENVIRONMENT = {
+    "EOSC_RATE_LIMIT": "1000000",
+    "EOSC_METRICS_PORT": "0",
+    "EOSC_RETRY_BACKOFF": "0.1",
+}
+
+
+def get_version():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version()}
+
+
+def get_call_counts(upstream_stubs):
+    return {name: stub.get_stats() for name, stub in upstream_stubs.items()}
+
+
+def subtract_call_counts(after, before):
+    return {
+        name: {key: value - before[name][key] for key, value in stats.items()}
+        for name, stats in after.items()
+    }
+
+
+def start_worker(engine, environment, log_file):
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.worker", engine],
+        cwd=ROOT_DIR,
+        env=environment,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=log_file,
+        text=True,
+    )
+
+
+def run_cycle(name, workers, log_file):
+    for worker in workers:
+        worker.stdin.write("\n")
+        worker.stdin.flush()
+    cycles = []
+    for worker in workers:
+        line = worker.stdout.readline()
+        if not line:
+            raise RuntimeError(
+                "The worker of %s has failed, see %s" % (name, log_file.name)
+            )
+        cycles.append(json.loads(line))
+    # The slowest shard bounds the cycle
+    return {
+        "wall_time": max(cycle["wall_time"] for cycle in cycles),
+        "peak_memory_kb": max(cycle["peak_memory_kb"] for cycle in cycles),
+    }
+
+
+def run_scenario(name, engine, cycles, shards, log_file):
+    options = SCENARIOS[name]
+    upstream_stubs = stubs.start_stubs(
+        options["customers"],
+        options["offerings"],
+        latency=options["latency"],
+        error_rate=options["error_rate"],
+        catalogue_size=options["catalogue_size"],
+    )
+    environment = dict(os.environ, **DEFAULT_ENVIRONMENT)
+    environment.update(stubs.get_environment(upstream_stubs))
+    environment["PYTHONPATH"] = ROOT_DIR
+    workers = [
+        start_worker(
+            engine,
+            dict(
+                environment,
+                EOSC_SHARD_INDEX=str(shard_index),
+                EOSC_SHARD_COUNT=str(shards),
+            ),
+            log_file,
+        )
+        for shard_index in range(shards)
+    ]
+    results = []
+    try:
+        for _ in range(cycles):
+            before = get_call_counts(upstream_stubs)
+            cycle = run_cycle(name, workers, log_file)
+            cycle["upstreams"] = subtract_call_counts(
+                get_call_counts(upstream_stubs), before
+            )
+            cycle["calls"] = sum(
+                stats["calls"] for stats in cycle["upstreams"].values()
+            )
+            results.append(cycle)
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+        for stub in upstream_stubs.values():
+            stub.stop()
+    return dict(options, name=name, engine=engine, shards=shards, cycles=results)
+
+
+def print_results(result):
+    for index, cycle in enumerate(result["cycles"]):
+        print(
+            "%-18s %-7s cycle %s: %8.2f s %8s calls %8s KB"
+            % (
+                result["name"],
+                result["engine"],
+                index,
+                cycle["wall_time"],
+                cycle["calls"],
+                cycle["peak_memory_kb"],
+            ),
+            flush=True,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "scenarios", nargs="*", help="default: %s" % " ".join(DEFAULT_SCENARIOS)
+    )
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument(
+        "--shards", type=int, default=1, help="number of publisher processes"
+    )
+    parser.add_argument("--output", help="default: benchmarks/results/<timestamp>.json")
+    parser.add_argument("--list", action="store_true", help="list the scenarios")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, options in SCENARIOS.items():
+            print(name, json.dumps(options))
+        return
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+
+    started_at = datetime.now(timezone.utc)
+    output = args.output or os.path.join(
+        RESULTS_DIR, "%s.json" % started_at.strftime("%Y%m%d-%H%M%S")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "version": get_version(),
+        "started_at": started_at.isoformat(),
+        "scenarios": [],
+    }
+    # The logs of the publisher are kept next to the results
+    with open(os.path.splitext(output)[0] + ".log", "w") as log_file:
+        for name in args.scenarios or DEFAULT_SCENARIOS:
+            result = run_scenario(name, args.engine, args.cycles, args.shards, log_file)
+            print_results(result)
+            report["scenarios"].append(result)
+            with open(output, "w") as output_file:
+                json.dump(report, output_file, indent=2)
+    print("The results are saved to %s" % output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+The benchmark scenarios by name, the sizes are the number of customers and the number of offerings per customer.
+The catalogue size is the number of the resources and providers of other organizations in the catalogue.
+"""
+
+
+def scenario(customers, offerings, latency=0.0, error_rate=0.0, catalogue_size=100):
+    return {
+        "customers": customers,
+        "offerings": offerings,
+        "latency": latency,
+        "error_rate": error_rate,
+        "catalogue_size": catalogue_size,
+    }
+
+
+SCENARIOS = {
+    "10x1": scenario(10, 1),
+    "10x10": scenario(10, 10),
+    "10x50": scenario(10, 50),
+    "100x1": scenario(100, 1),
+    "100x10": scenario(100, 10),
+    "100x50": scenario(100, 50),
+    "1000x1": scenario(1000, 1),
+    "1000x10": scenario(1000, 10),
+    "1000x50": scenario(1000, 50),
+    # 20 ms per request is closer to the real upstreams than the loopback
+    "100x10-latency": scenario(100, 10, latency=0.02),
+    "100x10-errors": scenario(100, 10, error_rate=0.02),
+    # The catalogue is shared with other providers, it is listed when offerings are unknown
+    "100x10-catalogue": scenario(100, 10, catalogue_size=5000),
+}
+
+# The scenarios run by default, the larger ones take minutes
+DEFAULT_SCENARIOS = [
+    "10x1",
+    "10x50",
+    "100x10",
+    "1000x1",
+    "100x10-latency",
+    "100x10-errors",
+]
@@ -0,0 +1,368 @@
+"""Local HTTP stand-ins for Waldur, AAI, the Provider portal and the Marketplace."""
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATALOGUE_ID = "benchmark"
+PLANS_PER_OFFERING = 2
+
+
+class StubServer:
+    """
+    Serves the routes of an upstream from memory.
+    Every request waits for the latency, a share of them given by the error rate fails with the error status.
+    """
+
+    name = None
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=502):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = Counter()
+        self.errors = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.build_handler())
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:%s/" % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def build_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and the body are sent at once, otherwise the delayed ACK adds 40 ms to every response
+            wbufsize = -1
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path, _, query = self.path.partition("?")
+                status, payload, headers = stub.handle(
+                    self.command, path, dict(urllib.parse.parse_qsl(query)), body
+                )
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                data = data.encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def handle(self, method, path, query, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors[method] += 1
+        if failed:
+            return self.error_status, {"detail": "Injected error"}, None
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            # The token request is form encoded
+            data = None
+        with self.lock:
+            return self.route(method, path, query, data)
+
+    def route(self, method, path, query, data):
+        raise NotImplementedError
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "errors": sum(self.errors.values()),
+            }
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def build_offering(customer, index):
+    return {
+        "uuid": uuid.uuid4().hex,
+        "name": "Offering %s of %s" % (index, customer["name"]),
+        "customer_uuid": customer["uuid"],
+        "customer_name": customer["name"],
+        "state": "Active",
+        "description": "Offering description",
+        "attributes": {},
+        "thumbnail": None,
+        "privacy_policy_link": "",
+        "terms_of_service_link": "",
+        "plans": [
+            {
+                "uuid": uuid.uuid4().hex,
+                "name": "Plan %s" % plan,
+                "description": "Plan description",
+            }
+            for plan in range(PLANS_PER_OFFERING)
+        ],
+        "components": [
+            {
+                "billing_type": "limit",
+                "type": "cpu",
+                "name": "CPU",
+                "description": "",
+                "measured_unit": "hours",
+                "min_value": 1,
+                "max_value": 100,
+            }
+        ],
+    }
+
+
+class WaldurStub(StubServer):
+    name = "waldur"
+
+    def __init__(self, customers, offerings_per_customer, **kwargs):
+        super().__init__(**kwargs)
+        self.customers = {}
+        self.service_providers = []
+        self.offerings = []
+        for index in range(customers):
+            customer = {
+                "uuid": uuid.uuid4().hex,
+                "name": "Customer %s" % index,
+                "abbreviation": "C%s" % index,
+                "image": None,
+                "address": "Street 1",
+                "postal": "12345",
+                "country": "EE",
+                "homepage": "",
+                "email": "customer%s@example.com" % index,
+                "division": None,
+            }
+            self.customers[customer["uuid"]] = customer
+            self.service_providers.append(
+                {
+                    "uuid": uuid.uuid4().hex,
+                    "customer_uuid": customer["uuid"],
+                    "description": "Service provider description",
+                }
+            )
+            self.offerings.extend(
+                build_offering(customer, offering)
+                for offering in range(offerings_per_customer)
+            )
+
+    def paginate(self, items, path, query):
+        page = int(query.get("page", 1))
+        page_size = int(query.get("page_size", 10))
+        headers = {"X-Result-Count": str(len(items))}
+        if page * page_size < len(items):
+            next_query = urllib.parse.urlencode(dict(query, page=page + 1))
+            headers["Link"] = '<%s%s?%s>; rel="next"' % (
+                self.url.rstrip("/"),
+                path,
+                next_query,
+            )
+        start = (page - 1) * page_size
+        end = start + page_size
+        return 200, items[start:end], headers
+
+    def filter(self, items, query):
+        # The stub objects are never modified, so the incremental listings are empty
+        if "modified" in query:
+            return []
+        if "customer_uuid" in query:
+            return [
+                item
+                for item in items
+                if item["customer_uuid"] == query["customer_uuid"]
+            ]
+        return items
+
+    def route(self, method, path, query, data):
+        if path.endswith("/configuration/"):
+            return (
+                200,
+                {"WALDUR_CORE": {"HOMEPORT_URL": "https://waldur.example.com/"}},
+                None,
+            )
+        match = re.search(r"/customers/([0-9a-f]+)/$", path)
+        if match:
+            return 200, self.customers[match.group(1)], None
+        if path.endswith("/customers/"):
+            return self.paginate(
+                self.filter(list(self.customers.values()), query), path, query
+            )
+        if path.endswith("/marketplace-service-providers/"):
+            return self.paginate(
+                self.filter(self.service_providers, query), path, query
+            )
+        if path.endswith("/marketplace-provider-offerings/"):
+            return self.paginate(self.filter(self.offerings, query), path, query)
+        # The webhook listener looks up the customers of the notified offerings
+        match = re.search(r"/marketplace-provider-offerings/([0-9a-f]+)/$", path)
+        if match:
+            for offering in self.offerings:
+                if offering["uuid"] == match.group(1):
+                    return 200, offering, None
+        return 404, {"detail": "Not found."}, None
+
+
+class AAIStub(StubServer):
+    name = "aai"
+
+    def route(self, method, path, query, data):
+        return 200, {"access_token": uuid.uuid4().hex, "expires_in": 3600}, None
+
+
+class ProviderPortalStub(StubServer):
+    name = "provider_portal"
+
+    def __init__(self, catalogue_size=0, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = "/api/catalogue/%s/" % CATALOGUE_ID
+        self.providers = {}
+        self.resources = {}
+        # The objects of the other providers of the catalogue
+        for index in range(catalogue_size):
+            self.providers["other-%s" % index] = {
+                "id": "other-%s" % index,
+                "name": "Other %s" % index,
+            }
+            self.resources["other-%s" % index] = {
+                "id": "other-%s" % index,
+                "name": "Other %s" % index,
+            }
+
+    def get_stats(self):
+        stats = super().get_stats()
+        # The offerings synced twice by the replicas of a sharded run would show up as extra resources
+        with self.lock:
+            stats["resources"] = len(self.resources)
+        return stats
+
+    def list_items(self, items, query):
+        start = int(query.get("from", 0))
+        quantity = int(query.get("quantity", 10))
+        end = start + quantity
+        results = list(items.values())[start:end]
+        return (
+            200,
+            {
+                "total": len(items),
+                "from": start,
+                "to": start + len(results),
+                "results": results,
+            },
+            None,
+        )
+
+    def route(self, method, path, query, data):
+        if path.endswith("resource/all") and not path.startswith(self.prefix):
+            return self.list_items(self.resources, query)
+        if path.endswith("provider/all"):
+            return self.list_items(self.providers, query)
+        if not path.startswith(self.prefix):
+            return 404, {"error": "Not found"}, None
+        kind, _, object_id = path.replace(self.prefix, "", 1).partition("/")
+        if kind == "provider":
+            return self.route_object(
+                self.providers, "Provider", method, object_id, data
+            )
+        if kind == "resource":
+            return self.route_object(self.resources, "Service", method, object_id, data)
+        return 404, {"error": "Not found"}, None
+
+    def route_object(self, objects, kind, method, object_id, data):
+        if method == "GET":
+            if object_id in objects:
+                return 200, objects[object_id], None
+            return 404, {"error": "Not found"}, None
+        if method == "DELETE":
+            return 200, objects.pop(object_id, {}), None
+        if method == "POST":
+            if kind == "Provider":
+                data["id"] = data["abbreviation"].lower()
+                data["users"] = []
+            else:
+                data["id"] = "res-%s" % uuid.uuid4().hex[:8]
+            objects[data["id"]] = data
+            return 201, data, None
+        if method == "PUT":
+            if objects.get(data["id"]) == data:
+                return 200, "There are no changes in the %s" % kind, None
+            objects[data["id"]] = data
+            return 200, data, None
+        return 405, {"error": "Method not allowed"}, None
+
+
+class MarketplaceStub(StubServer):
+    name = "marketplace"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.offers = {}
+        self.next_id = 1
+
+    def route(self, method, path, query, data):
+        match = re.match(r"/api/v1/resources/([^/]+)/offers/(\d+)?$", path)
+        if not match:
+            return 404, {"error": "Not found"}, None
+        offers = self.offers.setdefault(match.group(1), {})
+        if match.group(2) is None:
+            if method == "GET":
+                return 200, {"offers": list(offers.values())}, None
+            data["id"] = self.next_id
+            self.next_id += 1
+            offers[data["id"]] = data
+            return 201, data, None
+        offer_id = int(match.group(2))
+        if offer_id not in offers:
+            return 404, {"error": "Not found"}, None
+        if method == "DELETE":
+            offers.pop(offer_id)
+            return 200, {}, None
+        offers[offer_id].update(data)
+        return 200, offers[offer_id], None
+
+
+def start_stubs(
+    customers, offerings_per_customer, latency=0.0, error_rate=0.0, catalogue_size=0
+):
+    """Returns the stubs by the names of the upstreams, the token endpoint never fails."""
+    options = {"latency": latency, "error_rate": error_rate}
+    stubs = [
+        WaldurStub(customers, offerings_per_customer, **options),
+        AAIStub(latency=latency),
+        ProviderPortalStub(catalogue_size, **options),
+        MarketplaceStub(**options),
+    ]
+    return {stub.name: stub for stub in stubs}
+
+
+def get_environment(stubs):
+    return {
+        "WALDUR_URL": stubs["waldur"].url + "api/",
+        "WALDUR_TOKEN": "waldur-token",
+        "REFRESH_TOKEN_URL": stubs["aai"].url + "token",
+        "REFRESH_TOKEN": "refresh-token",
+        "CLIENT_ID": "client-id",
+        "PROVIDERS_PORTAL_URL": stubs["provider_portal"].url + "api/",
+        "EOSC_CATALOGUE_ID": CATALOGUE_ID,
+        "EOSC_URL": stubs["marketplace"].url,
+        "OFFERING_TOKEN": "offering-token",
+    }
@@ -0,0 +1,64 @@
+"""
+Runs the sync cycles of a benchmark in a process of its own, so its peak memory is not mixed with the stubs.
+A cycle is run for every line read from stdin and its results are written to stdout as a JSON line.
+"""
+import asyncio
+import json
+import resource
+import sys
+import time
+
+
+def get_peak_memory():
+    """Returns the peak resident memory in kilobytes."""
+    # Unlike ru_maxrss, the high water mark is not inherited from the runner process
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_threads():
+    # The environment of the stubs is set by the runner before the import
+    from eosc_publisher import app
+
+    for _ in sys.stdin:
+        started_at = time.perf_counter()
+        app.process_offers()
+        yield time.perf_counter() - started_at
+
+
+def run_async():
+    from eosc_publisher import async_app
+
+    loop = asyncio.new_event_loop()
+    publisher = loop.run_until_complete(async_app.AsyncPublisher().__aenter__())
+    try:
+        for _ in sys.stdin:
+            started_at = time.perf_counter()
+            loop.run_until_complete(async_app.process_offers(publisher))
+            yield time.perf_counter() - started_at
+    finally:
+        loop.run_until_complete(publisher.__aexit__(None, None, None))
+        loop.close()
+
+
+def main():
+    engine = sys.argv[1]
+    cycles = run_async() if engine == "async" else run_threads()
+    for wall_time in cycles:
+        print(
+            json.dumps(
+                {"wall_time": round(wall_time, 3), "peak_memory_kb": get_peak_memory()}
+            ),
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import pytest
+
+from eosc_publisher import settings
+
+# The mandatory settings, so the tests need no environment of their own
+TEST_ENVIRONMENT = {
+    "EOSC_URL": "https://marketplace.example.com/",
+    "OFFERING_TOKEN": "offering-token",
+    "PROVIDERS_PORTAL_URL": "https://providers.example.com/api/",
+    "REFRESH_TOKEN": "refresh-token",
+    "CLIENT_ID": "client-id",
+    "REFRESH_TOKEN_URL": "https://aai.example.com/token",
+    "EOSC_CATALOGUE_ID": "catalogue-id",
+    "WALDUR_TOKEN": "waldur-token",
+    "WALDUR_URL": "https://waldur.example.com/api/",
+}
+
+
+@pytest.fixture(autouse=True)
+def test_settings(monkeypatch):
+    for name, value in TEST_ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    settings.reload()
+    yield
+    settings.reload()
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from . import http_utils, lazy_singleton, logger, settings
+
+# Used when the AAI response does not contain expires_in
+DEFAULT_ACCESS_TOKEN_LIFETIME = 300
+
+
+def get_refresh_data():
+    return {
+        "grant_type": "refresh_token",
+        "refresh_token": settings.EOSC_AAI_REFRESH_TOKEN,
+        "client_id": settings.EOSC_AAI_CLIENT_ID,
+        "scope": "openid email profile",
+    }
+
+
+class AccessTokenManager:
+    """
+    Keeps the EOSC AAI access token and refreshes it only when it is about to expire.
+
+    The token is checked and refreshed under a lock, so concurrent callers asking
+    for a token at the same moment trigger a single request to the AAI.
+    """
+
+    def __init__(self, expiry_margin=None):
+        self.expiry_margin = (
+            settings.EOSC_AAI_ACCESS_TOKEN_EXPIRY_MARGIN
+            if expiry_margin is None
+            else expiry_margin
+        )
+        self.hits = 0
+        self.refreshes = 0
+        self.failures = 0
+        self._token = None
+        self._expires_at = 0
+        self._lifetime = 0
+        self._lock = threading.Lock()
+
+    def _is_valid(self):
+        # A short-lived token is used for at least half of its lifetime, whatever the margin is
+        margin = min(self.expiry_margin, self._lifetime / 2)
+        return self._token is not None and time.monotonic() < self._expires_at - margin
+
+    def _store_token(self, response):
+        """Keeps the token of the AAI response and returns it, or None if the refresh has failed."""
+        if response.status_code != 200:
+            self.failures += 1
+            logger.error(
+                f"Failed to get access token, {response.status_code}. {response.text}"
+            )
+            return None
+        response_data = response.json()
+        expires_in = response_data.get("expires_in") or DEFAULT_ACCESS_TOKEN_LIFETIME
+        self._token = response_data["access_token"]
+        self._lifetime = int(expires_in)
+        self._expires_at = time.monotonic() + self._lifetime
+        self.refreshes += 1
+        logger.info("The access token has been refreshed, expires in %ss", expires_in)
+        return self._token
+
+    def _refresh(self):
+        response = http_utils.get_session(http_utils.AAI).post(
+            settings.EOSC_AAI_REFRESH_TOKEN_URL, data=get_refresh_data()
+        )
+        return self._store_token(response)
+
+    def get_token(self):
+        # Callers arriving during a refresh wait for it and reuse its result
+        with self._lock:
+            if self._is_valid():
+                self.hits += 1
+                return self._token
+            return self._refresh()
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+
+@lazy_singleton
+def get_access_token_manager():
+    return AccessTokenManager()
+
+
+def get_access_token():
+    return get_access_token_manager().get_token()
@@ -1,121 +1,634 @@
+import signal
+import sys
 from collections import defaultdict
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-from eosc_publisher import marketplace_utils, provider_utils
+from eosc_publisher import (
+    aai_utils,
+    cache_utils,
+    circuit_breaker_utils,
+    http_utils,
+    log_utils,
+    marketplace_utils,
+    metrics_utils,
+    provider_utils,
+    rate_limit_utils,
+    scheduler_utils,
+    shard_utils,
+    state_utils,
+    trace_utils,
+    waldur_utils,
+    webhook_utils,
+)
 
-from . import logger, waldur_client
+from . import MissingSettingError, logger, settings
+from .waldur_utils import get_waldur_client
 
+ACTIVE_OFFERING_STATES = ["Active", "Paused"]
+INACTIVE_OFFERING_STATES = ["Archived", "Draft"]
 
-def process_offers():
-    waldur_offerings = waldur_client.list_marketplace_provider_offerings()
+CREATE_RESOURCE = "create"
+UPDATE_RESOURCE = "update"
+DELETE_RESOURCE = "delete"
+SKIP_RESOURCE = "skip"
+
+SYNC_MARK_KEY = "sync_mark"
+LAST_FULL_SYNC_KEY = "last_full_sync"
+SHARD_KEY = "shard"
+# The shard of the stores saved before the sharding
+DEFAULT_SHARD_KEY = "0/1"
+# The overlap covers the clock skew between the publisher and Waldur,
+# the objects synced twice are not pushed again thanks to the payload hashes
+SYNC_MARK_OVERLAP = timedelta(minutes=1)
 
-    if len(waldur_offerings) == 0:
-        logger.info("There are no offerings ready for sync with EOSC portal.")
 
+def group_offerings_by_customer(waldur_offerings):
     customer_to_offerings_mapping = defaultdict(lambda: [])
     for waldur_offering in waldur_offerings:
         customer_uuid = waldur_offering["customer_uuid"]
         customer_to_offerings_mapping[customer_uuid].append(waldur_offering)
+    return customer_to_offerings_mapping
+
+
+def is_customer_skipped(existing_provider, waldur_customer_offerings):
+    return existing_provider is None and all(
+        [
+            offering["state"] in INACTIVE_OFFERING_STATES
+            for offering in waldur_customer_offerings
+        ]
+    )
+
 
+def find_unknown_offerings(waldur_offerings, resource_ids):
+    return [
+        waldur_offering
+        for waldur_offering in waldur_offerings
+        if waldur_offering["uuid"] not in resource_ids
+    ]
+
+
+def match_offerings_by_name(waldur_offerings, eosc_resources, resource_ids):
+    """Looks up the resources of the offerings unknown to the state store by name and stores the result."""
+    for waldur_offering in waldur_offerings:
+        resource_id = eosc_resources.get(waldur_offering["name"])
+        resource_ids[waldur_offering["uuid"]] = resource_id
+        state_utils.get_state_store().set_resource_id(
+            waldur_offering["uuid"], resource_id
+        )
+
+
+def get_resource_ids(waldur_offerings):
+    """
+    Returns a mapping of offering UUIDs to EOSC resource IDs, or None if the catalogue can not be fetched.
+    The catalogue is fetched only if some offerings are not known to the state store.
+    """
+    resource_ids = state_utils.get_state_store().get_resource_ids(
+        [waldur_offering["uuid"] for waldur_offering in waldur_offerings]
+    )
+    unknown_offerings = find_unknown_offerings(waldur_offerings, resource_ids)
+    if not unknown_offerings:
+        logger.info("All the offerings are known to the state store")
+        return resource_ids
+
+    logger.info(
+        "%s offerings are unknown to the state store, looking them up in the catalogue",
+        len(unknown_offerings),
+    )
     eosc_resources = provider_utils.fetch_all_resources_from_eosc_catalogue()
     if not eosc_resources:
-        return
-    for (
-        customer_uuid,
-        waldur_customer_offerings,
-    ) in customer_to_offerings_mapping.items():
+        return None
+    match_offerings_by_name(unknown_offerings, eosc_resources, resource_ids)
+    return resource_ids
+
+
+def get_sync_mark(now):
+    """Returns the time the objects modified since are synced, or None if a full sync is due."""
+    if not settings.EOSC_INCREMENTAL_SYNC:
+        return None
+    state_store = state_utils.get_state_store()
+    sync_mark = state_store.get_value(SYNC_MARK_KEY)
+    last_full_sync = state_store.get_value(LAST_FULL_SYNC_KEY)
+    if sync_mark is None or last_full_sync is None:
+        return None
+    # The customers moved to this replica by a resize may have been modified before the mark
+    shard_key = state_store.get_value(SHARD_KEY) or DEFAULT_SHARD_KEY
+    if shard_key != shard_utils.get_shard_key():
+        logger.info("The shard has changed, the full reconcile is due")
+        return None
+    since_full_sync = now - datetime.fromisoformat(last_full_sync)
+    if since_full_sync.total_seconds() >= settings.EOSC_FULL_RECONCILE_INTERVAL:
+        logger.info("The full reconcile is due, the last one was at %s", last_full_sync)
+        return None
+    return sync_mark
+
+
+def save_sync_mark(started_at, is_full_sync):
+    """Saves the high-water mark after all the customers of a sync have been processed."""
+    sync_mark = started_at - SYNC_MARK_OVERLAP
+    state_store = state_utils.get_state_store()
+    state_store.set_value(SYNC_MARK_KEY, sync_mark.isoformat())
+    state_store.set_value(SHARD_KEY, shard_utils.get_shard_key())
+    if is_full_sync:
+        state_store.set_value(LAST_FULL_SYNC_KEY, started_at.isoformat())
+
+
+def merge_offerings(*offering_lists):
+    """Merges the offering lists, every offering is included once."""
+    merged_offerings = {}
+    for waldur_offerings in offering_lists:
+        for waldur_offering in waldur_offerings:
+            merged_offerings[waldur_offering["uuid"]] = waldur_offering
+    return list(merged_offerings.values())
+
+
+def list_modified_offerings(sync_mark):
+    """
+    Returns the offerings modified since the mark and all the offerings of the customers modified since the mark,
+    because the offerings include the provider ID of the customer.
+    """
+    waldur_client = get_waldur_client()
+    modified_offerings = waldur_client.list_marketplace_provider_offerings(
+        {"modified": sync_mark}
+    )
+    modified_customers = shard_utils.filter_customers(
+        waldur_client.list_customers({"modified": sync_mark})
+    )
+    customer_offerings = [
+        waldur_client.list_marketplace_provider_offerings(
+            {"customer_uuid": waldur_customer["uuid"]}
+        )
+        for waldur_customer in modified_customers
+    ]
+    logger.info(
+        "%s offerings and %s customers have been modified since %s",
+        len(modified_offerings),
+        len(modified_customers),
+        sync_mark,
+    )
+    return merge_offerings(modified_offerings, *customer_offerings)
+
+
+def get_existing_provider(waldur_customer, waldur_customer_offerings, eosc_providers):
+    """Looks up the provider of the customer in the prefetched providers, they are fetched one by one without them."""
+    if eosc_providers is None:
+        return provider_utils.get_eosc_provider(waldur_customer)
+    provider_id = provider_utils.get_provider_id(waldur_customer)
+    existing_provider = eosc_providers.get(provider_id)
+    if existing_provider is None and not is_customer_skipped(
+        None, waldur_customer_offerings
+    ):
+        # The listing may omit the providers which are not approved yet, so the provider is checked before creation
+        existing_provider = provider_utils.get_eosc_provider(waldur_customer)
+    return existing_provider
+
+
+def get_resource_action(waldur_offering, resource_ids):
+    """Returns the action to be done with the EOSC resource of the offering and the resource ID."""
+    resource_id = resource_ids.get(waldur_offering["uuid"])
+    if waldur_offering["state"] in ACTIVE_OFFERING_STATES:
+        if resource_id:
+            return UPDATE_RESOURCE, resource_id
+        return CREATE_RESOURCE, None
+    if waldur_offering["state"] in INACTIVE_OFFERING_STATES and resource_id:
+        return DELETE_RESOURCE, resource_id
+    return SKIP_RESOURCE, None
+
+
+@metrics_utils.OFFERING_SYNC_SECONDS.time()
+@trace_utils.span("offering")
+def process_offering(waldur_offering, provider_id, resource_ids):
+    trace_utils.set_attribute("uuid", waldur_offering["uuid"])
+    logger.info(
+        "Syncing offering %s from %s",
+        waldur_offering["name"],
+        waldur_offering["customer_name"],
+    )
+
+    action, resource_id = get_resource_action(waldur_offering, resource_ids)
+    # An update is counted once it is known whether the unchanged payload is skipped
+    if action != UPDATE_RESOURCE:
+        metrics_utils.count_change(metrics_utils.RESOURCE, action)
+    if action in [CREATE_RESOURCE, UPDATE_RESOURCE]:
+        logger.info("Syncing resource for offering %s", waldur_offering["name"])
+
+        with trace_utils.span("resource_sync", action=action):
+            if action == UPDATE_RESOURCE:
+                provider_resource = provider_utils.update_eosc_resource(
+                    waldur_offering, provider_id, resource_id
+                )
+            else:
+                provider_resource = provider_utils.create_eosc_resource(
+                    waldur_offering, provider_id
+                )
+                state_utils.get_state_store().set_resource_id(
+                    waldur_offering["uuid"], provider_resource["id"]
+                )
+
+        with trace_utils.span("offer_sync"):
+            marketplace_utils.sync_marketplace_offer(waldur_offering, provider_resource)
+    elif action == DELETE_RESOURCE:
+        with trace_utils.span("resource_sync", action=action):
+            if provider_utils.delete_eosc_resource(resource_id) is not None:
+                state_utils.get_state_store().set_resource_id(
+                    waldur_offering["uuid"], None
+                )
+        marketplace_utils.deactivate_offer(waldur_offering)
+    elif waldur_offering["state"] in INACTIVE_OFFERING_STATES:
+        logger.info("The resource is missing, skipping deletion.")
+    logger.info("." * 20)
+    # if not eosc_resource_created and not is_resource_up_to_date(eosc_resource, waldur_resource):
+    #     update_eosc_resource(eosc_resource, waldur_resource)
+    # if not offer_created and not are_offers_up_to_date(eosc_resource_offers, waldur_resource):
+    #     update_eosc_offers(eosc_resource, waldur_resource)
+
+
+def process_offering_with_collected_logs(waldur_offering, provider_id, resource_ids):
+    records = []
+    with log_utils.collected_logs(records):
         try:
-            logger.info(
-                "Processing customer %s [uuid=%s]",
-                waldur_customer_offerings[0]["customer_name"],
-                customer_uuid,
-            )
-            waldur_customer = waldur_client._get_resource(
-                waldur_client.Endpoints.Customers, customer_uuid
+            process_offering(waldur_offering, provider_id, resource_ids)
+        except Exception as e:
+            logger.exception(
+                "The offering %s [uuid=%s] can not be processed due to the following exception: %s",
+                waldur_offering["name"],
+                waldur_offering["uuid"],
+                e,
             )
+            return records, False
+    return records, True
 
-            existing_provider = provider_utils.get_eosc_provider(waldur_customer)
-            if existing_provider is None and all(
-                [
-                    offering["state"] in ["Archived", "Draft"]
-                    for offering in waldur_customer_offerings
-                ]
-            ):
-                logger.info(
-                    "The provider does not exist and all the offerings are inactive. Skipping the customer."
-                )
-                logger.info("-" * 20)
-                continue
 
-            provider = provider_utils.sync_eosc_provider(
-                waldur_customer, existing_provider
+def process_offerings_in_parallel(waldur_customer_offerings, provider_id, resource_ids):
+    # The pool is separate from the customer one, so a customer with many offerings
+    # uses at most EOSC_OFFERING_WORKERS threads and does not hold other customers back
+    max_workers = min(settings.EOSC_OFFERING_WORKERS, len(waldur_customer_offerings))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                trace_utils.bind(process_offering_with_collected_logs),
+                waldur_offering,
+                provider_id,
+                resource_ids,
             )
+            for waldur_offering in waldur_customer_offerings
+        ]
+        failed_count = 0
+        for future in futures:
+            records, succeeded = future.result()
+            log_utils.emit_records(records)
+            if not succeeded:
+                failed_count += 1
+
+    if failed_count:
+        raise Exception(
+            "%s of %s offerings have not been synced"
+            % (failed_count, len(waldur_customer_offerings))
+        )
 
+
+@metrics_utils.CUSTOMER_SYNC_SECONDS.time()
+@trace_utils.span("customer")
+def process_customer(
+    customer_uuid,
+    waldur_customer_offerings,
+    resource_ids,
+    waldur_index,
+    eosc_providers,
+):
+    trace_utils.set_attribute("uuid", customer_uuid)
+    try:
+        logger.info(
+            "Processing customer %s [uuid=%s]",
+            waldur_customer_offerings[0]["customer_name"],
+            customer_uuid,
+        )
+        waldur_customer = waldur_index.get_customer(
+            customer_uuid
+        ) or waldur_utils.get_customer(customer_uuid)
+
+        with trace_utils.span("provider_lookup"):
+            existing_provider = get_existing_provider(
+                waldur_customer, waldur_customer_offerings, eosc_providers
+            )
+        if is_customer_skipped(existing_provider, waldur_customer_offerings):
             logger.info(
-                "Syncing %s offerings of the provider", len(waldur_customer_offerings)
+                "The provider does not exist and all the offerings are inactive. Skipping the customer."
             )
+            metrics_utils.count_change(metrics_utils.PROVIDER, SKIP_RESOURCE)
+            logger.info("-" * 20)
+            return True
 
-            # TODO: add an ID value to customer.backend_id field
-            provider_id = provider["id"]
+        if existing_provider is None:
+            metrics_utils.count_change(metrics_utils.PROVIDER, CREATE_RESOURCE)
+        with trace_utils.span("provider_sync"):
+            provider = provider_utils.sync_eosc_provider(
+                waldur_customer,
+                existing_provider,
+                waldur_index.get_service_provider(customer_uuid),
+            )
+
+        logger.info(
+            "Syncing %s offerings of the provider", len(waldur_customer_offerings)
+        )
+
+        # TODO: add an ID value to customer.backend_id field
+        provider_id = provider["id"]
+        state_utils.get_state_store().set_provider_id(customer_uuid, provider_id)
 
+        if settings.EOSC_OFFERING_WORKERS <= 1:
             for waldur_offering in waldur_customer_offerings:
-                logger.info(
-                    "Syncing offering %s from %s",
-                    waldur_offering["name"],
-                    waldur_offering["customer_name"],
-                )
+                process_offering(waldur_offering, provider_id, resource_ids)
+        else:
+            process_offerings_in_parallel(
+                waldur_customer_offerings, provider_id, resource_ids
+            )
+    except Exception as e:
+        logger.exception(
+            "The customer [uuid=%s] and its offerings can not be processed due to the following exception: %s",
+            customer_uuid,
+            e,
+        )
+        logger.info("-" * 20)
+        return False
+    logger.info("-" * 20)
+    return True
 
-                if waldur_offering["state"] in ["Active", "Paused"]:
-                    logger.info(
-                        "Syncing resource for offering %s", waldur_offering["name"]
-                    )
-
-                    # TODO: use the value from options for lookup instead of name
-                    if waldur_offering["name"] in eosc_resources:
-                        resource_id = eosc_resources[waldur_offering["name"]]
-                        provider_resource = provider_utils.update_eosc_resource(
-                            waldur_offering, provider_id, resource_id
-                        )
-                    else:
-                        provider_resource = provider_utils.create_eosc_resource(
-                            waldur_offering, provider_id
-                        )
-
-                    marketplace_utils.sync_marketplace_offer(
-                        waldur_offering, provider_resource
-                    )
-                elif waldur_offering["state"] in ["Archived", "Draft"]:
-                    if waldur_offering["name"] in eosc_resources:
-                        resource_id = eosc_resources[waldur_offering["name"]]
-                        provider_utils.delete_eosc_resource(resource_id)
-                        marketplace_utils.deactivate_offer(waldur_offering)
-                    else:
-                        logger.info("The resource is missing, skipping deletion.")
-                logger.info("." * 20)
-                # if not eosc_resource_created and not is_resource_up_to_date(eosc_resource, waldur_resource):
-                #     update_eosc_resource(eosc_resource, waldur_resource)
-                # if not offer_created and not are_offers_up_to_date(eosc_resource_offers, waldur_resource):
-                #     update_eosc_offers(eosc_resource, waldur_resource)
-        except Exception as e:
-            logger.exception(
-                "The customer [uuid=%s] and its offerings can not be processed due to the following exception: %s",
+
+def process_customer_with_buffered_logs(
+    customer_uuid,
+    waldur_customer_offerings,
+    resource_ids,
+    waldur_index,
+    eosc_providers,
+):
+    with log_utils.buffered_logs():
+        return process_customer(
+            customer_uuid,
+            waldur_customer_offerings,
+            resource_ids,
+            waldur_index,
+            eosc_providers,
+        )
+
+
+def process_customers_in_parallel(
+    customer_to_offerings_mapping, resource_ids, waldur_index, eosc_providers
+):
+    logger.info(
+        "Processing %s customers with %s workers",
+        len(customer_to_offerings_mapping),
+        settings.EOSC_CUSTOMER_WORKERS,
+    )
+    with ThreadPoolExecutor(max_workers=settings.EOSC_CUSTOMER_WORKERS) as executor:
+        futures = [
+            executor.submit(
+                trace_utils.bind(process_customer_with_buffered_logs),
                 customer_uuid,
-                e,
+                waldur_customer_offerings,
+                resource_ids,
+                waldur_index,
+                eosc_providers,
             )
-        logger.info("-" * 20)
+            for (
+                customer_uuid,
+                waldur_customer_offerings,
+            ) in customer_to_offerings_mapping.items()
+        ]
+        return [future.result() for future in futures]
+
+
+def process_customers(
+    customer_to_offerings_mapping, resource_ids, waldur_index, eosc_providers
+):
+    """Returns the customer UUIDs mapped to whether the customer has been synced."""
+    if settings.EOSC_CUSTOMER_WORKERS <= 1:
+        results = [
+            process_customer(
+                customer_uuid,
+                waldur_customer_offerings,
+                resource_ids,
+                waldur_index,
+                eosc_providers,
+            )
+            for (
+                customer_uuid,
+                waldur_customer_offerings,
+            ) in customer_to_offerings_mapping.items()
+        ]
+    else:
+        results = process_customers_in_parallel(
+            customer_to_offerings_mapping, resource_ids, waldur_index, eosc_providers
+        )
+    return dict(zip(customer_to_offerings_mapping, results))
+
+
+def get_report(waldur_offerings, results):
+    return {
+        "offerings": len(waldur_offerings),
+        "customers": len(results),
+        "failed_customers": [
+            customer_uuid
+            for customer_uuid, succeeded in results.items()
+            if not succeeded
+        ],
+    }
+
+
+def process_offers():
+    """Runs a sync cycle and returns its report, or None if the cycle has been aborted."""
+    started_at = datetime.now(timezone.utc)
+    sync_mark = get_sync_mark(started_at)
+    with trace_utils.span("waldur_offerings_fetch", incremental=sync_mark is not None):
+        if sync_mark is None:
+            logger.info("Syncing all the offerings")
+            waldur_offerings = get_waldur_client().list_marketplace_provider_offerings()
+        else:
+            waldur_offerings = list_modified_offerings(sync_mark)
+    waldur_offerings = shard_utils.filter_offerings(waldur_offerings)
+
+    if len(waldur_offerings) == 0:
+        logger.info("There are no offerings ready for sync with EOSC portal.")
+
+    customer_to_offerings_mapping = group_offerings_by_customer(waldur_offerings)
+
+    with trace_utils.span("catalogue_resources_fetch"):
+        resource_ids = get_resource_ids(waldur_offerings)
+    if resource_ids is None:
+        return None
+
+    with trace_utils.span("waldur_index_fetch"):
+        waldur_index = waldur_utils.prefetch_waldur_index(
+            list(customer_to_offerings_mapping)
+        )
+    eosc_providers = None
+    # As with the Waldur objects, the providers of a few customers are fetched one by one instead of the catalogue
+    if len(customer_to_offerings_mapping) >= waldur_utils.PREFETCH_MIN_CUSTOMERS:
+        with trace_utils.span("catalogue_providers_fetch"):
+            eosc_providers = provider_utils.fetch_all_providers_from_eosc_catalogue()
+
+    results = process_customers(
+        customer_to_offerings_mapping, resource_ids, waldur_index, eosc_providers
+    )
+    logger.info("Waldur index stats: %s", waldur_index.get_stats())
+
+    # The modified objects of the failed customers are synced again by the next pass
+    if all(results.values()):
+        save_sync_mark(started_at, is_full_sync=sync_mark is None)
+    return get_report(waldur_offerings, results)
+
+
+def sync_customers(customer_uuids):
+    """
+    Syncs the customers outside of a cycle, e.g. the retries of the failed ones.
+    Returns the customer UUIDs mapped to whether the customer has been synced.
+    """
+    results = {customer_uuid: False for customer_uuid in customer_uuids}
+    try:
+        waldur_client = get_waldur_client()
+        waldur_offerings = merge_offerings(
+            *[
+                waldur_client.list_marketplace_provider_offerings(
+                    {"customer_uuid": customer_uuid}
+                )
+                for customer_uuid in customer_uuids
+            ]
+        )
+        resource_ids = get_resource_ids(waldur_offerings)
+    except Exception as e:
+        logger.exception("The customers can not be synced: %s", e)
+        return results
+    if resource_ids is None:
+        return results
+
+    customer_to_offerings_mapping = group_offerings_by_customer(waldur_offerings)
+    # The customers without offerings have nothing to sync
+    for customer_uuid in customer_uuids:
+        if customer_uuid not in customer_to_offerings_mapping:
+            results[customer_uuid] = True
+    results.update(
+        process_customers(
+            customer_to_offerings_mapping,
+            resource_ids,
+            waldur_utils.WaldurIndex(),
+            None,
+        )
+    )
+    return results
+
+
+def rebuild_state():
+    """Rebuilds the state store from the Waldur offerings, the EOSC catalogue and the Marketplace offers."""
+    logger.info("Rebuilding the state store")
+    waldur_offerings = shard_utils.filter_offerings(
+        get_waldur_client().list_marketplace_provider_offerings()
+    )
+    eosc_resources = provider_utils.fetch_all_resources_from_eosc_catalogue()
+    if not eosc_resources:
+        logger.error("Unable to rebuild the state store without the catalogue")
+        return
+
+    state_store = state_utils.get_state_store()
+    state_store.clear()
+    resource_ids = {}
+    match_offerings_by_name(waldur_offerings, eosc_resources, resource_ids)
+
+    for customer_uuid in group_offerings_by_customer(waldur_offerings):
+        waldur_customer = waldur_utils.get_customer(customer_uuid)
+        provider = provider_utils.get_eosc_provider(waldur_customer)
+        if provider is not None:
+            state_store.set_provider_id(customer_uuid, provider["id"])
+
+    for waldur_offering in waldur_offerings:
+        resource_id = resource_ids[waldur_offering["uuid"]]
+        if resource_id is None:
+            continue
+        eosc_offers = marketplace_utils.get_offer_list_of_resource(resource_id)
+        eosc_offer_ids = {offer["name"]: offer["id"] for offer in eosc_offers["offers"]}
+        for plan in waldur_offering["plans"]:
+            if plan["name"] in eosc_offer_ids:
+                state_store.set_offer_id(plan["uuid"], eosc_offer_ids[plan["name"]])
+
+    logger.info("The state store is rebuilt: %s", state_store.get_stats())
+
+
+def run_cycle(scheduler):
+    report = None
+    scheduler.start_cycle()
+    try:
+        with metrics_utils.CYCLE_SECONDS.time(), trace_utils.trace(
+            "sync_cycle", engine="threads"
+        ), trace_utils.profiled_cycle():
+            report = process_offers()
+    except Exception as e:
+        logger.exception(
+            "The application crashed due to the following exception: %s", e
+        )
+    scheduler.finish_cycle(report)
+
+
+def run_retries(scheduler, due):
+    logger.info("Syncing %s failed or changed customers", len(due))
+    with trace_utils.trace("customer_retries", engine="threads"):
+        results = sync_customers(list(due))
+    scheduler.finish_retries(due, results)
+
+
+def log_stats():
+    logger.info(
+        "Access token stats: %s", aai_utils.get_access_token_manager().get_stats()
+    )
+    logger.info("Static lookup cache stats: %s", cache_utils.static_lookups.get_stats())
+    logger.info(
+        "Parameter schema cache stats: %s",
+        cache_utils.parameter_schemas.get_stats(),
+    )
+    logger.info("Rate limit stats: %s", rate_limit_utils.get_rate_limit_stats())
+    logger.info("Circuit stats: %s", circuit_breaker_utils.get_circuit_stats())
+    http_utils.log_connection_stats()
+    logger.info("/" * 20)
 
 
 def sync_offers():
+    scheduler = scheduler_utils.Scheduler()
+    webhook_utils.start_webhook_server(scheduler)
     while True:
-        try:
-            process_offers()
-        except Exception as e:
-            logger.exception(
-                "The application crashed due to the following exception: %s", e
-            )
-        logger.info("/" * 20)
-        sleep(60 * 10)
+        scheduler.wait(scheduler.get_delay())
+        with scheduler.run_lock:
+            if scheduler.is_cycle_due():
+                run_cycle(scheduler)
+                log_stats()
+            else:
+                due = scheduler.pop_due_retries()
+                if due:
+                    run_retries(scheduler, due)
+
+
+def invalidate_static_lookups(signum, frame):
+    logger.info("Invalidating the static lookup cache")
+    cache_utils.static_lookups.invalidate()
+
+
+def main():
+    try:
+        settings.validate()
+    except MissingSettingError as e:
+        logger.error(e)
+        sys.exit(1)
+    signal.signal(signal.SIGHUP, invalidate_static_lookups)
+    signal.signal(signal.SIGUSR1, trace_utils.request_profile)
+    if sys.argv[1:] == ["rebuild-state"]:
+        rebuild_state()
+        return
+    metrics_utils.start_metrics_server()
+    if settings.EOSC_SYNC_ENGINE == "async":
+        # aiohttp is imported only when the async engine is used
+        from eosc_publisher import async_app
+
+        async_app.run()
+    else:
+        sync_offers()
 
 
 if __name__ == "__main__":
-    sync_offers()
+    main()
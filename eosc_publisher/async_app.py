@@ -0,0 +1,1014 @@
+import asyncio
+import json
+import urllib.parse
+from datetime import datetime, timezone
+
+import aiohttp
+from requests.status_codes import codes as http_codes
+from requests.utils import parse_header_links
+
+from . import (
+    CATALOGUE_PROVIDERS_URL,
+    CATALOGUE_SERVICES_URL,
+    OFFER_LIST_URL,
+    OFFER_URL,
+    aai_utils,
+    app,
+    cache_utils,
+    circuit_breaker_utils,
+    http_utils,
+    log_utils,
+    logger,
+    marketplace_utils,
+    metrics_utils,
+    provider_utils,
+    rate_limit_utils,
+    scheduler_utils,
+    settings,
+    shard_utils,
+    state_utils,
+    trace_utils,
+    waldur_utils,
+    webhook_utils,
+)
+
+WALDUR = http_utils.WALDUR
+
+
+class AsyncResponse:
+    """The parts of an aiohttp response which are read by the engine after the connection is released."""
+
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+async def gather_limited(limit, coroutines):
+    """
+    Awaits the coroutines with at most limit of them running at once and returns their results in order.
+    The limits are the worker settings of the threads engine, so both engines run the same number of tasks.
+    """
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[run(coroutine) for coroutine in coroutines])
+
+
+class AsyncAccessTokenManager(aai_utils.AccessTokenManager):
+    """Refreshes the access token through the publisher, the callers await a refresh in progress."""
+
+    def __init__(self, publisher, expiry_margin=None):
+        super().__init__(expiry_margin)
+        self.publisher = publisher
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self):
+        response = await self.publisher.request(
+            http_utils.AAI,
+            "post",
+            settings.EOSC_AAI_REFRESH_TOKEN_URL,
+            data=aai_utils.get_refresh_data(),
+        )
+        return self._store_token(response)
+
+    async def get_token(self):
+        async with self._lock:
+            if self._is_valid():
+                self.hits += 1
+                return self._token
+            return await self._refresh()
+
+    async def invalidate(self):
+        async with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+
+class AsyncPublisher:
+    """
+    Keeps one aiohttp session per upstream and limits the number of requests in flight.
+    It implements the same calls as provider_utils, marketplace_utils and WaldurClient.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = (
+            settings.EOSC_ASYNC_CONCURRENCY if concurrency is None else concurrency
+        )
+        self.sessions = {}
+        self.semaphore = None
+        self.token_manager = None
+        self._lookup_futures = {}
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.token_manager = AsyncAccessTokenManager(self)
+        for upstream in http_utils.UPSTREAMS:
+            self.sessions[upstream] = self._build_session(
+                http_utils.get_default_headers(upstream),
+                # The Waldur client setting applies to the Waldur session of both engines
+                verify_ssl=upstream != WALDUR or waldur_utils.verify_ssl,
+            )
+        return self
+
+    async def __aexit__(self, *args):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    def _build_session(self, headers, verify_ssl=True):
+        connector_options = {}
+        if not verify_ssl:
+            connector_options["ssl"] = False
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            force_close=not settings.EOSC_HTTP_KEEP_ALIVE,
+            **connector_options,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=settings.EOSC_HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.EOSC_HTTP_READ_TIMEOUT,
+        )
+        return aiohttp.ClientSession(
+            connector=connector, headers=headers, timeout=timeout
+        )
+
+    async def _send(self, upstream, method, url, **kwargs):
+        async with self.semaphore:
+            async with self.sessions[upstream].request(
+                method, url, **kwargs
+            ) as response:
+                text = await response.text()
+                return AsyncResponse(response.status, text, response.headers)
+
+    async def request(self, upstream, method, url, **kwargs):
+        attempts = http_utils.RequestAttempts(upstream, method, url)
+        while True:
+            delay = attempts.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            attempts.start()
+            try:
+                response = await self._send(upstream, method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                delay = attempts.handle_error(e, is_connection_error=True)
+                if delay is None:
+                    raise
+            except Exception as e:
+                attempts.handle_error(e)
+                raise
+            else:
+                delay = attempts.handle_response(response.status_code, response.headers)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+
+    # Waldur
+
+    async def _waldur_get(self, url, params=None):
+        response = await self.request(WALDUR, "get", url, params=params)
+        if response.status_code != 200:
+            raise Exception(
+                "Unable to fetch %s from Waldur. Code %s, error: %s"
+                % (url, response.status_code, response.text)
+            )
+        return response
+
+    async def _waldur_pages(self, endpoint, filters=None):
+        params = {"page_size": 200}
+        params.update(filters or {})
+        url = urllib.parse.urljoin(settings.WALDUR_API_URL, endpoint + "/")
+        while url:
+            response = await self._waldur_get(url, params)
+            yield response.json()
+            next_links = [
+                link["url"]
+                for link in parse_header_links(response.headers.get("Link", ""))
+                if link.get("rel") == "next"
+            ]
+            # The next page URL already contains the query
+            url = next_links[0] if next_links else None
+            params = None
+
+    async def _waldur_list(self, endpoint, filters=None):
+        result = []
+        async for page in self._waldur_pages(endpoint, filters):
+            result += page
+        return result
+
+    async def list_marketplace_provider_offerings(self, filters=None):
+        return [
+            waldur_utils.OfferingRecord(waldur_offering)
+            async for page in self._waldur_pages(
+                "marketplace-provider-offerings", filters
+            )
+            for waldur_offering in page
+        ]
+
+    async def list_customers(self, filters=None):
+        return await self._waldur_list("customers", filters)
+
+    async def list_service_providers(self, filters=None):
+        return await self._waldur_list("marketplace-service-providers", filters)
+
+    async def get_customer(self, customer_uuid):
+        response = await self._waldur_get(
+            urllib.parse.urljoin(settings.WALDUR_API_URL, f"customers/{customer_uuid}/")
+        )
+        return response.json()
+
+    async def _get_or_load(self, key, load):
+        value = cache_utils.static_lookups.get(key)
+        if value is not None:
+            return value
+        # The tasks missing the same key wait for a single request
+        future = self._lookup_futures.get(key)
+        if future is None:
+            future = asyncio.ensure_future(load())
+            self._lookup_futures[key] = future
+            future.add_done_callback(lambda _: self._lookup_futures.pop(key, None))
+            value = await future
+            cache_utils.static_lookups.set(key, value)
+            return value
+        return await future
+
+    async def _fetch_service_provider(self, customer_uuid):
+        service_providers = await self._waldur_list(
+            "marketplace-service-providers", {"customer_uuid": customer_uuid}
+        )
+        return service_providers[0]
+
+    async def get_service_provider(self, customer_uuid):
+        return await self._get_or_load(
+            ("service_provider", customer_uuid),
+            lambda: self._fetch_service_provider(customer_uuid),
+        )
+
+    async def _fetch_configuration(self):
+        response = await self._waldur_get(
+            urllib.parse.urljoin(settings.WALDUR_API_URL, "configuration/")
+        )
+        return response.json()
+
+    async def get_homeport_url(self):
+        configuration = await self._get_or_load(
+            "configuration", self._fetch_configuration
+        )
+        return configuration["WALDUR_CORE"]["HOMEPORT_URL"]
+
+    # Provider portal
+
+    async def provider_portal_request(self, method, url, **kwargs):
+        token = await self.token_manager.get_token()
+        if not token:
+            raise Exception("Unable to get an access token for the Provider portal")
+        headers = {"Authorization": token}
+        return await self.request(
+            http_utils.PROVIDER_PORTAL,
+            method,
+            urllib.parse.urljoin(settings.EOSC_PROVIDER_PORTAL_BASE_URL, url),
+            headers=headers,
+            **kwargs,
+        )
+
+    async def get_catalogue_page(self, url, offset, quantity):
+        response = await self.provider_portal_request(
+            "get",
+            url,
+            params={
+                "catalogue_id": settings.EOSC_CATALOGUE_ID,
+                "from": offset,
+                "quantity": quantity,
+            },
+        )
+        if response.status_code != 200:
+            raise provider_utils.CatalogueFetchError(
+                f"Failed to get list of {url} with code {response.status_code}. Message: {response.text}"
+            )
+        return response.json()
+
+    async def get_catalogue_items(self, url, page_size=None):
+        page_size = page_size or settings.EOSC_CATALOGUE_PAGE_SIZE
+        first_page = await self.get_catalogue_page(url, 0, page_size)
+        offsets, page_size = provider_utils.get_page_offsets(first_page, page_size)
+        pages = await gather_limited(
+            settings.EOSC_CATALOGUE_FETCH_WORKERS,
+            [self.get_catalogue_page(url, offset, page_size) for offset in offsets],
+        )
+        items = first_page["results"]
+        for page in pages:
+            items += page["results"]
+        provider_utils.check_fetched_count(url, len(items), first_page["total"])
+        return items
+
+    async def fetch_all_resources_from_eosc_catalogue(self):
+        token = await self.token_manager.get_token()
+        if not token:
+            return None
+        logger.info(
+            "Fetching all resources for catalogue %s", settings.EOSC_CATALOGUE_ID
+        )
+        try:
+            resource_list = await self.get_catalogue_items(CATALOGUE_SERVICES_URL)
+        except provider_utils.CatalogueFetchError as e:
+            logger.error(e)
+            return []
+        logger.info("Fetched %s resources", len(resource_list))
+        return {resource["name"]: resource["id"] for resource in resource_list}
+
+    async def fetch_all_providers_from_eosc_catalogue(self):
+        token = await self.token_manager.get_token()
+        if not token:
+            return None
+        logger.info(
+            "Fetching all providers for catalogue %s", settings.EOSC_CATALOGUE_ID
+        )
+        try:
+            provider_list = await self.get_catalogue_items(CATALOGUE_PROVIDERS_URL)
+        except provider_utils.CatalogueFetchError as e:
+            logger.error(e)
+            return None
+        logger.info("Fetched %s providers", len(provider_list))
+        return {provider["id"]: provider for provider in provider_list}
+
+    async def get_eosc_provider(self, waldur_customer):
+        provider_id = provider_utils.get_provider_id(waldur_customer)
+        logger.info("Fetching provider [id=%s] data.", provider_id)
+        response = await self.provider_portal_request(
+            "get", f"{settings.PROVIDER_URL}{provider_id}"
+        )
+        if response.status_code == http_codes.NOT_FOUND:
+            logger.info("The provider is not found")
+            return
+        if response.status_code == http_codes.OK:
+            provider_json = response.json()
+            logger.info("Existing provider name: %s", provider_json["name"])
+            return provider_json
+        raise Exception(
+            "Unable to get a provider. Code %s, error: %s"
+            % (response.status_code, response.text)
+        )
+
+    async def sync_eosc_provider(
+        self, waldur_customer, existing_provider, service_provider=None
+    ):
+        logger.info(
+            "Syncing customer %s (provider %s)",
+            waldur_customer["name"],
+            provider_utils.get_provider_id(waldur_customer),
+        )
+        if service_provider is None:
+            homeport_url, service_provider = await asyncio.gather(
+                self.get_homeport_url(),
+                self.get_service_provider(waldur_customer["uuid"]),
+            )
+        else:
+            homeport_url = await self.get_homeport_url()
+
+        if existing_provider is None:
+            logger.info("Creating a provider for customer %s", waldur_customer["name"])
+            provider_payload = provider_utils.construct_provider_payload(
+                waldur_customer,
+                homeport_url=homeport_url,
+                service_provider=service_provider,
+            )
+            response = await self.provider_portal_request(
+                "post", settings.PROVIDER_URL, json=provider_payload
+            )
+            if response.status_code not in [http_codes.OK, http_codes.CREATED]:
+                raise Exception(
+                    "Unable to create a new provider. Code %s, error: %s"
+                    % (response.status_code, response.text)
+                )
+            provider = response.json()
+            logger.info(
+                "The provider %s has been successfully created", provider["name"]
+            )
+            provider_utils.remember_created_provider(provider_payload, provider)
+            return provider
+
+        provider_id = existing_provider["id"]
+        provider_payload = provider_utils.construct_provider_payload(
+            waldur_customer,
+            provider_id,
+            existing_provider["users"],
+            homeport_url=homeport_url,
+            service_provider=service_provider,
+        )
+        if cache_utils.pushed_payloads.is_unchanged(
+            cache_utils.PROVIDER, provider_id, provider_payload
+        ):
+            logger.info(
+                "The provider has not changed since the last update, skipping it"
+            )
+            metrics_utils.count_change(metrics_utils.PROVIDER, metrics_utils.SKIP)
+            return existing_provider
+
+        metrics_utils.count_change(metrics_utils.PROVIDER, metrics_utils.UPDATE)
+        logger.info("Updating the provider")
+        response = await self.provider_portal_request(
+            "put", settings.PROVIDER_URL, json=provider_payload
+        )
+        if response.status_code not in [http_codes.OK, http_codes.CREATED]:
+            logger.warning(
+                "Unable to update the provider (id=%s). Code %s, error: %s",
+                existing_provider["id"],
+                response.status_code,
+                response.text,
+            )
+            return existing_provider
+        try:
+            provider = response.json()
+        except json.JSONDecodeError:
+            logger.info(f"Didn't update: {response.status_code}, {response.text}")
+            cache_utils.pushed_payloads.remember(
+                cache_utils.PROVIDER, provider_id, provider_payload
+            )
+            return existing_provider
+        logger.info("The provider %s has been successfully updated", provider["name"])
+        cache_utils.pushed_payloads.remember(
+            cache_utils.PROVIDER, provider_id, provider_payload
+        )
+        return provider
+
+    async def create_eosc_resource(self, waldur_offering, provider_id):
+        logger.info("The resource is missing, creating a new one.")
+        logger.info(
+            "Creating a resource %s for provider %s",
+            waldur_offering["name"],
+            provider_id,
+        )
+        resource_payload = provider_utils.construct_resource_payload(
+            waldur_offering, provider_id, homeport_url=await self.get_homeport_url()
+        )
+        response = await self.provider_portal_request(
+            "post", settings.PROVIDER_RESOURCE_URL, json=resource_payload
+        )
+        if response.status_code not in [200, 201]:
+            raise Exception(
+                "Error creating resource in Providers portal. Code %s, error: %s"
+                % (response.status_code, response.text),
+            )
+        logger.info(
+            "The resource %s has been successfully created", waldur_offering["name"]
+        )
+        resource = response.json()
+        provider_utils.remember_created_resource(resource_payload, resource)
+        return resource
+
+    async def update_eosc_resource(self, waldur_offering, provider_id, resource_id):
+        logger.info("Resource already exists in EOSC: %s", waldur_offering["name"])
+        resource_payload = provider_utils.construct_resource_payload(
+            waldur_offering,
+            provider_id,
+            resource_id,
+            homeport_url=await self.get_homeport_url(),
+        )
+        if cache_utils.pushed_payloads.is_unchanged(
+            cache_utils.RESOURCE, resource_id, resource_payload
+        ):
+            logger.info(
+                "The resource has not changed since the last update, skipping it"
+            )
+            metrics_utils.count_change(metrics_utils.RESOURCE, metrics_utils.SKIP)
+            return resource_payload
+
+        metrics_utils.count_change(metrics_utils.RESOURCE, metrics_utils.UPDATE)
+
+        logger.info("Updating resource %s for provider %s", resource_id, provider_id)
+        # The existing resource is fetched before the update, as provider_utils does
+        existing_response = await self.provider_portal_request(
+            "get", settings.PROVIDER_RESOURCE_URL + resource_id
+        )
+        existing_resource = existing_response.json()
+        response = await self.provider_portal_request(
+            "put", settings.PROVIDER_RESOURCE_URL, json=resource_payload
+        )
+        if response.status_code not in [200, 201]:
+            logger.warning(
+                "Error during updating of resource in the provider portal. Code %s, error: %s",
+                response.status_code,
+                response.text,
+            )
+            return existing_resource
+        try:
+            resource = response.json()
+        except json.JSONDecodeError as err:
+            if "There are no changes in the Service" in response.text:
+                cache_utils.pushed_payloads.remember(
+                    cache_utils.RESOURCE, resource_id, resource_payload
+                )
+            else:
+                logger.error("Error parsing %s", response.text)
+                logger.exception(err)
+            return existing_resource
+        logger.info("The resource %s has been successfully updated", resource["name"])
+        cache_utils.pushed_payloads.remember(
+            cache_utils.RESOURCE, resource_id, resource_payload
+        )
+        return resource
+
+    async def delete_eosc_resource(self, resource_id):
+        logger.info("Resource %s is found, removing it from the portal", resource_id)
+        logger.info("Deleting the resource %s", resource_id)
+        response = await self.provider_portal_request(
+            "delete", settings.PROVIDER_RESOURCE_URL + resource_id
+        )
+        if response.status_code not in [http_codes.OK, http_codes.NO_CONTENT]:
+            logger.error(
+                "Unable to delete resource. Code: %s, details: %s",
+                response.status_code,
+                response.text,
+            )
+            return
+        logger.info("The resource has been successfully removed from the catalogue")
+        cache_utils.pushed_payloads.forget(cache_utils.RESOURCE, resource_id)
+        return response.json()
+
+    # Marketplace
+
+    async def marketplace_offer_request(self, method, url, **kwargs):
+        return await self.request(
+            http_utils.MARKETPLACE,
+            method,
+            urllib.parse.urljoin(settings.EOSC_MARKETPLACE_BASE_URL, url),
+            **kwargs,
+        )
+
+    async def apply_offer_change(self, eosc_resource_id, change):
+        # Every change is a single call, so the calls of marketplace_utils.apply_offer_change are inlined
+        action, plan, eosc_offer, offer_payload = change
+        if action == marketplace_utils.CREATE_OFFER:
+            method = "post"
+            url = OFFER_LIST_URL % eosc_resource_id
+            ok_codes = [http_codes.CREATED]
+        elif action == marketplace_utils.UPDATE_OFFER:
+            method = "patch"
+            url = OFFER_URL % (eosc_resource_id, eosc_offer["id"])
+            ok_codes = [http_codes.OK]
+        else:
+            method = "delete"
+            url = OFFER_URL % (eosc_resource_id, eosc_offer["id"])
+            ok_codes = [http_codes.OK, http_codes.NO_CONTENT]
+
+        kwargs = {}
+        if offer_payload is not None:
+            kwargs = {
+                "headers": {"Content-Type": "application/json"},
+                "data": json.dumps(offer_payload),
+            }
+        response = await self.marketplace_offer_request(method, url, **kwargs)
+        if response.status_code not in ok_codes:
+            logger.error(
+                "Failed to %s an offer of %s. Code %s, error: %s",
+                action,
+                eosc_resource_id,
+                response.status_code,
+                response.text,
+            )
+            return False
+        logger.info("Offer change %s for %s is applied.", action, eosc_resource_id)
+        if action == marketplace_utils.CREATE_OFFER:
+            state_utils.get_state_store().set_offer_id(
+                plan["uuid"], response.json()["id"]
+            )
+        return True
+
+    async def sync_marketplace_offer(self, waldur_offering, provider_resource):
+        eosc_resource_id = str(provider_resource["id"])
+        response = await self.marketplace_offer_request(
+            "get", OFFER_LIST_URL % eosc_resource_id
+        )
+        if response.status_code != http_codes.OK:
+            # The offering fails as with the threads engine, so that the customer is retried
+            raise Exception(
+                "Unable to fetch offers for the resource [%s]. Code %s, details: %s"
+                % (eosc_resource_id, response.status_code, response.text)
+            )
+
+        changes = marketplace_utils.get_offer_changes(
+            response.json()["offers"], waldur_offering
+        )
+        results = await gather_limited(
+            settings.EOSC_OFFER_WORKERS,
+            [self.apply_offer_change(eosc_resource_id, change) for change in changes],
+        )
+        report = marketplace_utils.get_reconciliation_report(changes, results)
+        metrics_utils.count_offer_changes(report)
+        logger.info(
+            "Offers of the resource %s are reconciled: %s", eosc_resource_id, report
+        )
+        return report
+
+
+async def process_offering(publisher, waldur_offering, provider_id, resource_ids):
+    logger.info(
+        "Syncing offering %s from %s",
+        waldur_offering["name"],
+        waldur_offering["customer_name"],
+    )
+
+    action, resource_id = app.get_resource_action(waldur_offering, resource_ids)
+    # An update is counted once it is known whether the unchanged payload is skipped
+    if action != app.UPDATE_RESOURCE:
+        metrics_utils.count_change(metrics_utils.RESOURCE, action)
+    if action in [app.CREATE_RESOURCE, app.UPDATE_RESOURCE]:
+        logger.info("Syncing resource for offering %s", waldur_offering["name"])
+        with trace_utils.span("resource_sync", action=action):
+            if action == app.UPDATE_RESOURCE:
+                provider_resource = await publisher.update_eosc_resource(
+                    waldur_offering, provider_id, resource_id
+                )
+            else:
+                provider_resource = await publisher.create_eosc_resource(
+                    waldur_offering, provider_id
+                )
+                state_utils.get_state_store().set_resource_id(
+                    waldur_offering["uuid"], provider_resource["id"]
+                )
+        with trace_utils.span("offer_sync"):
+            await publisher.sync_marketplace_offer(waldur_offering, provider_resource)
+    elif action == app.DELETE_RESOURCE:
+        with trace_utils.span("resource_sync", action=action):
+            if await publisher.delete_eosc_resource(resource_id) is not None:
+                state_utils.get_state_store().set_resource_id(
+                    waldur_offering["uuid"], None
+                )
+        marketplace_utils.deactivate_offer(waldur_offering)
+    elif waldur_offering["state"] in app.INACTIVE_OFFERING_STATES:
+        logger.info("The resource is missing, skipping deletion.")
+    logger.info("." * 20)
+
+
+async def process_offering_with_collected_logs(
+    publisher, waldur_offering, provider_id, resource_ids
+):
+    records = []
+    with log_utils.collected_logs(records):
+        try:
+            # The decorators of app.process_offering do not work for coroutines
+            with metrics_utils.OFFERING_SYNC_SECONDS.time(), trace_utils.span(
+                "offering", uuid=waldur_offering["uuid"]
+            ):
+                await process_offering(
+                    publisher, waldur_offering, provider_id, resource_ids
+                )
+        except Exception as e:
+            logger.exception(
+                "The offering %s [uuid=%s] can not be processed due to the following exception: %s",
+                waldur_offering["name"],
+                waldur_offering["uuid"],
+                e,
+            )
+            return records, False
+    return records, True
+
+
+async def get_existing_provider(
+    publisher, waldur_customer, waldur_customer_offerings, eosc_providers
+):
+    # The asyncio counterpart of app.get_existing_provider
+    if eosc_providers is None:
+        return await publisher.get_eosc_provider(waldur_customer)
+    provider_id = provider_utils.get_provider_id(waldur_customer)
+    existing_provider = eosc_providers.get(provider_id)
+    if existing_provider is None and not app.is_customer_skipped(
+        None, waldur_customer_offerings
+    ):
+        existing_provider = await publisher.get_eosc_provider(waldur_customer)
+    return existing_provider
+
+
+async def process_customer(
+    publisher,
+    customer_uuid,
+    waldur_customer_offerings,
+    resource_ids,
+    waldur_index,
+    eosc_providers,
+):
+    try:
+        logger.info(
+            "Processing customer %s [uuid=%s]",
+            waldur_customer_offerings[0]["customer_name"],
+            customer_uuid,
+        )
+        waldur_customer = waldur_index.get_customer(
+            customer_uuid
+        ) or await publisher.get_customer(customer_uuid)
+
+        with trace_utils.span("provider_lookup"):
+            existing_provider = await get_existing_provider(
+                publisher, waldur_customer, waldur_customer_offerings, eosc_providers
+            )
+        if app.is_customer_skipped(existing_provider, waldur_customer_offerings):
+            logger.info(
+                "The provider does not exist and all the offerings are inactive. Skipping the customer."
+            )
+            metrics_utils.count_change(metrics_utils.PROVIDER, app.SKIP_RESOURCE)
+            logger.info("-" * 20)
+            return True
+
+        if existing_provider is None:
+            metrics_utils.count_change(metrics_utils.PROVIDER, app.CREATE_RESOURCE)
+        with trace_utils.span("provider_sync"):
+            provider = await publisher.sync_eosc_provider(
+                waldur_customer,
+                existing_provider,
+                waldur_index.get_service_provider(customer_uuid),
+            )
+        logger.info(
+            "Syncing %s offerings of the provider", len(waldur_customer_offerings)
+        )
+        provider_id = provider["id"]
+        state_utils.get_state_store().set_provider_id(customer_uuid, provider_id)
+
+        results = await gather_limited(
+            settings.EOSC_OFFERING_WORKERS,
+            [
+                process_offering_with_collected_logs(
+                    publisher, waldur_offering, provider_id, resource_ids
+                )
+                for waldur_offering in waldur_customer_offerings
+            ],
+        )
+        failed_count = 0
+        for records, succeeded in results:
+            log_utils.emit_records(records)
+            if not succeeded:
+                failed_count += 1
+        if failed_count:
+            raise Exception(
+                "%s of %s offerings have not been synced"
+                % (failed_count, len(waldur_customer_offerings))
+            )
+    except Exception as e:
+        logger.exception(
+            "The customer [uuid=%s] and its offerings can not be processed due to the following exception: %s",
+            customer_uuid,
+            e,
+        )
+        logger.info("-" * 20)
+        return False
+    logger.info("-" * 20)
+    return True
+
+
+async def process_customer_with_buffered_logs(
+    publisher,
+    customer_uuid,
+    waldur_customer_offerings,
+    resource_ids,
+    waldur_index,
+    eosc_providers,
+):
+    with log_utils.buffered_logs(), metrics_utils.CUSTOMER_SYNC_SECONDS.time():
+        with trace_utils.span("customer", uuid=customer_uuid):
+            return await process_customer(
+                publisher,
+                customer_uuid,
+                waldur_customer_offerings,
+                resource_ids,
+                waldur_index,
+                eosc_providers,
+            )
+
+
+async def list_modified_offerings(publisher, sync_mark):
+    modified_offerings, modified_customers = await asyncio.gather(
+        publisher.list_marketplace_provider_offerings({"modified": sync_mark}),
+        publisher.list_customers({"modified": sync_mark}),
+    )
+    modified_customers = shard_utils.filter_customers(modified_customers)
+    customer_offerings = await asyncio.gather(
+        *[
+            publisher.list_marketplace_provider_offerings(
+                {"customer_uuid": waldur_customer["uuid"]}
+            )
+            for waldur_customer in modified_customers
+        ]
+    )
+    logger.info(
+        "%s offerings and %s customers have been modified since %s",
+        len(modified_offerings),
+        len(modified_customers),
+        sync_mark,
+    )
+    return app.merge_offerings(modified_offerings, *customer_offerings)
+
+
+async def prefetch_waldur_index(publisher, customer_uuids):
+    if len(customer_uuids) < waldur_utils.PREFETCH_MIN_CUSTOMERS:
+        return waldur_utils.WaldurIndex()
+    customers, service_providers = await asyncio.gather(
+        publisher.list_customers(), publisher.list_service_providers()
+    )
+    logger.info(
+        "Prefetched %s customers and %s service providers",
+        len(customers),
+        len(service_providers),
+    )
+    return waldur_utils.build_index(customer_uuids, customers, service_providers)
+
+
+async def get_resource_ids(publisher, waldur_offerings):
+    # The asyncio counterpart of app.get_resource_ids
+    resource_ids = state_utils.get_state_store().get_resource_ids(
+        [waldur_offering["uuid"] for waldur_offering in waldur_offerings]
+    )
+    unknown_offerings = app.find_unknown_offerings(waldur_offerings, resource_ids)
+    if not unknown_offerings:
+        return resource_ids
+    logger.info(
+        "%s offerings are unknown to the state store, looking them up in the catalogue",
+        len(unknown_offerings),
+    )
+    with trace_utils.span("catalogue_resources_fetch"):
+        eosc_resources = await publisher.fetch_all_resources_from_eosc_catalogue()
+    if not eosc_resources:
+        return None
+    app.match_offerings_by_name(unknown_offerings, eosc_resources, resource_ids)
+    return resource_ids
+
+
+async def process_customers(
+    publisher, customer_to_offerings_mapping, resource_ids, waldur_index, eosc_providers
+):
+    logger.info(
+        "Processing %s customers by %s workers with up to %s concurrent requests",
+        len(customer_to_offerings_mapping),
+        settings.EOSC_CUSTOMER_WORKERS,
+        publisher.concurrency,
+    )
+    results = await gather_limited(
+        settings.EOSC_CUSTOMER_WORKERS,
+        [
+            process_customer_with_buffered_logs(
+                publisher,
+                customer_uuid,
+                waldur_customer_offerings,
+                resource_ids,
+                waldur_index,
+                eosc_providers,
+            )
+            for (
+                customer_uuid,
+                waldur_customer_offerings,
+            ) in customer_to_offerings_mapping.items()
+        ],
+    )
+    return dict(zip(customer_to_offerings_mapping, results))
+
+
+async def process_offers(publisher):
+    started_at = datetime.now(timezone.utc)
+    sync_mark = app.get_sync_mark(started_at)
+    with trace_utils.span("waldur_offerings_fetch", incremental=sync_mark is not None):
+        if sync_mark is None:
+            logger.info("Syncing all the offerings")
+            waldur_offerings = await publisher.list_marketplace_provider_offerings()
+        else:
+            waldur_offerings = await list_modified_offerings(publisher, sync_mark)
+    waldur_offerings = shard_utils.filter_offerings(waldur_offerings)
+
+    if len(waldur_offerings) == 0:
+        logger.info("There are no offerings ready for sync with EOSC portal.")
+
+    customer_to_offerings_mapping = app.group_offerings_by_customer(waldur_offerings)
+
+    resource_ids = await get_resource_ids(publisher, waldur_offerings)
+    if resource_ids is None:
+        return None
+
+    waldur_index, eosc_providers = waldur_utils.WaldurIndex(), None
+    if len(customer_to_offerings_mapping) >= waldur_utils.PREFETCH_MIN_CUSTOMERS:
+        waldur_index, eosc_providers = await asyncio.gather(
+            trace_utils.in_span(
+                "waldur_index_fetch",
+                prefetch_waldur_index(publisher, list(customer_to_offerings_mapping)),
+            ),
+            trace_utils.in_span(
+                "catalogue_providers_fetch",
+                publisher.fetch_all_providers_from_eosc_catalogue(),
+            ),
+        )
+
+    results = await process_customers(
+        publisher,
+        customer_to_offerings_mapping,
+        resource_ids,
+        waldur_index,
+        eosc_providers,
+    )
+
+    logger.info("Waldur index stats: %s", waldur_index.get_stats())
+
+    # The modified objects of the failed customers are synced again by the next pass
+    if all(results.values()):
+        app.save_sync_mark(started_at, is_full_sync=sync_mark is None)
+    return app.get_report(waldur_offerings, results)
+
+
+async def sync_customers(publisher, customer_uuids):
+    # The asyncio counterpart of app.sync_customers
+    results = {customer_uuid: False for customer_uuid in customer_uuids}
+    try:
+        customer_offerings = await asyncio.gather(
+            *[
+                publisher.list_marketplace_provider_offerings(
+                    {"customer_uuid": customer_uuid}
+                )
+                for customer_uuid in customer_uuids
+            ]
+        )
+        waldur_offerings = app.merge_offerings(*customer_offerings)
+        resource_ids = await get_resource_ids(publisher, waldur_offerings)
+    except Exception as e:
+        logger.exception("The customers can not be synced: %s", e)
+        return results
+    if resource_ids is None:
+        return results
+
+    customer_to_offerings_mapping = app.group_offerings_by_customer(waldur_offerings)
+    for customer_uuid in customer_uuids:
+        if customer_uuid not in customer_to_offerings_mapping:
+            results[customer_uuid] = True
+    results.update(
+        await process_customers(
+            publisher,
+            customer_to_offerings_mapping,
+            resource_ids,
+            waldur_utils.WaldurIndex(),
+            None,
+        )
+    )
+    return results
+
+
+async def run_cycle(publisher, scheduler):
+    report = None
+    scheduler.start_cycle()
+    try:
+        with metrics_utils.CYCLE_SECONDS.time(), trace_utils.trace(
+            "sync_cycle", engine="async"
+        ), trace_utils.profiled_cycle():
+            report = await process_offers(publisher)
+    except Exception as e:
+        logger.exception(
+            "The application crashed due to the following exception: %s", e
+        )
+    scheduler.finish_cycle(report)
+
+
+async def run_retries(publisher, scheduler, due):
+    logger.info("Syncing %s failed or changed customers", len(due))
+    with trace_utils.trace("customer_retries", engine="async"):
+        results = await sync_customers(publisher, list(due))
+    scheduler.finish_retries(due, results)
+
+
+def log_stats(publisher):
+    logger.info("Access token stats: %s", publisher.token_manager.get_stats())
+    logger.info("Static lookup cache stats: %s", cache_utils.static_lookups.get_stats())
+    logger.info(
+        "Parameter schema cache stats: %s",
+        cache_utils.parameter_schemas.get_stats(),
+    )
+    logger.info("Rate limit stats: %s", rate_limit_utils.get_rate_limit_stats())
+    logger.info("Circuit stats: %s", circuit_breaker_utils.get_circuit_stats())
+    logger.info("/" * 20)
+
+
+async def sync_offers():
+    scheduler = scheduler_utils.Scheduler()
+    # The change notifications arrive on the thread of the webhook listener
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    scheduler.wakeup_callbacks.append(lambda: loop.call_soon_threadsafe(wakeup.set))
+    webhook_utils.start_webhook_server(scheduler)
+    async with AsyncPublisher() as publisher:
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), scheduler.get_delay())
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            # The cycles and the retries run one after another on the event loop, so they never overlap
+            if scheduler.is_cycle_due():
+                await run_cycle(publisher, scheduler)
+                log_stats(publisher)
+            else:
+                due = scheduler.pop_due_retries()
+                if due:
+                    await run_retries(publisher, scheduler, due)
+
+
+def run():
+    # The metrics server is started by app.main for both engines
+    asyncio.run(sync_offers())
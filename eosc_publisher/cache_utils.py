@@ -0,0 +1,140 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from . import settings
+
+PROVIDER = "provider"
+RESOURCE = "resource"
+# Max number of parameter schemas kept, enough for the offerings of a large Waldur
+PARAMETER_SCHEMA_CACHE_SIZE = 1024
+
+
+def get_payload_hash(payload):
+    canonical_payload = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical_payload.encode()).hexdigest()
+
+
+class PushedPayloads:
+    """
+    Keeps hashes of the payloads last pushed to the Provider portal.
+    A hash expires after the TTL, so the objects changed directly in the portal are eventually overwritten.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self.skipped = 0
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        # The default TTL is read on first use, so the module level instances need no environment
+        return settings.EOSC_PAYLOAD_HASH_TTL if self._ttl is None else self._ttl
+
+    def is_unchanged(self, kind, object_id, payload):
+        with self._lock:
+            pushed = self._hashes.get((kind, object_id))
+            if pushed is None:
+                return False
+            payload_hash, pushed_at = pushed
+            if time.monotonic() - pushed_at > self.ttl:
+                return False
+            if payload_hash != get_payload_hash(payload):
+                return False
+            self.skipped += 1
+            return True
+
+    def remember(self, kind, object_id, payload):
+        payload_hash = get_payload_hash(payload)
+        with self._lock:
+            self._hashes[(kind, object_id)] = (payload_hash, time.monotonic())
+
+    def forget(self, kind, object_id):
+        with self._lock:
+            self._hashes.pop((kind, object_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
+
+
+class TTLCache:
+    """
+    Keeps the results of the lookups of Waldur data which is effectively static, e.g. the configuration.
+    A result expires after the TTL, all the results can be invalidated at once.
+    With a max size the least recently used result is evicted when a new one does not fit.
+    """
+
+    def __init__(self, ttl=None, maxsize=None):
+        self._ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return settings.EOSC_STATIC_LOOKUP_TTL if self._ttl is None else self._ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and time.monotonic() - cached[1] <= self.ttl:
+                self.hits += 1
+                self._values.move_to_end(key)
+                return cached[0]
+            self.misses += 1
+            self._values.pop(key, None)
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = (value, time.monotonic())
+            self._values.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._values) > self.maxsize:
+                    self._values.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # The threads missing the same key wait for a single load
+        try:
+            with key_lock:
+                with self._lock:
+                    cached = self._values.get(key)
+                if cached is not None and time.monotonic() - cached[1] <= self.ttl:
+                    return cached[0]
+                value = load()
+                self.set(key, value)
+                return value
+        finally:
+            # The waiting threads find the loaded value, so the lock is dropped and the locks do not grow with the keys
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._values)}
+
+
+pushed_payloads = PushedPayloads()
+static_lookups = TTLCache()
+# The offer parameter schemas are cached by a fingerprint of the components, so they never get stale
+parameter_schemas = TTLCache(ttl=math.inf, maxsize=PARAMETER_SCHEMA_CACHE_SIZE)
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import requests
+
+from . import logger, rate_limit_utils, settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request to an upstream which is considered down."""
+
+
+class CircuitBreaker:
+    """
+    Stops the requests to an upstream after repeated failures, so the calls fail fast instead of waiting for timeouts.
+    After the reset timeout a single probe request is let through, the circuit is closed again if it succeeds.
+    A probe which has not been recorded within the reset timeout, e.g. a cancelled one, is replaced by a new one.
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=None,
+        reset_timeout=None,
+    ):
+        self.name = name
+        self.failure_threshold = (
+            settings.EOSC_CIRCUIT_FAILURE_THRESHOLD
+            if failure_threshold is None
+            else failure_threshold
+        )
+        self.reset_timeout = (
+            settings.EOSC_CIRCUIT_RESET_TIMEOUT
+            if reset_timeout is None
+            else reset_timeout
+        )
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                logger.info("Probing %s with a single request", self.name)
+                self.state = HALF_OPEN
+                # The time of the probe, a new one is let through if it is not recorded in time
+                self._opened_at = time.monotonic()
+                return
+            # The circuit is open or the probe request is in flight
+            self.rejected += 1
+        raise CircuitOpenError(f"The circuit of {self.name} is open")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("The circuit of %s is closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(
+                        "The circuit of %s is open after %s failures",
+                        self.name,
+                        self.failures,
+                    )
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def record_status(self, status_code):
+        # The throttling upstream is up, it is slowed down by the rate limiter instead
+        if (
+            status_code >= 500
+            and status_code not in rate_limit_utils.THROTTLING_STATUS_CODES
+        ):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream):
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+def get_circuit_stats():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {upstream: breaker.get_stats() for upstream, breaker in breakers.items()}
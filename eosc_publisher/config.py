@@ -0,0 +1,329 @@
+import os
+import re
+import socket
+from functools import cached_property
+
+TRUE_VALUES = ("true", "yes", "1")
+
+
+class MissingSettingError(Exception):
+    """Raised on the first use of a mandatory setting whose environment variable is missing or empty."""
+
+
+def get_env_or_fail(env_variable_name):
+    # check that required environment variables is set and fail otherwise
+    value = os.environ.get(env_variable_name)
+    if not value:
+        raise MissingSettingError(
+            f"Mandatory variable {env_variable_name} is missing or empty."
+        )
+    return value
+
+
+def get_bool_env(env_variable_name, default):
+    return os.environ.get(env_variable_name, default).lower() in TRUE_VALUES
+
+
+def get_ordinal(hostname):
+    # The pods of a StatefulSet are named after it with the ordinal appended, e.g. eosc-publisher-2
+    match = re.search(r"-(\d+)$", hostname)
+    return match.group(1) if match else None
+
+
+def parse_rates(value):
+    return {
+        upstream.strip(): float(rate)
+        for upstream, rate in (
+            item.split("=") for item in value.split(",") if item.strip()
+        )
+    }
+
+
+class Settings:
+    """
+    The configuration of the publisher, every setting is read from the environment on its first use and kept.
+    Importing the package therefore needs no environment, the mandatory variables are checked by validate().
+    """
+
+    REQUIRED_SETTINGS = (
+        "EOSC_MARKETPLACE_BASE_URL",
+        "EOSC_MARKETPLACE_OFFERING_TOKEN",
+        "EOSC_PROVIDER_PORTAL_BASE_URL",
+        "EOSC_AAI_REFRESH_TOKEN",
+        "EOSC_AAI_CLIENT_ID",
+        "EOSC_AAI_REFRESH_TOKEN_URL",
+        "EOSC_CATALOGUE_ID",
+        "WALDUR_TOKEN",
+        "WALDUR_API_URL",
+        "EOSC_SHARD_INDEX",
+        "EOSC_WEBHOOK_TOKEN",
+    )
+
+    @cached_property
+    def EOSC_MARKETPLACE_BASE_URL(self):
+        return get_env_or_fail("EOSC_URL")  # TODO: Fix env var name
+
+    @cached_property
+    def EOSC_MARKETPLACE_OFFERING_TOKEN(self):
+        return get_env_or_fail("OFFERING_TOKEN")
+
+    @cached_property
+    def EOSC_PROVIDER_PORTAL_BASE_URL(self):
+        return get_env_or_fail("PROVIDERS_PORTAL_URL")
+
+    @cached_property
+    def EOSC_AAI_REFRESH_TOKEN(self):
+        return get_env_or_fail("REFRESH_TOKEN")
+
+    @cached_property
+    def EOSC_AAI_CLIENT_ID(self):
+        return get_env_or_fail("CLIENT_ID")
+
+    @cached_property
+    def EOSC_AAI_REFRESH_TOKEN_URL(self):
+        return get_env_or_fail("REFRESH_TOKEN_URL")
+
+    @cached_property
+    def EOSC_CATALOGUE_ID(self):
+        return get_env_or_fail("EOSC_CATALOGUE_ID")
+
+    @cached_property
+    def WALDUR_TOKEN(self):
+        return get_env_or_fail("WALDUR_TOKEN")
+
+    @cached_property
+    def WALDUR_API_URL(self):
+        return get_env_or_fail("WALDUR_URL")
+
+    # The access token is refreshed when it expires in less than this number of seconds
+    @cached_property
+    def EOSC_AAI_ACCESS_TOKEN_EXPIRY_MARGIN(self):
+        return int(os.environ.get("EOSC_AAI_TOKEN_EXPIRY_MARGIN", 60))
+
+    # Max number of kept connections per upstream
+    @cached_property
+    def EOSC_HTTP_POOL_SIZE(self):
+        return int(os.environ.get("EOSC_HTTP_POOL_SIZE", 10))
+
+    @cached_property
+    def EOSC_HTTP_KEEP_ALIVE(self):
+        return get_bool_env("EOSC_HTTP_KEEP_ALIVE", "true")
+
+    # Number of customers processed in parallel
+    @cached_property
+    def EOSC_CUSTOMER_WORKERS(self):
+        return int(os.environ.get("EOSC_CUSTOMER_WORKERS", 1))
+
+    # Number of offerings of a single customer processed in parallel
+    @cached_property
+    def EOSC_OFFERING_WORKERS(self):
+        return int(os.environ.get("EOSC_OFFERING_WORKERS", 1))
+
+    # Number of offer changes of a single offering applied in parallel
+    @cached_property
+    def EOSC_OFFER_WORKERS(self):
+        return int(os.environ.get("EOSC_OFFER_WORKERS", 4))
+
+    # "threads" runs app.sync_offers, "async" runs async_app.sync_offers
+    @cached_property
+    def EOSC_SYNC_ENGINE(self):
+        return os.environ.get("EOSC_SYNC_ENGINE", "threads")
+
+    # Max number of requests in flight for the async engine
+    @cached_property
+    def EOSC_ASYNC_CONCURRENCY(self):
+        return int(os.environ.get("EOSC_ASYNC_CONCURRENCY", 100))
+
+    # Number of items requested per page of catalogue listings
+    @cached_property
+    def EOSC_CATALOGUE_PAGE_SIZE(self):
+        return int(os.environ.get("EOSC_CATALOGUE_PAGE_SIZE", 100))
+
+    # Number of catalogue listing pages fetched in parallel
+    @cached_property
+    def EOSC_CATALOGUE_FETCH_WORKERS(self):
+        return int(os.environ.get("EOSC_CATALOGUE_FETCH_WORKERS", 4))
+
+    # Number of seconds an unchanged provider or resource is not pushed to the Provider portal
+    @cached_property
+    def EOSC_PAYLOAD_HASH_TTL(self):
+        return int(os.environ.get("EOSC_PAYLOAD_HASH_TTL", 24 * 60 * 60))
+
+    # SQLite database mapping Waldur objects to EOSC ones, it should be placed on a persistent volume
+    @cached_property
+    def EOSC_STATE_DB_PATH(self):
+        return os.environ.get("EOSC_STATE_DB_PATH") or ":memory:"
+
+    # Only the offerings and customers modified since the previous sync are synced
+    @cached_property
+    def EOSC_INCREMENTAL_SYNC(self):
+        return get_bool_env("EOSC_INCREMENTAL_SYNC", "false")
+
+    # Number of seconds between full syncs when the incremental sync is enabled
+    @cached_property
+    def EOSC_FULL_RECONCILE_INTERVAL(self):
+        return int(os.environ.get("EOSC_FULL_RECONCILE_INTERVAL", 24 * 60 * 60))
+
+    # Number of seconds the Waldur configuration and service providers are cached
+    @cached_property
+    def EOSC_STATIC_LOOKUP_TTL(self):
+        return int(os.environ.get("EOSC_STATIC_LOOKUP_TTL", 60 * 60))
+
+    # Max number of requests per second sent to every upstream
+    @cached_property
+    def EOSC_RATE_LIMIT(self):
+        return float(os.environ.get("EOSC_RATE_LIMIT", 10))
+
+    # Rates overriding EOSC_RATE_LIMIT for some upstreams, e.g. "provider_portal=5,waldur=20"
+    @cached_property
+    def EOSC_RATE_LIMITS(self):
+        return parse_rates(os.environ.get("EOSC_RATE_LIMITS", ""))
+
+    # Max number of retries of an idempotent request
+    @cached_property
+    def EOSC_MAX_RETRIES(self):
+        return int(os.environ.get("EOSC_MAX_RETRIES", 4))
+
+    # Number of seconds the retry backoff starts from
+    @cached_property
+    def EOSC_RETRY_BACKOFF(self):
+        return float(os.environ.get("EOSC_RETRY_BACKOFF", 1))
+
+    # Number of seconds to wait for a connection to an upstream and for a response from it
+    @cached_property
+    def EOSC_HTTP_CONNECT_TIMEOUT(self):
+        return float(os.environ.get("EOSC_HTTP_CONNECT_TIMEOUT", 5))
+
+    @cached_property
+    def EOSC_HTTP_READ_TIMEOUT(self):
+        return float(os.environ.get("EOSC_HTTP_READ_TIMEOUT", 60))
+
+    # Number of failed requests in a row after which the requests to the upstream fail fast
+    @cached_property
+    def EOSC_CIRCUIT_FAILURE_THRESHOLD(self):
+        return int(os.environ.get("EOSC_CIRCUIT_FAILURE_THRESHOLD", 5))
+
+    # Number of seconds after which a request is let through to the upstream to check if it is back
+    @cached_property
+    def EOSC_CIRCUIT_RESET_TIMEOUT(self):
+        return float(os.environ.get("EOSC_CIRCUIT_RESET_TIMEOUT", 60))
+
+    # Port of the Prometheus metrics endpoint, 0 disables it
+    @cached_property
+    def EOSC_METRICS_PORT(self):
+        return int(os.environ.get("EOSC_METRICS_PORT", 8000))
+
+    # Directory the JSON traces of the sync cycles are written to, tracing is disabled if it is empty
+    @cached_property
+    def EOSC_TRACE_DIR(self):
+        return os.environ.get("EOSC_TRACE_DIR", "")
+
+    # URL of the OTLP/HTTP traces endpoint of a collector, e.g. http://localhost:4318/v1/traces
+    @cached_property
+    def EOSC_TRACE_OTLP_URL(self):
+        return os.environ.get("EOSC_TRACE_OTLP_URL", "")
+
+    # Directory the cProfile profiles of the sync cycles are written to
+    @cached_property
+    def EOSC_PROFILE_DIR(self):
+        return os.environ.get("EOSC_PROFILE_DIR", "/tmp")
+
+    # Number of seconds between the starts of two sync cycles
+    @cached_property
+    def EOSC_SYNC_PERIOD(self):
+        return float(os.environ.get("EOSC_SYNC_PERIOD", 10 * 60))
+
+    # Max number of seconds randomly added to the period, so the replicas do not sync in lockstep
+    @cached_property
+    def EOSC_SYNC_JITTER(self):
+        return float(os.environ.get("EOSC_SYNC_JITTER", 30))
+
+    # Max number of seconds the period grows to while the cycles find no changes
+    @cached_property
+    def EOSC_SYNC_MAX_PERIOD(self):
+        return float(os.environ.get("EOSC_SYNC_MAX_PERIOD", 60 * 60))
+
+    # Number of seconds after which a failed customer is synced again, it doubles with every retry
+    @cached_property
+    def EOSC_CUSTOMER_RETRY_DELAY(self):
+        return float(os.environ.get("EOSC_CUSTOMER_RETRY_DELAY", 30))
+
+    # Max number of retries of a failed customer before it waits for the next cycle
+    @cached_property
+    def EOSC_CUSTOMER_MAX_RETRIES(self):
+        return int(os.environ.get("EOSC_CUSTOMER_MAX_RETRIES", 3))
+
+    # Port of the listener of the Waldur change notifications, 0 disables it
+    @cached_property
+    def EOSC_WEBHOOK_PORT(self):
+        return int(os.environ.get("EOSC_WEBHOOK_PORT", 0))
+
+    # Bearer token the notifications have to pass in the Authorization header, mandatory if the listener is enabled
+    @cached_property
+    def EOSC_WEBHOOK_TOKEN(self):
+        if not self.EOSC_WEBHOOK_PORT:
+            return os.environ.get("EOSC_WEBHOOK_TOKEN", "")
+        return get_env_or_fail("EOSC_WEBHOOK_TOKEN")
+
+    # URL of the listener of a shard with a {shard} placeholder, the notifications of other shards are forwarded to it
+    @cached_property
+    def EOSC_WEBHOOK_SHARD_URL(self):
+        return os.environ.get("EOSC_WEBHOOK_SHARD_URL", "")
+
+    # Number of seconds a notified customer waits for the sync, the notifications within it are synced at once
+    @cached_property
+    def EOSC_WEBHOOK_DEBOUNCE(self):
+        return float(os.environ.get("EOSC_WEBHOOK_DEBOUNCE", 5))
+
+    # Number of replicas the customers are sharded across
+    @cached_property
+    def EOSC_SHARD_COUNT(self):
+        return int(os.environ.get("EOSC_SHARD_COUNT", 1))
+
+    # Shard of this replica, the ordinal of the StatefulSet pod if it is not set
+    @cached_property
+    def EOSC_SHARD_INDEX(self):
+        if self.EOSC_SHARD_COUNT <= 1:
+            return 0
+        value = os.environ.get("EOSC_SHARD_INDEX") or get_ordinal(socket.gethostname())
+        index = int(value or get_env_or_fail("EOSC_SHARD_INDEX"))
+        if not 0 <= index < self.EOSC_SHARD_COUNT:
+            raise ValueError(
+                f"EOSC_SHARD_INDEX {index} is out of the range of EOSC_SHARD_COUNT {self.EOSC_SHARD_COUNT}."
+            )
+        return index
+
+    # The Provider portal URLs of the catalogue objects
+    @property
+    def CATALOGUE_PREFIX(self):
+        return f"/api/catalogue/{self.EOSC_CATALOGUE_ID}/"
+
+    @property
+    def PROVIDER_SERVICES_URL(self):
+        return self.CATALOGUE_PREFIX + "%s/resource/all"
+
+    @property
+    def PROVIDER_RESOURCE_URL(self):
+        return self.CATALOGUE_PREFIX + "resource/"
+
+    @property
+    def PROVIDER_URL(self):
+        return self.CATALOGUE_PREFIX + "provider/"
+
+    def validate(self):
+        """Reads the mandatory settings, the error lists all the missing and invalid variables."""
+        errors = []
+        for name in self.REQUIRED_SETTINGS:
+            try:
+                getattr(self, name)
+            except (MissingSettingError, ValueError) as e:
+                errors.append(str(e))
+        if errors:
+            raise MissingSettingError(" ".join(errors))
+
+    def reload(self):
+        """Forgets the settings read so far, so they are read from the environment again."""
+        self.__dict__.clear()
+
+
+settings = Settings()
@@ -0,0 +1,216 @@
+import functools
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import (
+    circuit_breaker_utils,
+    lazy_singleton,
+    logger,
+    metrics_utils,
+    rate_limit_utils,
+    settings,
+)
+
+AAI = "aai"
+PROVIDER_PORTAL = "provider_portal"
+MARKETPLACE = "marketplace"
+WALDUR = "waldur"
+
+UPSTREAMS = [AAI, PROVIDER_PORTAL, MARKETPLACE, WALDUR]
+
+
+def get_default_headers(upstream):
+    headers = {"Connection": "keep-alive" if settings.EOSC_HTTP_KEEP_ALIVE else "close"}
+    if upstream == PROVIDER_PORTAL:
+        headers["Accept"] = "application/json"
+    if upstream == MARKETPLACE:
+        headers["Accept"] = "application/json"
+        headers["X-User-Token"] = settings.EOSC_MARKETPLACE_OFFERING_TOKEN
+    if upstream == WALDUR:
+        headers["Authorization"] = "token %s" % settings.WALDUR_TOKEN
+        headers["Content-Type"] = "application/json"
+    return headers
+
+
+class RequestAttempts:
+    """
+    Makes the decisions about the attempts of a request: the rate, the retries, the circuit and the metrics.
+    The sessions of both engines only send the attempts and wait for the returned delays.
+    """
+
+    def __init__(self, upstream, method, url):
+        self.upstream = upstream
+        self.method = method
+        self.url = url
+        self.attempt = 0
+        self.bucket = rate_limit_utils.get_bucket(upstream)
+        self.breaker = circuit_breaker_utils.get_breaker(upstream)
+        self._started_at = 0
+        # The outcome of the whole request is recorded once, the retried attempts are not counted as failures
+        self.breaker.before_request()
+
+    def reserve(self):
+        """Returns the number of seconds to wait before the next attempt is sent."""
+        return self.bucket.reserve()
+
+    def start(self):
+        self._started_at = time.monotonic()
+
+    def _observe(self, status_code):
+        metrics_utils.observe_request(
+            self.upstream,
+            self.method,
+            self.url,
+            status_code,
+            time.monotonic() - self._started_at,
+        )
+
+    def handle_error(self, error, is_connection_error=False):
+        """Returns the delay before the retry after the error or None if the error is final."""
+        self._observe(None)
+        # Any error of the request is recorded, otherwise a failed probe would keep the circuit half-open
+        if not is_connection_error or not rate_limit_utils.is_retried(
+            self.method, self.attempt
+        ):
+            self.breaker.record_failure()
+            return None
+        delay = rate_limit_utils.get_retry_delay(self.attempt)
+        logger.info(
+            "Unable to connect to %s: %s, retrying in %.1f seconds",
+            self.upstream,
+            error,
+            delay,
+        )
+        self.attempt += 1
+        return delay
+
+    def handle_response(self, status_code, headers):
+        """Returns the delay before the retry after the response or None if the response is final."""
+        self._observe(status_code)
+        delay = rate_limit_utils.handle_response_status(
+            self.upstream, self.method, status_code, headers, self.attempt
+        )
+        if delay is None:
+            self.breaker.record_status(status_code)
+            return None
+        self.attempt += 1
+        return delay
+
+
+class RateLimitedSession(requests.Session):
+    """
+    Sends the requests to the upstream at the rate of its token bucket, unless its circuit is open.
+    The idempotent requests are retried on connection errors and on the responses of an overloaded upstream.
+    """
+
+    def __init__(self, upstream):
+        super().__init__()
+        self.upstream = upstream
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault(
+            "timeout",
+            (settings.EOSC_HTTP_CONNECT_TIMEOUT, settings.EOSC_HTTP_READ_TIMEOUT),
+        )
+        attempts = RequestAttempts(self.upstream, method, url)
+        while True:
+            delay = attempts.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            attempts.start()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                delay = attempts.handle_error(e, is_connection_error=True)
+                if delay is None:
+                    raise
+            except Exception as e:
+                attempts.handle_error(e)
+                raise
+            else:
+                delay = attempts.handle_response(response.status_code, response.headers)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+
+
+def build_session(upstream):
+    session = RateLimitedSession(upstream)
+    adapter = HTTPAdapter(
+        pool_connections=settings.EOSC_HTTP_POOL_SIZE,
+        pool_maxsize=settings.EOSC_HTTP_POOL_SIZE,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(get_default_headers(upstream))
+    return session
+
+
+# The getters of the sessions shared by all the calls to every upstream
+_session_getters = {
+    upstream: lazy_singleton(functools.partial(build_session, upstream))
+    for upstream in UPSTREAMS
+}
+
+
+def get_session(upstream):
+    return _session_getters[upstream]()
+
+
+def close_sessions():
+    for session_getter in _session_getters.values():
+        session, session_getter.instance = session_getter.instance, None
+        if session is not None:
+            session.close()
+
+
+def _get_session_connection_stats(session):
+    requests_count = 0
+    connections_count = 0
+    # The same adapter is mounted for both http:// and https://
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            connections_count += pool.num_connections
+    return requests_count, connections_count
+
+
+def get_connection_stats():
+    """
+    Returns the number of requests sent to every upstream,
+    the number of connections opened for them and how many requests reused a connection.
+    """
+    stats = {}
+    for upstream in UPSTREAMS:
+        session = _session_getters[upstream].instance
+        if session is None:
+            continue
+        requests_count, connections_count = _get_session_connection_stats(session)
+        stats[upstream] = {
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused": max(requests_count - connections_count, 0),
+        }
+    return stats
+
+
+def log_connection_stats():
+    for upstream, stats in get_connection_stats().items():
+        logger.info(
+            "Connection stats for %s: %s requests, %s connections, %s reused",
+            upstream,
+            stats["requests"],
+            stats["connections"],
+            stats["reused"],
+        )
@@ -0,0 +1,65 @@
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+
+from . import logger
+
+# The records held back for the customer being processed, flushed together once it is done
+_buffer = contextvars.ContextVar("log_buffer", default=None)
+_flush_lock = threading.Lock()
+
+
+class BufferingFilter(logging.Filter):
+    """Holds back the records logged in a context with an active buffer."""
+
+    def filter(self, record):
+        buffer = _buffer.get()
+        if buffer is None:
+            return True
+        buffer.append(record)
+        return False
+
+
+def flush_records(records):
+    # The lock keeps the records of one buffer together in the output
+    with _flush_lock:
+        for record in records:
+            logger.handle(record)
+
+
+def emit_records(records):
+    """Passes the records to the buffer of the current context if it has one, otherwise emits them."""
+    buffer = _buffer.get()
+    if buffer is not None:
+        buffer.extend(records)
+    else:
+        flush_records(records)
+
+
+@contextmanager
+def collected_logs(buffer):
+    """Collects the records logged in the current context into the buffer without emitting them."""
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+
+
+@contextmanager
+def buffered_logs():
+    """
+    Collects the records logged in the current context and emits them at once on exit,
+    so the logs of the work done in parallel threads or tasks are not interleaved.
+    Nested buffers are merged into the outer one.
+    """
+    buffer = []
+    try:
+        with collected_logs(buffer):
+            yield buffer
+    finally:
+        emit_records(buffer)
+
+
+logger.addFilter(BufferingFilter())
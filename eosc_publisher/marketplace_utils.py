@@ -1,56 +1,39 @@
 import json
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from requests.status_codes import codes as http_codes
 
 from . import (
-    EOSC_MARKETPLACE_BASE_URL,
-    EOSC_MARKETPLACE_OFFERING_TOKEN,
     MARKETPLACE_RESOURCE_LIST_URL,
     MARKETPLACE_RESOURCE_URL,
     OFFER_LIST_URL,
     OFFER_URL,
-    WALDUR_API_URL,
+    cache_utils,
+    http_utils,
     logger,
+    metrics_utils,
+    settings,
+    state_utils,
+    trace_utils,
 )
 
 
-def resource_and_offering_request():
-    headers = {
-        "accept": "application/json",
-        "X-User-Token": EOSC_MARKETPLACE_OFFERING_TOKEN,
-    }
-    return headers
+def get_session():
+    return http_utils.get_session(http_utils.MARKETPLACE)
 
 
-def offering_request_post_patch(
-    offer_name: str, offer_description: str, offer_parameters, internal=True
-):
+def resource_and_offering_request():
     headers = {
         "accept": "application/json",
-        "Content-Type": "application/json",
-        "X-User-Token": EOSC_MARKETPLACE_OFFERING_TOKEN,
-    }
-    data = {
-        "name": offer_name,
-        "description": offer_description,
-        "order_type": "order_required",
-        "primary_oms_id": 2,
-        "oms_params": {},
-        "order_url": WALDUR_API_URL.replace(
-            "https://api.", "https://"
-        ),  # plan['url'],  # "is not a valid URL"
-        "internal": internal,
-        "parameters": offer_parameters,
     }
-    return headers, data
+    return headers
 
 
 def offering_request_delete():
     headers = {
         "accept": "*/*",
-        "X-User-Token": EOSC_MARKETPLACE_OFFERING_TOKEN,
     }
     # TODO: finish
     return headers
@@ -58,8 +41,10 @@ def offering_request_delete():
 
 def get_resource_list():
     headers = resource_and_offering_request()
-    response = requests.get(
-        urllib.parse.urljoin(EOSC_MARKETPLACE_BASE_URL, MARKETPLACE_RESOURCE_LIST_URL),
+    response = get_session().get(
+        urllib.parse.urljoin(
+            settings.EOSC_MARKETPLACE_BASE_URL, MARKETPLACE_RESOURCE_LIST_URL
+        ),
         headers=headers,
     )
     resource_list_data = response.json()
@@ -68,9 +53,10 @@ def get_resource_list():
 
 def get_resource(resource_id):
     headers = resource_and_offering_request()
-    response = requests.get(
+    response = get_session().get(
         urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, MARKETPLACE_RESOURCE_URL % (str(resource_id))
+            settings.EOSC_MARKETPLACE_BASE_URL,
+            MARKETPLACE_RESOURCE_URL % (str(resource_id)),
         ),
         headers=headers,
     )
@@ -80,9 +66,9 @@ def get_resource(resource_id):
 
 def get_offer_list_of_resource(resource_id):
     headers = resource_and_offering_request()
-    response = requests.get(
+    response = get_session().get(
         urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, OFFER_LIST_URL % (str(resource_id))
+            settings.EOSC_MARKETPLACE_BASE_URL, OFFER_LIST_URL % (str(resource_id))
         ),
         headers=headers,
     )
@@ -93,75 +79,98 @@ def get_offer_list_of_resource(resource_id):
         raise requests.exceptions.RequestException
 
 
-def create_offer_for_resource(
-    eosc_resource_id: str,
+def construct_offer_payload(
     offer_name: str,
     offer_description: str,
     offer_parameters,
     internal=True,
 ):
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json",
-        "X-User-Token": EOSC_MARKETPLACE_OFFERING_TOKEN,
-    }
-    data = {
+    return {
         "name": offer_name,
         "description": offer_description or "N/A",
         "order_type": "order_required",
         "primary_oms_id": 2,
         "oms_params": {},
-        "order_url": WALDUR_API_URL.replace(
+        "order_url": settings.WALDUR_API_URL.replace(
             "https://api.", "https://"
         ),  # plan['url'],  # "is not a valid URL"
         "internal": internal,
         "parameters": offer_parameters,
     }
 
-    response = requests.post(
+
+def create_offer_for_resource(eosc_resource_id: str, offer_payload):
+    headers = {
+        "accept": "application/json",
+        "Content-Type": "application/json",
+    }
+    response = get_session().post(
         urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, OFFER_LIST_URL % eosc_resource_id
+            settings.EOSC_MARKETPLACE_BASE_URL, OFFER_LIST_URL % eosc_resource_id
         ),
         headers=headers,
-        data=json.dumps(data),
+        data=json.dumps(offer_payload),
     )
     if response.status_code != 201:
-        logger.error("Failed to create an offer.", response.status_code, response.text)
+        logger.error(
+            "Failed to create an offer. Code %s, error: %s",
+            response.status_code,
+            response.text,
+        )
     else:
         offer_data = response.json()
-        logger.info(f"Successfully created offer {offer_name} for {eosc_resource_id}.")
+        logger.info(
+            f"Successfully created offer {offer_payload['name']} for {eosc_resource_id}."
+        )
         return offer_data
 
 
-def patch_offer_from_resource(
-    resource_id, offer_id, waldur_offering_data, offer_description, offer_parameters
-):
-    headers, data = offering_request_post_patch(
-        offer_name=waldur_offering_data,
-        offer_description=offer_description,
-        offer_parameters=offer_parameters,
-    )
-    response = requests.patch(
+def patch_offer_from_resource(resource_id, offer_id, offer_payload):
+    headers = {
+        "accept": "application/json",
+        "Content-Type": "application/json",
+    }
+    response = get_session().patch(
         urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, OFFER_URL % (str(resource_id), str(offer_id))
+            settings.EOSC_MARKETPLACE_BASE_URL,
+            OFFER_URL % (str(resource_id), str(offer_id)),
         ),
         headers=headers,
-        data=data,
+        data=json.dumps(offer_payload),
     )
-    patch_offer_data = response.json()
-    return patch_offer_data
+    if response.status_code != http_codes.OK:
+        logger.error(
+            "Failed to update the offer %s. Code %s, error: %s",
+            offer_id,
+            response.status_code,
+            response.text,
+        )
+        return
+    logger.info(
+        f"Successfully updated offer {offer_payload['name']} for {resource_id}."
+    )
+    return response.json()
 
 
 def delete_offer_from_resource(resource_id, offer_id):
     headers = offering_request_delete()
-    response = requests.delete(
+    response = get_session().delete(
         urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, OFFER_URL % (str(resource_id), str(offer_id))
+            settings.EOSC_MARKETPLACE_BASE_URL,
+            OFFER_URL % (str(resource_id), str(offer_id)),
         ),
         headers=headers,
     )
-    delete_offer_data = response.json()
-    return delete_offer_data
+    if response.status_code not in [http_codes.OK, http_codes.NO_CONTENT]:
+        logger.error(
+            "Failed to delete the offer %s. Code %s, error: %s",
+            offer_id,
+            response.status_code,
+            response.text,
+        )
+        return False
+    logger.info(f"Successfully deleted offer {offer_id} of {resource_id}.")
+    return True
 
 
 def _normalize_limits(limit, limit_type):
@@ -173,137 +182,210 @@ def _normalize_limits(limit, limit_type):
     return limit
 
 
-def sync_offer(eosc_resource_id, waldur_offering):
-    eosc_offers = get_offer_list_of_resource(eosc_resource_id)["offers"]
-    eosc_offers_names = {offer["name"] for offer in eosc_offers}
-    for plan in waldur_offering["plans"]:
-        if plan["name"] in eosc_offers_names:
-            logger.info(
-                f"Skipping creation of plan {plan['name']}. Offer with the same name already exists."
-            )
-            continue
+def construct_component_parameter(component, waldur_offering):
+    if component["billing_type"] == "limit":
+        parameter_id = "limit " + component["type"]
+        # The plan name is substituted for every plan by construct_offer_parameters
+        description = component["description"]
+    elif component["billing_type"] == "usage":
+        parameter_id = "attributes " + component["type"]
+        description = (
+            component["description"]
+            or f"Amount of {component['name']} in {waldur_offering['name']}."
+        )
+    else:
+        return
+    return {
+        "id": parameter_id,
+        "label": component["name"],
+        "description": description,
+        "type": "range",
+        "value_type": "integer",  # waldur only expects numeric values for limit-type components
+        "unit": component["measured_unit"],
+        "config": {
+            "minimum": _normalize_limits(component["min_value"], component["type"]),
+            "maximum": _normalize_limits(component["max_value"], component["type"]),
+            "exclusiveMinimum": False,
+            "exclusiveMaximum": False,
+        },
+    }
 
-        parameters = [
-            {
-                "id": "name",
-                "label": "Name",
-                "description": "Name will be visible in accounting",
-                "type": "input",
-                "value_type": "string",
-                "unit": "",
-            }
-        ]
-        for component in waldur_offering["components"]:
-            if component["billing_type"] == "limit":
-                parameters.append(
-                    {
-                        "id": "limit " + component["type"],
-                        "label": component["name"],
-                        "description": component["description"]
-                        or f"Amount of {component['name']} in " f"{plan['name']}.",
-                        "type": "range",
-                        "value_type": "integer",  # waldur only expects numeric values for limit-type components
-                        "unit": component["measured_unit"],
-                        "config": {
-                            "minimum": _normalize_limits(
-                                component["min_value"], component["type"]
-                            ),
-                            "maximum": _normalize_limits(
-                                component["max_value"], component["type"]
-                            ),
-                            "exclusiveMinimum": False,
-                            "exclusiveMaximum": False,
-                        },
-                    },
-                )
-            if component["billing_type"] == "usage":
-                parameters.append(
-                    {
-                        "id": "attributes " + component["type"],
-                        "label": component["name"],
-                        "description": component["description"]
-                        or f"Amount of {component['name']} in "
-                        f"{waldur_offering['name']}.",
-                        "type": "range",
-                        "value_type": "integer",  # waldur only expects numeric values for limit-type components
-                        "unit": component["measured_unit"],
-                        "config": {
-                            "minimum": _normalize_limits(
-                                component["min_value"], component["type"]
-                            ),
-                            "maximum": _normalize_limits(
-                                component["max_value"], component["type"]
-                            ),
-                            "exclusiveMinimum": False,
-                            "exclusiveMaximum": False,
-                        },
-                    },
-                )
 
-        return create_offer_for_resource(
-            eosc_resource_id=eosc_resource_id,
-            offer_name=plan["name"],
-            offer_description=plan["description"],
-            offer_parameters=parameters,
+def compile_parameter_schema(waldur_offering):
+    """
+    Returns the offer parameters of the offering components which are the same for all the plans,
+    the parameters without a description get it from the plan name.
+    """
+    parameters = [
+        {
+            "id": "name",
+            "label": "Name",
+            "description": "Name will be visible in accounting",
+            "type": "input",
+            "value_type": "string",
+            "unit": "",
+        }
+    ]
+    for component in waldur_offering["components"]:
+        parameter = construct_component_parameter(component, waldur_offering)
+        if parameter is not None:
+            parameters.append(parameter)
+    return parameters
+
+
+def get_parameter_schema(waldur_offering):
+    # The usage parameters mention the offering name, so it is a part of the fingerprint
+    fingerprint = cache_utils.get_payload_hash(
+        [waldur_offering["name"], waldur_offering["components"]]
+    )
+    return cache_utils.parameter_schemas.get_or_load(
+        fingerprint, lambda: compile_parameter_schema(waldur_offering)
+    )
+
+
+def construct_offer_parameters(waldur_offering, plan):
+    # The cached schema is shared, so the parameters described with the plan name are copied
+    return [
+        parameter
+        if parameter["description"]
+        else dict(
+            parameter,
+            description=f"Amount of {parameter['label']} in {plan['name']}.",
         )
+        for parameter in get_parameter_schema(waldur_offering)
+    ]
 
 
-def get_all_offers_for_eosc_resource(eosc_resource_id):
-    headers = {
-        "accept": "application/json",
-        "X-User-Token": EOSC_MARKETPLACE_OFFERING_TOKEN,
-    }
+CREATE_OFFER = "create"
+UPDATE_OFFER = "update"
+DELETE_OFFER = "delete"
 
-    response = requests.get(
-        urllib.parse.urljoin(
-            EOSC_MARKETPLACE_BASE_URL, OFFER_LIST_URL % (str(eosc_resource_id))
-        ),
-        headers=headers,
-    )
+# The fields of an existing offer compared with the plan, the rest are not changed by the publisher
+UPDATED_OFFER_FIELDS = ["name", "description", "parameters", "internal"]
 
-    if response.status_code != http_codes.OK:
-        logger.warning(
-            "Unable to fetch offers for the resource [%s]. Code %s, details: %s",
-            eosc_resource_id,
-            response.status_code,
-            response.json(),
+
+def matches_payload(value, payload_value):
+    """Compares the value returned by the Marketplace with the sent one ignoring the fields added by the Marketplace."""
+    if isinstance(payload_value, dict):
+        return isinstance(value, dict) and all(
+            key in value and matches_payload(value[key], payload_value[key])
+            for key in payload_value
         )
-        return
+    if isinstance(payload_value, list):
+        return (
+            isinstance(value, list)
+            and len(value) == len(payload_value)
+            and all(map(matches_payload, value, payload_value))
+        )
+    return value == payload_value
+
+
+def is_offer_outdated(eosc_offer, offer_payload):
+    return any(
+        not matches_payload(eosc_offer[field], offer_payload[field])
+        for field in UPDATED_OFFER_FIELDS
+        if field in eosc_offer
+    )
+
+
+def find_plan_offer(plan, offers_by_id, offers_by_name):
+    # The stored offer ID is checked first, so a renamed plan keeps its offer
+    stored_offer_id = state_utils.get_state_store().get_offer_id(plan["uuid"])
+    return offers_by_id.get(stored_offer_id) or offers_by_name.get(plan["name"])
+
 
-    data = response.json()
-    data = data["offers"]
-    offer_names = [item["name"] for item in data]
-    # offer_ids = [item["id"] for item in data]
-    return offer_names
+def get_offer_changes(eosc_offers, waldur_offering):
+    """
+    Returns the changes making the offers of the resource match the plans of the offering
+    as (action, plan, EOSC offer, offer payload) tuples.
+    The offers matching no active plan are deleted.
+    """
+    offers_by_id = {str(offer["id"]): offer for offer in eosc_offers}
+    offers_by_name = {}
+    for offer in eosc_offers:
+        offers_by_name.setdefault(offer["name"], offer)
 
+    changes = []
+    matched_offer_ids = set()
+    for plan in waldur_offering["plans"]:
+        if plan.get("archived"):
+            continue
+        offer_payload = construct_offer_payload(
+            plan["name"],
+            plan["description"],
+            construct_offer_parameters(waldur_offering, plan),
+        )
+        eosc_offer = find_plan_offer(plan, offers_by_id, offers_by_name)
+        if eosc_offer is None:
+            changes.append((CREATE_OFFER, plan, None, offer_payload))
+            continue
+        matched_offer_ids.add(str(eosc_offer["id"]))
+        state_utils.get_state_store().set_offer_id(plan["uuid"], eosc_offer["id"])
+        if is_offer_outdated(eosc_offer, offer_payload):
+            changes.append((UPDATE_OFFER, plan, eosc_offer, offer_payload))
+
+    for eosc_offer in eosc_offers:
+        if str(eosc_offer["id"]) not in matched_offer_ids:
+            changes.append((DELETE_OFFER, None, eosc_offer, None))
+    return changes
+
+
+def apply_offer_change(eosc_resource_id, change):
+    """Returns True if the change has been applied."""
+    action, plan, eosc_offer, offer_payload = change
+    if action == CREATE_OFFER:
+        offer = create_offer_for_resource(eosc_resource_id, offer_payload)
+        if offer is None:
+            return False
+        state_utils.get_state_store().set_offer_id(plan["uuid"], offer["id"])
+        return True
+    if action == UPDATE_OFFER:
+        return (
+            patch_offer_from_resource(eosc_resource_id, eosc_offer["id"], offer_payload)
+            is not None
+        )
+    return delete_offer_from_resource(eosc_resource_id, eosc_offer["id"])
 
-def get_or_create_eosc_resource_offer(
-    eosc_resource, waldur_offering
-):  # , eosc_marketplace=None
-    offer_names = get_all_offers_for_eosc_resource(eosc_resource["id"])
 
-    if offer_names is None:
-        logger.warning("Skipping sync process.")
-        return None, None
+def get_reconciliation_report(changes, results):
+    report = {CREATE_OFFER: 0, UPDATE_OFFER: 0, DELETE_OFFER: 0, "failed": 0}
+    for (action, _, _, _), succeeded in zip(changes, results):
+        if succeeded:
+            report[action] += 1
+        else:
+            report["failed"] += 1
+    # The offer list is fetched once, every change is a single call
+    report["calls"] = 1 + len(changes)
+    return report
 
-    offer = sync_offer(eosc_resource["id"], waldur_offering)
 
-    if waldur_offering["name"] in offer_names:
-        return offer, True
+def reconcile_offers(eosc_resource_id, waldur_offering):
+    """Creates, updates and deletes the offers of the resource in one pass and returns the report of the changes."""
+    eosc_offers = get_offer_list_of_resource(eosc_resource_id)["offers"]
+    changes = get_offer_changes(eosc_offers, waldur_offering)
+    max_workers = min(settings.EOSC_OFFER_WORKERS, len(changes))
+    if max_workers <= 1:
+        results = [apply_offer_change(eosc_resource_id, change) for change in changes]
     else:
-        return offer, False
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    trace_utils.bind(
+                        lambda change: apply_offer_change(eosc_resource_id, change)
+                    ),
+                    changes,
+                )
+            )
+    report = get_reconciliation_report(changes, results)
+    metrics_utils.count_offer_changes(report)
+    logger.info(
+        "Offers of the resource %s are reconciled: %s", eosc_resource_id, report
+    )
+    return report
 
 
 def sync_marketplace_offer(waldur_offering, provider_resource):
-    eosc_offer, offer_created = get_or_create_eosc_resource_offer(
-        provider_resource, waldur_offering
-    )
-    if offer_created:
-        logger.info("New offering has been created in EOSC", eosc_offer)
-    else:
-        pass
-        # TODO: add activation of an offer
-    return eosc_offer
+    return reconcile_offers(provider_resource["id"], waldur_offering)
 
 
 def deactivate_offer(waldur_offering):
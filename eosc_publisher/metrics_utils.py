@@ -0,0 +1,153 @@
+import functools
+import re
+import urllib.parse
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+from . import (
+    CATALOGUE_PROVIDERS_URL,
+    CATALOGUE_SERVICES_URL,
+    MARKETPLACE_RESOURCE_LIST_URL,
+    MARKETPLACE_RESOURCE_URL,
+    OFFER_LIST_URL,
+    OFFER_URL,
+    logger,
+    settings,
+)
+
+CYCLE_SECONDS = Histogram(
+    "eosc_publisher_sync_cycle_seconds",
+    "Duration of a sync cycle",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+CUSTOMER_SYNC_SECONDS = Histogram(
+    "eosc_publisher_customer_sync_seconds",
+    "Duration of the sync of a customer and its offerings",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+OFFERING_SYNC_SECONDS = Histogram(
+    "eosc_publisher_offering_sync_seconds",
+    "Duration of the sync of an offering, its resource and offers",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+HTTP_REQUESTS = Counter(
+    "eosc_publisher_http_requests_total",
+    "HTTP requests sent to the upstreams, the retries are counted separately",
+    ["upstream", "method", "endpoint", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "eosc_publisher_http_request_seconds",
+    "Latency of the HTTP requests sent to the upstreams",
+    ["upstream", "method", "endpoint"],
+)
+SYNC_CHANGES = Counter(
+    "eosc_publisher_sync_changes_total",
+    "Changes of the EOSC objects decided by the sync",
+    ["object", "action"],
+)
+
+WEBHOOK_EVENTS = Counter(
+    "eosc_publisher_webhook_events_total",
+    "Waldur change notifications received by the webhook listener",
+    ["result"],
+)
+
+PROVIDER = "provider"
+RESOURCE = "resource"
+OFFER = "offer"
+
+UPDATE = "update"
+SKIP = "skip"
+
+# The error status is used for the requests which got no response
+ERROR_STATUS = "error"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def _compile_template(template):
+    pattern = re.escape(template).replace("%s", "[^/]+") + "$"
+    # The relative templates are joined to the base URL, which may have a path of its own
+    return re.compile(pattern if template.startswith("/") else "/" + pattern)
+
+
+@functools.lru_cache(maxsize=None)
+def get_endpoint_templates():
+    """
+    Returns the templates with their patterns, the more specific templates go first.
+    They are built on first use, because some of them include the catalogue ID.
+    """
+    templates = [
+        settings.PROVIDER_SERVICES_URL,
+        settings.PROVIDER_RESOURCE_URL,
+        settings.PROVIDER_RESOURCE_URL + "%s",
+        settings.PROVIDER_URL,
+        settings.PROVIDER_URL + "%s",
+        CATALOGUE_SERVICES_URL,
+        CATALOGUE_PROVIDERS_URL,
+        OFFER_URL,
+        OFFER_LIST_URL,
+        MARKETPLACE_RESOURCE_URL,
+        MARKETPLACE_RESOURCE_LIST_URL,
+    ]
+    return [(template, _compile_template(template)) for template in templates]
+
+
+ID_SEGMENT_PATTERN = re.compile(
+    r"^([0-9a-f]{32}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)$"
+)
+
+
+def get_endpoint(url):
+    """
+    Returns the template of the URL, so the label does not grow with the number of objects.
+    The URLs matching no template (e.g. the Waldur ones) have their UUIDs and numeric IDs replaced.
+    """
+    path = urllib.parse.urlparse(str(url)).path
+    for template, pattern in get_endpoint_templates():
+        if pattern.search(path):
+            return template.replace("%s", "{id}")
+    return "/".join(
+        "{id}" if ID_SEGMENT_PATTERN.match(segment) else segment
+        for segment in path.split("/")
+    )
+
+
+def observe_request(upstream, method, url, status_code, duration):
+    endpoint = get_endpoint(url)
+    status = ERROR_STATUS if status_code is None else str(status_code)
+    HTTP_REQUESTS.labels(upstream, method.upper(), endpoint, status).inc()
+    HTTP_REQUEST_SECONDS.labels(upstream, method.upper(), endpoint).observe(duration)
+
+
+def get_write_count(upstreams):
+    """Returns the number of the successful writes sent to the upstreams so far."""
+    count = 0
+    for metric in HTTP_REQUESTS.collect():
+        for sample in metric.samples:
+            if (
+                sample.name.endswith("_total")
+                and sample.labels["upstream"] in upstreams
+                and sample.labels["method"] in WRITE_METHODS
+                and sample.labels["status"].startswith("2")
+            ):
+                count += sample.value
+    return int(count)
+
+
+def count_change(object_type, action, count=1):
+    if count:
+        SYNC_CHANGES.labels(object_type, action).inc(count)
+
+
+def count_offer_changes(report):
+    for action, count in report.items():
+        # The calls are not changes, they are counted by the HTTP metrics
+        if action != "calls":
+            count_change(OFFER, action, count)
+
+
+def start_metrics_server():
+    if not settings.EOSC_METRICS_PORT:
+        return
+    start_http_server(settings.EOSC_METRICS_PORT)
+    logger.info("Serving the metrics on port %s", settings.EOSC_METRICS_PORT)
@@ -1,25 +1,31 @@
+import itertools
 import json.decoder
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 from requests.status_codes import codes as http_codes
 
 from . import (
+    CATALOGUE_PROVIDERS_URL,
     CATALOGUE_SERVICES_URL,
-    EOSC_AAI_CLIENT_ID,
-    EOSC_AAI_REFRESH_TOKEN,
-    EOSC_AAI_REFRESH_TOKEN_URL,
-    EOSC_CATALOGUE_ID,
-    EOSC_PROVIDER_PORTAL_BASE_URL,
-    PROVIDER_RESOURCE_URL,
-    PROVIDER_URL,
+    aai_utils,
+    cache_utils,
+    http_utils,
     logger,
-    waldur_client,
+    metrics_utils,
+    settings,
+    state_utils,
+    validation_utils,
 )
+from .waldur_utils import get_waldur_client
 
 DEFAULT_SUPPORT_EMAIL = "support@puhuri.io"
 
 
+def get_session():
+    return http_utils.get_session(http_utils.PROVIDER_PORTAL)
+
+
 def construct_abbreviation(name):
     name_split = name.split()
     if len(name_split) > 1:
@@ -29,30 +35,47 @@ def construct_abbreviation(name):
 
 
 def get_provider_token():
-    data = {
-        "grant_type": "refresh_token",
-        "refresh_token": EOSC_AAI_REFRESH_TOKEN,
-        "client_id": EOSC_AAI_CLIENT_ID,
-        "scope": "openid email profile",
-    }
+    return aai_utils.get_access_token()
+
+
+def get_homeport_url():
+    configuration = cache_utils.static_lookups.get_or_load(
+        "configuration", get_waldur_client().get_configuration
+    )
+    return configuration["WALDUR_CORE"]["HOMEPORT_URL"]
 
-    response = requests.post(EOSC_AAI_REFRESH_TOKEN_URL, data=data)
-    if response.status_code != 200:
-        logger.error(
-            f"Failed to get access token, {response.status_code}. {response.text}"
-        )
-        return None
-    response_data = response.json()
-    token = response_data["access_token"]
-    return token
+
+def get_service_provider(customer_uuid):
+    return cache_utils.static_lookups.get_or_load(
+        ("service_provider", customer_uuid),
+        lambda: get_waldur_client().list_service_providers(
+            filters={"customer_uuid": customer_uuid}
+        )[0],
+    )
 
 
-def construct_provider_payload(waldur_customer, provider_id=None, users=[]):
+def get_website(homepage):
+    """Returns the homepage as a URL, a homepage such as acme.org is published with the https scheme."""
+    homepage = (homepage or "").strip()
+    if not homepage:
+        return "https://share.neic.no/"
+    if not validation_utils.URL_PATTERN.match(homepage):
+        return "https://" + homepage
+    return homepage
+
+
+def construct_provider_payload(
+    waldur_customer,
+    provider_id=None,
+    users=[],
+    homeport_url=None,
+    service_provider=None,
+):
+    # homeport_url and service_provider are fetched from Waldur if they are not passed
     if waldur_customer["image"]:
         logo_url = waldur_customer["image"]
     else:
-        configuration = waldur_client.get_configuration()
-        homeport_url = configuration["WALDUR_CORE"]["HOMEPORT_URL"]
+        homeport_url = homeport_url or get_homeport_url()
         logo_url = urllib.parse.urljoin(
             homeport_url,
             "images/login_logo.png",
@@ -64,9 +87,8 @@ def construct_provider_payload(waldur_customer, provider_id=None, users=[]):
     else:
         [city, address] = ["unknown", "unknown"]
 
-    service_provider = waldur_client.list_service_providers(
-        filters={"customer_uuid": waldur_customer["uuid"]}
-    )[0]
+    if service_provider is None:
+        service_provider = get_service_provider(waldur_customer["uuid"])
     description = (
         service_provider["description"]
         or "%s provider in EOSC portal" % waldur_customer["name"]
@@ -74,10 +96,11 @@ def construct_provider_payload(waldur_customer, provider_id=None, users=[]):
     abbreviation = waldur_customer["abbreviation"] or construct_abbreviation(
         waldur_customer["name"]
     )
+    country = waldur_customer["country"] or "OT"
     provider_payload = {
         "abbreviation": abbreviation,
         "name": waldur_customer["name"],
-        "website": waldur_customer["homepage"] or "https://share.neic.no/",
+        "website": get_website(waldur_customer["homepage"]),
         "legalEntity": True,
         "legalStatus": "provider_legal_status-public_legal_entity",
         "description": description,
@@ -86,10 +109,10 @@ def construct_provider_payload(waldur_customer, provider_id=None, users=[]):
             "streetNameAndNumber": address,
             "postalCode": waldur_customer["postal"] or "00000",
             "city": city,
-            "country": waldur_customer["country"] or "OT",
+            "country": country,
         },
-        "participatingCountries": [waldur_customer["country"]],
-        "catalogueId": EOSC_CATALOGUE_ID,
+        "participatingCountries": [country],
+        "catalogueId": settings.EOSC_CATALOGUE_ID,
         "users": users,
     }
     if provider_id:
@@ -107,12 +130,14 @@ def construct_provider_payload(waldur_customer, provider_id=None, users=[]):
     if waldur_customer["division"]:
         provider_payload["affiliations"] = [waldur_customer["division"]]
 
-    return provider_payload
+    # The payload is checked before it is sent, so an invalid one fails without a round trip to the portal
+    return validation_utils.check_provider_payload(provider_payload)
 
 
-def construct_resource_payload(waldur_offering, provider_id, resource_id=None):
-    configuration = waldur_client.get_configuration()
-    homeport_url = configuration["WALDUR_CORE"]["HOMEPORT_URL"]
+def construct_resource_payload(
+    waldur_offering, provider_id, resource_id=None, homeport_url=None
+):
+    homeport_url = homeport_url or get_homeport_url()
     landing = urllib.parse.urljoin(
         homeport_url,
         f"marketplace-public-offering/{waldur_offering['uuid']}/",
@@ -135,8 +160,6 @@ def construct_resource_payload(waldur_offering, provider_id, resource_id=None):
     if waldur_offering["thumbnail"]:
         logo_url = waldur_offering["thumbnail"]
     else:
-        configuration = waldur_client.get_configuration()
-        homeport_url = configuration["WALDUR_CORE"]["HOMEPORT_URL"]
         logo_url = urllib.parse.urljoin(
             homeport_url,
             "images/login_logo.png",
@@ -152,7 +175,7 @@ def construct_resource_payload(waldur_offering, provider_id, resource_id=None):
         "accessModes": ["access_mode-other"],
         "accessTypes": ["access_type-remote", "access_type-virtual"],
         "accessPolicy": None,
-        "catalogueId": EOSC_CATALOGUE_ID,
+        "catalogueId": settings.EOSC_CATALOGUE_ID,
         "categories": [
             {
                 "category": "category-aggregators_and_integrators-aggregators_and_integrators",
@@ -233,17 +256,17 @@ def construct_resource_payload(waldur_offering, provider_id, resource_id=None):
     if resource_id:
         resource_payload["id"] = resource_id
 
-    return resource_payload
+    return validation_utils.check_resource_payload(resource_payload)
 
 
 def get_resource_by_id(resource_id, token):
     headers = {
-        "Accept": "application/json",
         "Authorization": token,
     }
-    response = requests.get(
+    response = get_session().get(
         urllib.parse.urljoin(
-            EOSC_PROVIDER_PORTAL_BASE_URL, PROVIDER_RESOURCE_URL + resource_id
+            settings.EOSC_PROVIDER_PORTAL_BASE_URL,
+            settings.PROVIDER_RESOURCE_URL + resource_id,
         ),
         headers=headers,
     )
@@ -251,30 +274,85 @@ def get_resource_by_id(resource_id, token):
     return data
 
 
-def get_all_resources_from_catalogue(token):
-    logger.info("Fetching all resources for catalogue %s", EOSC_CATALOGUE_ID)
+class CatalogueFetchError(Exception):
+    pass
+
+
+def get_catalogue_page(url, token, offset, quantity):
     headers = {
-        "Accept": "application/json",
         "Authorization": token,
     }
-    response = requests.get(
-        urllib.parse.urljoin(
-            EOSC_PROVIDER_PORTAL_BASE_URL,
-            CATALOGUE_SERVICES_URL,
-        ),
+    response = get_session().get(
+        urllib.parse.urljoin(settings.EOSC_PROVIDER_PORTAL_BASE_URL, url),
         headers=headers,
-        params={"catalogue_id": EOSC_CATALOGUE_ID, "quantity": 1000},
+        params={
+            "catalogue_id": settings.EOSC_CATALOGUE_ID,
+            "from": offset,
+            "quantity": quantity,
+        },
     )
     if response.status_code != 200:
-        logger.error(
-            f"Failed to get list of resources with code {response.status_code}. Message: {response.text}"
+        raise CatalogueFetchError(
+            f"Failed to get list of {url} with code {response.status_code}. Message: {response.text}"
+        )
+    return response.json()
+
+
+def get_page_offsets(first_page, page_size):
+    """Returns the offsets of the pages following the first one."""
+    total = first_page["total"]
+    # The portal may return less items than requested, so its page size is used
+    page_size = len(first_page["results"]) or page_size
+    return list(range(page_size, total, page_size)), page_size
+
+
+def check_fetched_count(url, fetched_count, total):
+    if fetched_count != total:
+        raise CatalogueFetchError(
+            f"Fetched {fetched_count} items of {url} while the catalogue reports {total}"
         )
+
+
+def iter_catalogue_items(url, token, page_size=None):
+    """
+    Yields the items of a paginated catalogue listing page by page.
+    The pages following the first one are fetched concurrently.
+    """
+    page_size = page_size or settings.EOSC_CATALOGUE_PAGE_SIZE
+    first_page = get_catalogue_page(url, token, 0, page_size)
+    yield from first_page["results"]
+    fetched_count = len(first_page["results"])
+
+    offsets, page_size = get_page_offsets(first_page, page_size)
+    offsets = iter(offsets)
+    workers = settings.EOSC_CATALOGUE_FETCH_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Only the pages fetched by the workers at the moment are kept in memory
+        while True:
+            batch = list(itertools.islice(offsets, workers))
+            if not batch:
+                break
+            pages = executor.map(
+                lambda offset: get_catalogue_page(url, token, offset, page_size),
+                batch,
+            )
+            for page in pages:
+                yield from page["results"]
+                fetched_count += len(page["results"])
+
+    check_fetched_count(url, fetched_count, first_page["total"])
+
+
+def get_all_resources_from_catalogue(token):
+    logger.info("Fetching all resources for catalogue %s", settings.EOSC_CATALOGUE_ID)
+    resource_names_and_ids = {}
+    try:
+        for resource in iter_catalogue_items(CATALOGUE_SERVICES_URL, token):
+            resource_names_and_ids[resource["name"]] = resource["id"]
+    except CatalogueFetchError as e:
+        logger.error(e)
         return []
-    data = response.json()
-    resource_list = data["results"]
-    resource_names_and_ids = {
-        resource["name"]: resource["id"] for resource in resource_list
-    }
+    logger.info("Fetched %s resources", len(resource_names_and_ids))
     return resource_names_and_ids
 
 
@@ -286,16 +364,65 @@ def fetch_all_resources_from_eosc_catalogue():
         return None
 
 
-def update_resource(waldur_offering, provider_id, resource_id, token):
+def get_all_providers_from_catalogue(token):
+    logger.info("Fetching all providers for catalogue %s", settings.EOSC_CATALOGUE_ID)
+    try:
+        providers = {
+            provider["id"]: provider
+            for provider in iter_catalogue_items(CATALOGUE_PROVIDERS_URL, token)
+        }
+    except CatalogueFetchError as e:
+        logger.error(e)
+        return None
+    logger.info("Fetched %s providers", len(providers))
+    return providers
+
+
+def fetch_all_providers_from_eosc_catalogue():
+    token = get_provider_token()
+    if token:
+        return get_all_providers_from_catalogue(token)
+    else:
+        return None
+
+
+def remember_created_resource(resource_payload, resource):
+    # The payload of the next update contains the ID of the created resource
+    cache_utils.pushed_payloads.remember(
+        cache_utils.RESOURCE,
+        resource["id"],
+        dict(resource_payload, id=resource["id"]),
+    )
+
+
+def remember_created_provider(provider_payload, provider):
+    # The payload of the next update contains the ID and users of the created provider
+    cache_utils.pushed_payloads.remember(
+        cache_utils.PROVIDER,
+        provider["id"],
+        dict(
+            provider_payload,
+            id=provider["id"],
+            users=provider.get("users", provider_payload["users"]),
+        ),
+    )
+
+
+def update_resource(
+    waldur_offering, provider_id, resource_id, token, resource_payload=None
+):
     logger.info("Updating resource %s for provider %s", resource_id, provider_id)
     headers = {
         "Authorization": token,
     }
-    resource_payload = construct_resource_payload(
-        waldur_offering, provider_id, resource_id
-    )
-    response = requests.put(
-        urllib.parse.urljoin(EOSC_PROVIDER_PORTAL_BASE_URL, PROVIDER_RESOURCE_URL),
+    if resource_payload is None:
+        resource_payload = construct_resource_payload(
+            waldur_offering, provider_id, resource_id
+        )
+    response = get_session().put(
+        urllib.parse.urljoin(
+            settings.EOSC_PROVIDER_PORTAL_BASE_URL, settings.PROVIDER_RESOURCE_URL
+        ),
         headers=headers,
         json=resource_payload,
     )
@@ -310,6 +437,9 @@ def update_resource(waldur_offering, provider_id, resource_id, token):
             resource = response.json()
         except json.JSONDecodeError as err:
             if "There are no changes in the Service" in response.text:
+                cache_utils.pushed_payloads.remember(
+                    cache_utils.RESOURCE, resource_id, resource_payload
+                )
                 return
             logger.error("Error parsing %s", response.text)
             logger.exception(err)
@@ -319,6 +449,9 @@ def update_resource(waldur_offering, provider_id, resource_id, token):
             "The resource %s has been successfully updated",
             resource["name"],
         )
+        cache_utils.pushed_payloads.remember(
+            cache_utils.RESOURCE, resource_id, resource_payload
+        )
         return resource
 
 
@@ -332,8 +465,10 @@ def create_resource(waldur_offering, provider_id, token):
         "Authorization": token,
     }
     resource_payload = construct_resource_payload(waldur_offering, provider_id)
-    response = requests.post(
-        urllib.parse.urljoin(EOSC_PROVIDER_PORTAL_BASE_URL, PROVIDER_RESOURCE_URL),
+    response = get_session().post(
+        urllib.parse.urljoin(
+            settings.EOSC_PROVIDER_PORTAL_BASE_URL, settings.PROVIDER_RESOURCE_URL
+        ),
         headers=headers,
         json=resource_payload,
     )
@@ -346,7 +481,9 @@ def create_resource(waldur_offering, provider_id, token):
         logger.info(
             "The resource %s has been successfully created", waldur_offering["name"]
         )
-        return response.json()
+        resource = response.json()
+        remember_created_resource(resource_payload, resource)
+        return resource
 
 
 def delete_resource(resource_id, token):
@@ -356,10 +493,12 @@ def delete_resource(resource_id, token):
     }
 
     url = (
-        urllib.parse.urljoin(EOSC_PROVIDER_PORTAL_BASE_URL, PROVIDER_RESOURCE_URL)
+        urllib.parse.urljoin(
+            settings.EOSC_PROVIDER_PORTAL_BASE_URL, settings.PROVIDER_RESOURCE_URL
+        )
         + resource_id
     )
-    response = requests.delete(url, headers=headers)
+    response = get_session().delete(url, headers=headers)
 
     if response.status_code not in [http_codes.OK, http_codes.NO_CONTENT]:
         logger.error(
@@ -370,6 +509,7 @@ def delete_resource(resource_id, token):
         return
 
     logger.info("The resource has been successfully removed from the catalogue")
+    cache_utils.pushed_payloads.forget(cache_utils.RESOURCE, resource_id)
     deleted_resource = response.json()
     return deleted_resource
 
@@ -383,10 +523,22 @@ def create_eosc_resource(waldur_offering, provider_id):
 
 def update_eosc_resource(waldur_offering, provider_id, resource_id):
     logger.info("Resource already exists in EOSC: %s", waldur_offering["name"])
+    resource_payload = construct_resource_payload(
+        waldur_offering, provider_id, resource_id
+    )
+    if cache_utils.pushed_payloads.is_unchanged(
+        cache_utils.RESOURCE, resource_id, resource_payload
+    ):
+        logger.info("The resource has not changed since the last update, skipping it")
+        metrics_utils.count_change(metrics_utils.RESOURCE, metrics_utils.SKIP)
+        return resource_payload
+
+    metrics_utils.count_change(metrics_utils.RESOURCE, metrics_utils.UPDATE)
+
     token = get_provider_token()
     existing_resource = get_resource_by_id(resource_id, token)
     updated_existing_resource = update_resource(
-        waldur_offering, provider_id, resource_id, token
+        waldur_offering, provider_id, resource_id, token, resource_payload
     )
     return updated_existing_resource or existing_resource
 
@@ -398,18 +550,21 @@ def delete_eosc_resource(resource_id):
     return deleted_resource
 
 
-def update_provider(waldur_customer, provider_id, token, users):
+def update_provider(waldur_customer, provider_id, token, users, provider_payload=None):
     logger.info("Updating the provider")
-    provider_payload = construct_provider_payload(waldur_customer, provider_id, users)
+    if provider_payload is None:
+        provider_payload = construct_provider_payload(
+            waldur_customer, provider_id, users
+        )
 
     provider_url = urllib.parse.urljoin(
-        EOSC_PROVIDER_PORTAL_BASE_URL,
-        PROVIDER_URL,
+        settings.EOSC_PROVIDER_PORTAL_BASE_URL,
+        settings.PROVIDER_URL,
     )
     headers = {
         "Authorization": token,
     }
-    provider_response = requests.put(
+    provider_response = get_session().put(
         provider_url, json=provider_payload, headers=headers
     )
 
@@ -425,27 +580,35 @@ def update_provider(waldur_customer, provider_id, token, users):
     try:
         provider = provider_response.json()
         logger.info("The provider %s has been successfully updated", provider["name"])
+        cache_utils.pushed_payloads.remember(
+            cache_utils.PROVIDER, provider_id, provider_payload
+        )
         return provider
     except json.decoder.JSONDecodeError:
         logger.info(
             f"Didn't update: {provider_response.status_code}, {provider_response.text}"
         )
         # Provider portal return XML wtih error message and 200 response code if entry hasn't been updated
+        cache_utils.pushed_payloads.remember(
+            cache_utils.PROVIDER, provider_id, provider_payload
+        )
         return None
 
 
-def create_provider(waldur_customer, token):
+def create_provider(waldur_customer, token, service_provider=None):
     logger.info("Creating a provider for customer %s", waldur_customer["name"])
-    provider_payload = construct_provider_payload(waldur_customer)
+    provider_payload = construct_provider_payload(
+        waldur_customer, service_provider=service_provider
+    )
 
     provider_url = urllib.parse.urljoin(
-        EOSC_PROVIDER_PORTAL_BASE_URL,
-        PROVIDER_URL,
+        settings.EOSC_PROVIDER_PORTAL_BASE_URL,
+        settings.PROVIDER_URL,
     )
     headers = {
         "Authorization": token,
     }
-    provider_response = requests.post(
+    provider_response = get_session().post(
         provider_url,
         json=provider_payload,
         headers=headers,
@@ -459,20 +622,20 @@ def create_provider(waldur_customer, token):
 
     provider = provider_response.json()
     logger.info("The provider %s has been successfully created", provider["name"])
+    remember_created_provider(provider_payload, provider)
     return provider
 
 
 def get_provider(provider_id, token):
     logger.info("Fetching provider [id=%s] data.", provider_id)
     headers = {
-        "Accept": "application/json",
         "Authorization": token,
     }
     provider_url = urllib.parse.urljoin(
-        EOSC_PROVIDER_PORTAL_BASE_URL,
-        f"{PROVIDER_URL}{provider_id}",
+        settings.EOSC_PROVIDER_PORTAL_BASE_URL,
+        f"{settings.PROVIDER_URL}{provider_id}",
     )
-    provider_response = requests.get(
+    provider_response = get_session().get(
         provider_url,
         headers=headers,
     )
@@ -492,23 +655,30 @@ def get_provider(provider_id, token):
     )
 
 
-def get_eosc_provider(waldur_customer):
-    provider_id = (
+def get_provider_id(waldur_customer):
+    # The stored ID is used, so the provider is found after the customer is renamed
+    stored_provider_id = state_utils.get_state_store().get_provider_id(
+        waldur_customer["uuid"]
+    )
+    if stored_provider_id:
+        return stored_provider_id
+    return (
         waldur_customer["abbreviation"]
         or construct_abbreviation(waldur_customer["name"])
     ).lower()
 
+
+def get_eosc_provider(waldur_customer):
+    provider_id = get_provider_id(waldur_customer)
+
     token = get_provider_token()
 
     provider = get_provider(provider_id, token)
     return provider
 
 
-def sync_eosc_provider(waldur_customer, existing_provider):
-    provider_id = (
-        waldur_customer["abbreviation"]
-        or construct_abbreviation(waldur_customer["name"])
-    ).lower()
+def sync_eosc_provider(waldur_customer, existing_provider, service_provider=None):
+    provider_id = get_provider_id(waldur_customer)
 
     logger.info(
         "Syncing customer %s (provider %s)", waldur_customer["name"], provider_id
@@ -517,10 +687,29 @@ def sync_eosc_provider(waldur_customer, existing_provider):
     token = get_provider_token()
     # TODO: add customer deletion
     if existing_provider is None:
-        created_provider = create_provider(waldur_customer, token)
+        created_provider = create_provider(waldur_customer, token, service_provider)
         return created_provider
     else:
+        provider_payload = construct_provider_payload(
+            waldur_customer,
+            existing_provider["id"],
+            existing_provider["users"],
+            service_provider=service_provider,
+        )
+        if cache_utils.pushed_payloads.is_unchanged(
+            cache_utils.PROVIDER, existing_provider["id"], provider_payload
+        ):
+            logger.info(
+                "The provider has not changed since the last update, skipping it"
+            )
+            metrics_utils.count_change(metrics_utils.PROVIDER, metrics_utils.SKIP)
+            return existing_provider
+        metrics_utils.count_change(metrics_utils.PROVIDER, metrics_utils.UPDATE)
         refreshed_provider_json = update_provider(
-            waldur_customer, existing_provider["id"], token, existing_provider["users"]
+            waldur_customer,
+            existing_provider["id"],
+            token,
+            existing_provider["users"],
+            provider_payload,
         )
         return refreshed_provider_json or existing_provider
@@ -0,0 +1,148 @@
+import email.utils
+import random
+import threading
+import time
+
+from . import logger, settings
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# The statuses meaning the upstream is overloaded, the send rate is lowered when they are received
+THROTTLING_STATUS_CODES = {429, 503}
+RETRIED_STATUS_CODES = THROTTLING_STATUS_CODES | {502, 504}
+MAX_RETRY_DELAY = 60
+# The rate is halved on throttling and restored by this share of the configured rate on every success
+RATE_RECOVERY_STEP = 0.05
+MIN_RATE_SHARE = 0.05
+
+
+class TokenBucket:
+    """
+    Limits the rate of the requests sent to an upstream.
+    The rate adapts to the upstream: it is lowered when the upstream throttles and recovers on successes.
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.throttled = 0
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def reserve(self):
+        """Takes a token and returns the number of seconds to wait before the request is sent."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = 0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(delay, self._blocked_until - now)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle(self, retry_after=None):
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_SHARE)
+            if retry_after:
+                # No request is sent to the upstream until the time it asked for
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + retry_after
+                )
+            logger.warning(
+                "%s is throttling, the rate is lowered to %.2f/s", self.name, self.rate
+            )
+
+    def recover(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(
+                    self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP
+                )
+
+    def get_stats(self):
+        with self._lock:
+            return {"rate": round(self.rate, 2), "throttled": self.throttled}
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(upstream):
+    with _buckets_lock:
+        if upstream not in _buckets:
+            rate = settings.EOSC_RATE_LIMITS.get(upstream, settings.EOSC_RATE_LIMIT)
+            _buckets[upstream] = TokenBucket(upstream, rate)
+        return _buckets[upstream]
+
+
+def get_rate_limit_stats():
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {upstream: bucket.get_stats() for upstream, bucket in buckets.items()}
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds from a Retry-After header, which is either a number or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def get_retry_delay(attempt, retry_after=None):
+    """Returns the delay before the retry, the backoff is exponential with full jitter."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return random.uniform(
+        0, min(MAX_RETRY_DELAY, settings.EOSC_RETRY_BACKOFF * 2**attempt)
+    )
+
+
+def is_retried(method, attempt):
+    return method.upper() in IDEMPOTENT_METHODS and attempt < settings.EOSC_MAX_RETRIES
+
+
+def handle_response_status(upstream, method, status_code, headers, attempt):
+    """
+    Updates the rate of the upstream after a response.
+    Returns the delay before the request is retried or None if the response is final.
+    """
+    bucket = get_bucket(upstream)
+    if status_code not in RETRIED_STATUS_CODES:
+        bucket.recover()
+        return None
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    if status_code in THROTTLING_STATUS_CODES:
+        bucket.throttle(retry_after)
+    if not is_retried(method, attempt):
+        return None
+    delay = get_retry_delay(attempt, retry_after)
+    logger.info(
+        "%s responded with %s, retrying %s in %.1f seconds",
+        upstream,
+        status_code,
+        method.upper(),
+        delay,
+    )
+    return delay
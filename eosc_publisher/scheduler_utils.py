@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+
+from . import http_utils, logger, metrics_utils, settings
+
+# The writes to these upstreams are the changes made by a cycle, the token refreshes are not
+CHANGED_UPSTREAMS = (http_utils.PROVIDER_PORTAL, http_utils.MARKETPLACE)
+
+
+class Scheduler:
+    """
+    Decides when the sync cycles and the retries of the failed customers run.
+
+    The cycles start a period apart, measured from start to start, with a random jitter added.
+    The period doubles after every cycle which has changed nothing, up to the max period,
+    and is back to the base one after a cycle with changes or failures.
+    A customer failed during a cycle is retried with a growing delay instead of waiting for the next cycle.
+    A customer notified as changed is synced after the debounce delay the same way.
+    """
+
+    def __init__(
+        self,
+        period=None,
+        jitter=None,
+        max_period=None,
+        retry_delay=None,
+        max_retries=None,
+        debounce=None,
+    ):
+        self.period = settings.EOSC_SYNC_PERIOD if period is None else period
+        self.jitter = settings.EOSC_SYNC_JITTER if jitter is None else jitter
+        self.max_period = (
+            settings.EOSC_SYNC_MAX_PERIOD if max_period is None else max_period
+        )
+        self.retry_delay = (
+            settings.EOSC_CUSTOMER_RETRY_DELAY if retry_delay is None else retry_delay
+        )
+        self.max_retries = (
+            settings.EOSC_CUSTOMER_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.debounce = settings.EOSC_WEBHOOK_DEBOUNCE if debounce is None else debounce
+        self.idle_cycles = 0
+        self.next_cycle_at = time.monotonic()
+        # The customer UUIDs mapped to the time of the retry and the number of the retries done
+        self.retries = {}
+        # The retries are scheduled by the webhook listener thread as well
+        self._retries_lock = threading.Lock()
+        # Held while a cycle or a retry runs, so they never overlap
+        self.run_lock = threading.Lock()
+        # Set when a change is notified, so the loop waiting for the next cycle or retry reschedules
+        self.wakeup = threading.Event()
+        # Called on the thread of the notification, e.g. the async engine wakes its event loop up this way
+        self.wakeup_callbacks = [self.wakeup.set]
+        self._cycle_started_at = None
+        self._writes_at_start = 0
+
+    def get_period(self):
+        return min(
+            self.period * 2**self.idle_cycles, max(self.max_period, self.period)
+        )
+
+    def get_delay(self):
+        """Returns the number of seconds until the next cycle or retry is due."""
+        with self._retries_lock:
+            due_at = min(
+                [self.next_cycle_at] + [due_at for due_at, _ in self.retries.values()]
+            )
+        return max(due_at - time.monotonic(), 0)
+
+    def wait(self, timeout):
+        """Waits until the timeout or a change notification."""
+        if self.wakeup.wait(timeout):
+            self.wakeup.clear()
+
+    def is_cycle_due(self):
+        return time.monotonic() >= self.next_cycle_at
+
+    def start_cycle(self):
+        self._cycle_started_at = time.monotonic()
+        self._writes_at_start = metrics_utils.get_write_count(CHANGED_UPSTREAMS)
+        # The cycle syncs the customers waiting for a retry as well
+        with self._retries_lock:
+            self.retries.clear()
+
+    def finish_cycle(self, report):
+        """Schedules the next cycle and the retries, the report is None if the cycle has crashed."""
+        changes = (
+            metrics_utils.get_write_count(CHANGED_UPSTREAMS) - self._writes_at_start
+        )
+        failed_customers = report["failed_customers"] if report else []
+        if report is None or changes or failed_customers:
+            self.idle_cycles = 0
+        elif self.get_period() < self.max_period:
+            self.idle_cycles += 1
+        for customer_uuid in failed_customers:
+            self.schedule_retry(customer_uuid, 0)
+
+        period = self.get_period()
+        self.next_cycle_at = (
+            self._cycle_started_at + period + random.uniform(0, self.jitter)
+        )
+        delay = max(self.next_cycle_at - time.monotonic(), 0)
+        if report is None:
+            logger.info(
+                "The cycle has not completed, the next one starts in %.0f seconds",
+                delay,
+            )
+        else:
+            logger.info(
+                "The cycle has made %s changes and failed %s customers, the next one starts in %.0f seconds",
+                changes,
+                len(failed_customers),
+                delay,
+            )
+
+    def schedule_retry(self, customer_uuid, attempt):
+        if attempt >= self.max_retries:
+            logger.warning(
+                "The customer [uuid=%s] has failed %s retries, it waits for the next cycle",
+                customer_uuid,
+                attempt,
+            )
+            return
+        delay = self.retry_delay * 2**attempt
+        with self._retries_lock:
+            self.retries[customer_uuid] = (time.monotonic() + delay, attempt)
+
+    def schedule_change(self, customer_uuid):
+        """
+        Schedules the sync of a customer notified as changed.
+        Returns False if the customer is already due within the debounce delay, so a burst of changes is synced once.
+        """
+        due_at = time.monotonic() + self.debounce
+        with self._retries_lock:
+            scheduled_at, attempt = self.retries.get(customer_uuid, (None, 0))
+            if scheduled_at is not None and scheduled_at <= due_at:
+                return False
+            self.retries[customer_uuid] = (due_at, attempt)
+        for callback in self.wakeup_callbacks:
+            callback()
+        return True
+
+    def pop_due_retries(self):
+        """Returns the customers due for a retry mapped to the number of the retries done."""
+        now = time.monotonic()
+        with self._retries_lock:
+            due = {
+                customer_uuid: attempt
+                for customer_uuid, (due_at, attempt) in self.retries.items()
+                if due_at <= now
+            }
+            for customer_uuid in due:
+                del self.retries[customer_uuid]
+        return due
+
+    def finish_retries(self, due, results):
+        for customer_uuid, succeeded in results.items():
+            if not succeeded:
+                self.schedule_retry(customer_uuid, due[customer_uuid] + 1)
+        logger.info(
+            "%s of %s failed or changed customers have been synced",
+            sum(1 for succeeded in results.values() if succeeded),
+            len(results),
+        )
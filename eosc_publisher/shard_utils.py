@@ -0,0 +1,63 @@
+import functools
+import hashlib
+
+from . import logger, settings
+
+
+def get_weight(shard_index, customer_uuid):
+    digest = hashlib.blake2b(
+        f"{shard_index}:{customer_uuid}".encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big")
+
+
+@functools.lru_cache(maxsize=None)
+def get_shard(customer_uuid, shard_count):
+    """
+    Returns the shard of the customer by rendezvous hashing: the shard with the highest weight for the customer.
+    Every replica computes the same shard, and a resize from N to N + 1 shards moves only a 1 / (N + 1) share
+    of the customers, all of them to the new shard.
+    """
+    return max(
+        range(shard_count),
+        key=lambda shard_index: get_weight(shard_index, customer_uuid),
+    )
+
+
+def is_own_customer(customer_uuid):
+    if settings.EOSC_SHARD_COUNT <= 1:
+        return True
+    return (
+        get_shard(customer_uuid, settings.EOSC_SHARD_COUNT) == settings.EOSC_SHARD_INDEX
+    )
+
+
+def get_shard_key():
+    """Returns the shard of this replica, e.g. 2/4, the incremental sync restarts with a full one when it changes."""
+    return f"{settings.EOSC_SHARD_INDEX}/{settings.EOSC_SHARD_COUNT}"
+
+
+def filter_offerings(waldur_offerings):
+    """Returns the offerings of the customers of this replica."""
+    if settings.EOSC_SHARD_COUNT <= 1:
+        return waldur_offerings
+    own_offerings = [
+        waldur_offering
+        for waldur_offering in waldur_offerings
+        if is_own_customer(waldur_offering["customer_uuid"])
+    ]
+    logger.info(
+        "The shard %s handles %s of %s offerings",
+        get_shard_key(),
+        len(own_offerings),
+        len(waldur_offerings),
+    )
+    return own_offerings
+
+
+def filter_customers(waldur_customers):
+    return [
+        waldur_customer
+        for waldur_customer in waldur_customers
+        if is_own_customer(waldur_customer["uuid"])
+    ]
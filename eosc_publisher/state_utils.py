@@ -0,0 +1,115 @@
+import itertools
+import sqlite3
+import threading
+
+from . import lazy_singleton, logger, settings
+
+MEMORY_PATH = ":memory:"
+# The keys looked up by a single query, below the limit of the query parameters of old SQLite versions
+LOOKUP_CHUNK_SIZE = 500
+
+TABLES = {
+    "resources": ("offering_uuid", "resource_id"),
+    "providers": ("customer_uuid", "provider_id"),
+    "offers": ("plan_uuid", "offer_id"),
+    "metadata": ("key", "value"),
+}
+
+
+class StateStore:
+    """
+    Maps Waldur objects to the EOSC objects created for them:
+    offering UUID to resource ID, customer UUID to provider ID and plan UUID to offer ID.
+
+    An offering mapped to None is known to have no resource in the catalogue.
+    """
+
+    def __init__(self, path=None):
+        self.path = settings.EOSC_STATE_DB_PATH if path is None else path
+        if path is None and self.path == MEMORY_PATH:
+            logger.warning(
+                "EOSC_STATE_DB_PATH is not set, the state is kept in memory and lost on restart"
+            )
+        self._lock = threading.Lock()
+        # The connection is shared by the worker threads, the lock serializes its usage
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        for table, (key_column, value_column) in TABLES.items():
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"({key_column} TEXT PRIMARY KEY, {value_column} TEXT)"
+            )
+
+    def _get(self, table, key):
+        key_column, value_column = TABLES[table]
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {value_column} FROM {table} WHERE {key_column} = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, table, key, value):
+        key_column, value_column = TABLES[table]
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, {value_column}) VALUES (?, ?)",
+                (key, None if value is None else str(value)),
+            )
+
+    def get_resource_ids(self, offering_uuids):
+        """Returns the known resource IDs of the offerings, the unknown offerings are omitted."""
+        offering_uuids = iter(set(offering_uuids))
+        resource_ids = {}
+        while True:
+            chunk = list(itertools.islice(offering_uuids, LOOKUP_CHUNK_SIZE))
+            if not chunk:
+                return resource_ids
+            placeholders = ", ".join("?" * len(chunk))
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT offering_uuid, resource_id FROM resources "
+                    f"WHERE offering_uuid IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            resource_ids.update(rows)
+
+    def set_resource_id(self, offering_uuid, resource_id):
+        self._set("resources", offering_uuid, resource_id)
+
+    def get_provider_id(self, customer_uuid):
+        return self._get("providers", customer_uuid)
+
+    def set_provider_id(self, customer_uuid, provider_id):
+        self._set("providers", customer_uuid, provider_id)
+
+    def get_offer_id(self, plan_uuid):
+        return self._get("offers", plan_uuid)
+
+    def set_offer_id(self, plan_uuid, offer_id):
+        self._set("offers", plan_uuid, offer_id)
+
+    def get_value(self, key):
+        return self._get("metadata", key)
+
+    def set_value(self, key, value):
+        self._set("metadata", key, value)
+
+    def clear(self):
+        with self._lock:
+            for table in TABLES:
+                self._connection.execute(f"DELETE FROM {table}")
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                table: self._connection.execute(
+                    f"SELECT COUNT(*) FROM {table}"
+                ).fetchone()[0]
+                for table in TABLES
+            }
+
+
+@lazy_singleton
+def get_state_store():
+    return StateStore()
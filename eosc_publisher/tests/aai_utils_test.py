@@ -0,0 +1,80 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from eosc_publisher import aai_utils
+
+
+def token_response(token="token", expires_in=300):
+    response = Mock(status_code=200)
+    response.json.return_value = {"access_token": token, "expires_in": expires_in}
+    return response
+
+
+@patch("eosc_publisher.http_utils.get_session")
+class TestAccessTokenManager(unittest.TestCase):
+    def test_token_is_reused_until_it_expires(self, mock_get_session):
+        mock_get_session.return_value.post.return_value = token_response()
+        manager = aai_utils.AccessTokenManager(expiry_margin=60)
+
+        self.assertEqual("token", manager.get_token())
+        self.assertEqual("token", manager.get_token())
+
+        mock_get_session.return_value.post.assert_called_once()
+        self.assertEqual(
+            {"hits": 1, "refreshes": 1, "failures": 0}, manager.get_stats()
+        )
+
+    @patch("eosc_publisher.aai_utils.time")
+    def test_token_is_refreshed_within_expiry_margin(self, mock_time, mock_get_session):
+        mock_get_session.return_value.post.side_effect = [
+            token_response("first"),
+            token_response("second"),
+        ]
+        manager = aai_utils.AccessTokenManager(expiry_margin=60)
+
+        mock_time.monotonic.return_value = 1000
+        self.assertEqual("first", manager.get_token())
+        mock_time.monotonic.return_value = 1230
+        self.assertEqual("first", manager.get_token())
+        mock_time.monotonic.return_value = 1250
+        self.assertEqual("second", manager.get_token())
+        self.assertEqual(2, mock_get_session.return_value.post.call_count)
+
+    @patch("eosc_publisher.aai_utils.time")
+    def test_short_lived_token_is_reused(self, mock_time, mock_get_session):
+        mock_get_session.return_value.post.side_effect = [
+            token_response("first", expires_in=30),
+            token_response("second", expires_in=30),
+        ]
+        manager = aai_utils.AccessTokenManager(expiry_margin=60)
+
+        mock_time.monotonic.return_value = 1000
+        self.assertEqual("first", manager.get_token())
+        mock_time.monotonic.return_value = 1010
+        self.assertEqual("first", manager.get_token())
+        mock_time.monotonic.return_value = 1016
+        self.assertEqual("second", manager.get_token())
+        self.assertEqual(2, mock_get_session.return_value.post.call_count)
+
+    def test_failed_refresh_returns_none(self, mock_get_session):
+        mock_get_session.return_value.post.return_value = Mock(
+            status_code=401, text="Unauthorized"
+        )
+        manager = aai_utils.AccessTokenManager()
+
+        self.assertIsNone(manager.get_token())
+        self.assertEqual(1, manager.get_stats()["failures"])
+
+    def test_concurrent_callers_trigger_single_refresh(self, mock_get_session):
+        mock_get_session.return_value.post.return_value = token_response()
+        manager = aai_utils.AccessTokenManager()
+
+        threads = [threading.Thread(target=manager.get_token) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_get_session.return_value.post.assert_called_once()
+        self.assertEqual(9, manager.get_stats()["hits"])
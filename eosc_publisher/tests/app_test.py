@@ -0,0 +1,363 @@
+import sys
+import unittest
+from unittest.mock import ANY, AsyncMock, patch
+
+from eosc_publisher import app, settings, shard_utils, state_utils
+from eosc_publisher.tests.factories import make_offering
+
+
+@patch("eosc_publisher.app.marketplace_utils")
+@patch("eosc_publisher.app.provider_utils")
+@patch("eosc_publisher.waldur_utils.get_waldur_client.instance")
+class TestProcessOffers(unittest.TestCase):
+    def setUp(self):
+        state_utils.get_state_store().clear()
+        self.offerings = [
+            make_offering("c1", "Compute"),
+            make_offering("c2", "Storage"),
+            make_offering("c3", "Archive", state="Archived"),
+        ]
+
+    def prepare(self, mock_waldur_client, mock_provider_utils):
+        mock_waldur_client.list_marketplace_provider_offerings.return_value = (
+            self.offerings
+        )
+        mock_waldur_client._get_resource.side_effect = lambda endpoint, uuid: {
+            "uuid": uuid
+        }
+        mock_provider_utils.fetch_all_resources_from_eosc_catalogue.return_value = {
+            "Storage": "storage-id",
+            "Archive": "archive-id",
+        }
+        # The providers are fetched one by one unless a test prefetches them
+        mock_provider_utils.fetch_all_providers_from_eosc_catalogue.return_value = None
+        mock_provider_utils.sync_eosc_provider.side_effect = (
+            lambda customer, existing, service_provider: {
+                "id": "provider-" + customer["uuid"]
+            }
+        )
+        mock_provider_utils.create_eosc_resource.side_effect = (
+            lambda offering, provider_id: {"id": offering["name"].lower() + "-id"}
+        )
+
+    def assert_offerings_synced(self, mock_provider_utils):
+        mock_provider_utils.create_eosc_resource.assert_called_once_with(
+            self.offerings[0], "provider-c1"
+        )
+        mock_provider_utils.update_eosc_resource.assert_called_once_with(
+            self.offerings[1], "provider-c2", "storage-id"
+        )
+        mock_provider_utils.delete_eosc_resource.assert_called_once_with("archive-id")
+
+    def test_customers_are_processed_sequentially(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        self.assert_offerings_synced(mock_provider_utils)
+
+    @patch.object(settings, "EOSC_CUSTOMER_WORKERS", 3)
+    def test_customers_are_processed_in_parallel(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        self.assert_offerings_synced(mock_provider_utils)
+
+    def test_customers_are_read_from_prefetched_index(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        mock_waldur_client.list_customers.return_value = [
+            {"uuid": "c1"},
+            {"uuid": "c2"},
+            {"uuid": "other"},
+        ]
+        mock_waldur_client.list_service_providers.return_value = [
+            {"customer_uuid": "c1", "description": "Provider c1"}
+        ]
+
+        app.process_offers()
+
+        mock_waldur_client._get_resource.assert_called_once_with(
+            mock_waldur_client.Endpoints.Customers, "c3"
+        )
+        mock_provider_utils.sync_eosc_provider.assert_any_call(
+            {"uuid": "c1"}, ANY, {"customer_uuid": "c1", "description": "Provider c1"}
+        )
+        mock_provider_utils.sync_eosc_provider.assert_any_call(
+            {"uuid": "c2"}, ANY, None
+        )
+
+    def test_providers_are_read_from_prefetched_providers(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        mock_provider_utils.fetch_all_providers_from_eosc_catalogue.return_value = {
+            "provider-c2": {"id": "provider-c2"}
+        }
+        mock_provider_utils.get_provider_id.side_effect = (
+            lambda customer: "provider-" + customer["uuid"]
+        )
+
+        app.process_offers()
+
+        # Only the provider of c1 is missing and has an active offering to be created
+        mock_provider_utils.get_eosc_provider.assert_called_once_with({"uuid": "c1"})
+        mock_provider_utils.sync_eosc_provider.assert_any_call(
+            {"uuid": "c2"}, {"id": "provider-c2"}, None
+        )
+        self.assertEqual(2, mock_provider_utils.sync_eosc_provider.call_count)
+
+    def test_providers_of_few_customers_are_not_prefetched(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.offerings.pop()
+        self.prepare(mock_waldur_client, mock_provider_utils)
+
+        app.process_offers()
+
+        mock_provider_utils.fetch_all_providers_from_eosc_catalogue.assert_not_called()
+        self.assertEqual(2, mock_provider_utils.get_eosc_provider.call_count)
+
+    def test_known_offerings_are_not_looked_up_in_catalogue(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        mock_provider_utils.reset_mock()
+        self.offerings[0]["name"] = "Renamed compute"
+
+        app.process_offers()
+
+        mock_provider_utils.fetch_all_resources_from_eosc_catalogue.assert_not_called()
+        mock_provider_utils.create_eosc_resource.assert_not_called()
+        mock_provider_utils.update_eosc_resource.assert_any_call(
+            self.offerings[0], "provider-c1", "compute-id"
+        )
+        mock_provider_utils.delete_eosc_resource.assert_not_called()
+
+    @patch.object(settings, "EOSC_CUSTOMER_WORKERS", 3)
+    def test_failed_customer_does_not_affect_others(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+
+        def get_eosc_provider(customer):
+            if customer["uuid"] == "c1":
+                raise Exception("Provider portal is unavailable")
+
+        mock_provider_utils.get_eosc_provider.side_effect = get_eosc_provider
+
+        with self.assertLogs("eosc_publisher", level="INFO") as logs:
+            report = app.process_offers()
+
+        mock_provider_utils.create_eosc_resource.assert_not_called()
+        mock_provider_utils.update_eosc_resource.assert_called_once()
+        errors = [line for line in logs.output if line.startswith("ERROR")]
+        self.assertEqual(1, len(errors))
+        self.assertIn("c1", errors[0])
+        self.assertEqual(["c1"], report["failed_customers"])
+
+    def test_failed_customer_is_synced_alone(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        mock_waldur_client.list_marketplace_provider_offerings.side_effect = (
+            lambda filters: [
+                offering
+                for offering in self.offerings
+                if offering["customer_uuid"] == filters["customer_uuid"]
+            ]
+        )
+
+        results = app.sync_customers(["c1", "c4"])
+
+        self.assertEqual({"c1": True, "c4": True}, results)
+        mock_provider_utils.create_eosc_resource.assert_called_once_with(
+            self.offerings[0], "provider-c1"
+        )
+        mock_provider_utils.update_eosc_resource.assert_not_called()
+
+    @patch.object(settings, "EOSC_CUSTOMER_WORKERS", 3)
+    def test_logs_of_customer_are_grouped(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+
+        with self.assertLogs("eosc_publisher", level="INFO") as logs:
+            app.process_offers()
+
+        separators = [
+            index for index, line in enumerate(logs.output) if line.endswith("-" * 20)
+        ]
+        starts = [
+            index
+            for index, line in enumerate(logs.output)
+            if "Processing customer" in line
+        ]
+        self.assertEqual(3, len(starts))
+        # Every customer block ends with its separator before the next one starts
+        for start, next_start in zip(starts, starts[1:] + [len(logs.output)]):
+            self.assertEqual(
+                1, len([index for index in separators if start < index < next_start])
+            )
+
+    @patch.object(settings, "EOSC_CUSTOMER_WORKERS", 2)
+    @patch.object(settings, "EOSC_OFFERING_WORKERS", 4)
+    def test_offerings_of_customer_are_processed_in_parallel(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.offerings = [make_offering("c1", "Offering %s" % i) for i in range(8)]
+        self.prepare(mock_waldur_client, mock_provider_utils)
+
+        def create_eosc_resource(waldur_offering, provider_id):
+            if waldur_offering["name"] == "Offering 3":
+                raise Exception("Unable to create a resource")
+            return {"id": waldur_offering["name"]}
+
+        mock_provider_utils.create_eosc_resource.side_effect = create_eosc_resource
+
+        with self.assertLogs("eosc_publisher", level="INFO") as logs:
+            app.process_offers()
+
+        self.assertEqual(8, mock_provider_utils.create_eosc_resource.call_count)
+        self.assertEqual(7, mock_marketplace_utils.sync_marketplace_offer.call_count)
+        synced = [
+            line.split("Syncing offering ")[1].split(" from")[0]
+            for line in logs.output
+            if "Syncing offering" in line
+        ]
+        # Logs of the offerings are emitted in the order of the offerings
+        self.assertEqual(["Offering %s" % i for i in range(8)], synced)
+        self.assertIn("1 of 8 offerings have not been synced", "\n".join(logs.output))
+
+
+@patch.object(settings, "EOSC_INCREMENTAL_SYNC", True)
+@patch("eosc_publisher.app.marketplace_utils")
+@patch("eosc_publisher.app.provider_utils")
+@patch("eosc_publisher.waldur_utils.get_waldur_client.instance")
+class TestIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        state_utils.get_state_store().clear()
+        self.offerings = [
+            make_offering("c1", "Compute"),
+            make_offering("c2", "Storage"),
+        ]
+
+    def prepare(self, mock_waldur_client, mock_provider_utils):
+        def list_marketplace_provider_offerings(filters=None):
+            if filters and "customer_uuid" in filters:
+                return [
+                    offering
+                    for offering in self.offerings
+                    if offering["customer_uuid"] == filters["customer_uuid"]
+                ]
+            if filters and "modified" in filters:
+                return []
+            return self.offerings
+
+        mock_waldur_client.list_marketplace_provider_offerings.side_effect = (
+            list_marketplace_provider_offerings
+        )
+        mock_waldur_client.list_customers.return_value = []
+        mock_waldur_client._get_resource.side_effect = lambda endpoint, uuid: {
+            "uuid": uuid
+        }
+        mock_provider_utils.fetch_all_resources_from_eosc_catalogue.return_value = {
+            "Storage": "storage-id",
+        }
+        mock_provider_utils.fetch_all_providers_from_eosc_catalogue.return_value = None
+        mock_provider_utils.sync_eosc_provider.side_effect = (
+            lambda customer, existing, service_provider: {
+                "id": "provider-" + customer["uuid"]
+            }
+        )
+        mock_provider_utils.create_eosc_resource.side_effect = (
+            lambda offering, provider_id: {"id": offering["name"].lower() + "-id"}
+        )
+
+    def test_only_modified_objects_are_synced_after_full_sync(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        self.assertEqual(2, mock_provider_utils.sync_eosc_provider.call_count)
+        mock_provider_utils.reset_mock()
+        mock_waldur_client.list_customers.return_value = [{"uuid": "c2"}]
+
+        app.process_offers()
+
+        sync_mark = state_utils.get_state_store().get_value(app.SYNC_MARK_KEY)
+        mock_waldur_client.list_customers.assert_called_once()
+        self.assertLessEqual(
+            mock_waldur_client.list_customers.call_args[0][0]["modified"], sync_mark
+        )
+        mock_provider_utils.sync_eosc_provider.assert_called_once()
+        mock_provider_utils.update_eosc_resource.assert_called_once_with(
+            self.offerings[1], "provider-c2", "storage-id"
+        )
+
+    @patch.object(settings, "EOSC_FULL_RECONCILE_INTERVAL", 0)
+    def test_full_sync_is_done_after_interval(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        app.process_offers()
+
+        mock_waldur_client.list_customers.assert_not_called()
+        self.assertEqual(4, mock_provider_utils.sync_eosc_provider.call_count)
+
+    def test_full_sync_is_done_after_shard_change(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        app.process_offers()
+        mock_provider_utils.reset_mock()
+
+        shard_index = shard_utils.get_shard("c1", 3)
+        with patch.object(settings, "EOSC_SHARD_INDEX", shard_index), patch.object(
+            settings, "EOSC_SHARD_COUNT", 3
+        ):
+            app.process_offers()
+            self.assertEqual(
+                "%s/3" % shard_index,
+                state_utils.get_state_store().get_value(app.SHARD_KEY),
+            )
+
+        mock_waldur_client.list_customers.assert_not_called()
+        mock_provider_utils.sync_eosc_provider.assert_called_once()
+        self.assertEqual(
+            "c1", mock_provider_utils.sync_eosc_provider.call_args[0][0]["uuid"]
+        )
+
+    def test_sync_mark_is_not_saved_if_customer_fails(
+        self, mock_waldur_client, mock_provider_utils, mock_marketplace_utils
+    ):
+        self.prepare(mock_waldur_client, mock_provider_utils)
+        mock_provider_utils.get_eosc_provider.side_effect = Exception("Unavailable")
+
+        app.process_offers()
+
+        self.assertIsNone(state_utils.get_state_store().get_value(app.SYNC_MARK_KEY))
+
+
+@patch.object(settings, "EOSC_METRICS_PORT", 8000)
+@patch.object(settings, "EOSC_SYNC_ENGINE", "async")
+@patch.object(sys, "argv", ["eosc_publisher.app"])
+@patch.object(settings, "validate")
+@patch("eosc_publisher.app.signal")
+@patch("eosc_publisher.metrics_utils.start_http_server")
+class TestMain(unittest.TestCase):
+    def test_async_engine_starts_metrics_server_once(
+        self, mock_start_http_server, mock_signal, mock_validate
+    ):
+        from eosc_publisher import async_app
+
+        sync_offers = AsyncMock()
+        with patch.object(async_app, "sync_offers", sync_offers):
+            app.main()
+
+        sync_offers.assert_awaited_once()
+        mock_start_http_server.assert_called_once_with(8000)
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import aiohttp
+
+from eosc_publisher import (
+    async_app,
+    cache_utils,
+    circuit_breaker_utils,
+    http_utils,
+    marketplace_utils,
+    settings,
+    state_utils,
+)
+from eosc_publisher.tests.factories import make_offering
+
+TOKEN_RESPONSE = async_app.AsyncResponse(200, json.dumps({"access_token": "token"}), {})
+CONFIGURATION_RESPONSE = async_app.AsyncResponse(
+    200, json.dumps({"WALDUR_CORE": {"HOMEPORT_URL": "https://waldur/"}}), {}
+)
+
+
+def make_response(status_code, data=None, headers=None):
+    return async_app.AsyncResponse(status_code, json.dumps(data), headers or {})
+
+
+class AsyncPublisherTestCase(unittest.TestCase):
+    """Runs the calls of a publisher whose requests are answered by the mocked _send."""
+
+    def setUp(self):
+        cache_utils.static_lookups.invalidate()
+        cache_utils.pushed_payloads.clear()
+        self.responses = []
+
+    def send(self, upstream, method, url, **kwargs):
+        if upstream == http_utils.AAI:
+            return TOKEN_RESPONSE
+        if url.endswith("configuration/"):
+            return CONFIGURATION_RESPONSE
+        return self.responses.pop(0)
+
+    def run_publisher(self, call):
+        async def run():
+            async with async_app.AsyncPublisher() as publisher:
+                with patch.object(
+                    publisher, "_send", AsyncMock(side_effect=self.send)
+                ) as mock_send:
+                    self.mock_send = mock_send
+                    return await call(publisher)
+
+        return asyncio.run(run())
+
+    def get_calls(self, upstream):
+        return [
+            (call[0][1], call[0][2], call[1])
+            for call in self.mock_send.call_args_list
+            if call[0][0] == upstream
+        ]
+
+
+class TestAsyncProcessOffers(unittest.TestCase):
+    def setUp(self):
+        state_utils.get_state_store().clear()
+        self.offerings = [
+            make_offering("c1", "Compute"),
+            make_offering("c1", "Storage"),
+            make_offering("c2", "Archive", state="Archived"),
+            make_offering("c3", "Draft", state="Draft"),
+        ]
+        self.publisher = AsyncMock()
+        self.publisher.concurrency = 10
+        self.publisher.list_marketplace_provider_offerings.return_value = self.offerings
+        self.publisher.fetch_all_resources_from_eosc_catalogue.return_value = {
+            "Storage": "storage-id",
+            "Archive": "archive-id",
+        }
+        self.publisher.fetch_all_providers_from_eosc_catalogue.return_value = None
+        self.publisher.get_customer.side_effect = lambda uuid: {"uuid": uuid}
+        self.publisher.get_eosc_provider.side_effect = lambda customer: (
+            None if customer["uuid"] == "c3" else {"id": customer["uuid"]}
+        )
+        self.publisher.sync_eosc_provider.side_effect = (
+            lambda customer, existing, service_provider: {
+                "id": "provider-" + customer["uuid"]
+            }
+        )
+
+    def test_same_decisions_as_threads_engine(self):
+        asyncio.run(async_app.process_offers(self.publisher))
+
+        self.publisher.create_eosc_resource.assert_awaited_once_with(
+            self.offerings[0], "provider-c1"
+        )
+        self.publisher.update_eosc_resource.assert_awaited_once_with(
+            self.offerings[1], "provider-c1", "storage-id"
+        )
+        self.publisher.delete_eosc_resource.assert_awaited_once_with("archive-id")
+        self.assertEqual(2, self.publisher.sync_marketplace_offer.await_count)
+        # The provider of c3 does not exist and all its offerings are inactive
+        self.assertEqual(2, self.publisher.sync_eosc_provider.await_count)
+
+    def test_failed_offering_does_not_affect_others(self):
+        self.publisher.create_eosc_resource.side_effect = Exception("Unavailable")
+
+        with self.assertLogs("eosc_publisher", level="INFO") as logs:
+            asyncio.run(async_app.process_offers(self.publisher))
+
+        self.publisher.update_eosc_resource.assert_awaited_once()
+        self.assertIn(
+            "1 of 2 offerings have not been synced",
+            "\n".join(logs.output),
+        )
+
+
+class TestAsyncRequest(unittest.TestCase):
+    def test_probe_failing_with_any_error_reopens_circuit(self):
+        breaker = circuit_breaker_utils.CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout=0
+        )
+        breaker.record_failure()
+        publisher = async_app.AsyncPublisher()
+
+        with patch.object(
+            circuit_breaker_utils, "get_breaker", return_value=breaker
+        ), patch.object(
+            publisher,
+            "_send",
+            AsyncMock(side_effect=aiohttp.ClientPayloadError("Broken")),
+        ):
+            with self.assertRaises(aiohttp.ClientPayloadError):
+                asyncio.run(
+                    publisher.request(
+                        http_utils.MARKETPLACE, "get", "http://127.0.0.1/"
+                    )
+                )
+
+        self.assertEqual(circuit_breaker_utils.OPEN, breaker.state)
+
+    @patch("eosc_publisher.waldur_utils.verify_ssl", False)
+    def test_ssl_verification_can_be_disabled_for_waldur(self):
+        publisher = async_app.AsyncPublisher()
+
+        with patch.object(publisher, "_build_session") as mock_build_session:
+            asyncio.run(publisher.__aenter__())
+
+        verify_ssl = {
+            upstream: call[1]["verify_ssl"]
+            for upstream, call in zip(
+                http_utils.UPSTREAMS, mock_build_session.call_args_list
+            )
+        }
+        self.assertFalse(verify_ssl[http_utils.WALDUR])
+        self.assertTrue(verify_ssl[http_utils.PROVIDER_PORTAL])
+
+
+class TestOfferListFailure(AsyncPublisherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.response = async_app.AsyncResponse(500, "Unavailable", {})
+        self.provider_resource = {"id": "resource-id"}
+
+    @patch("eosc_publisher.marketplace_utils.resource_and_offering_request")
+    @patch("eosc_publisher.marketplace_utils.get_session")
+    def test_threads_engine_fails_offering(self, mock_get_session, mock_headers):
+        mock_get_session.return_value.get.return_value = self.response
+
+        with self.assertRaises(Exception):
+            marketplace_utils.sync_marketplace_offer({}, self.provider_resource)
+
+    def test_async_engine_fails_offering(self):
+        self.responses = [self.response]
+
+        with self.assertRaisesRegex(Exception, "Code 500"):
+            self.run_publisher(
+                lambda publisher: publisher.sync_marketplace_offer(
+                    {}, self.provider_resource
+                )
+            )
+
+
+class TestGatherLimited(unittest.TestCase):
+    def test_tasks_are_limited(self):
+        running = []
+        max_running = []
+
+        async def task(index):
+            running.append(index)
+            max_running.append(len(running))
+            await asyncio.sleep(0)
+            running.remove(index)
+            return index
+
+        results = asyncio.run(
+            async_app.gather_limited(2, [task(index) for index in range(5)])
+        )
+
+        self.assertEqual([0, 1, 2, 3, 4], results)
+        self.assertEqual(2, max(max_running))
+
+
+class TestAsyncPublisher(AsyncPublisherTestCase):
+    def test_waldur_pages_are_followed(self):
+        next_url = settings.WALDUR_API_URL + "customers/?page=2"
+        self.responses = [
+            make_response(
+                200, [{"uuid": "c1"}], {"Link": '<%s>; rel="next"' % next_url}
+            ),
+            make_response(200, [{"uuid": "c2"}]),
+        ]
+
+        customers = self.run_publisher(
+            lambda publisher: publisher.list_customers({"name": "Customer"})
+        )
+
+        self.assertEqual(["c1", "c2"], [customer["uuid"] for customer in customers])
+        calls = self.get_calls(http_utils.WALDUR)
+        self.assertEqual({"page_size": 200, "name": "Customer"}, calls[0][2]["params"])
+        self.assertEqual((next_url, None), (calls[1][1], calls[1][2]["params"]))
+
+    @patch("eosc_publisher.provider_utils.construct_resource_payload")
+    def test_resource_is_created(self, mock_construct):
+        mock_construct.return_value = {"name": "Compute"}
+        self.responses = [make_response(201, {"id": "r1", "name": "Compute"})]
+
+        resource = self.run_publisher(
+            lambda publisher: publisher.create_eosc_resource({"name": "Compute"}, "p1")
+        )
+
+        self.assertEqual("r1", resource["id"])
+        [(method, url, kwargs)] = self.get_calls(http_utils.PROVIDER_PORTAL)
+        self.assertEqual("post", method)
+        self.assertEqual({"name": "Compute"}, kwargs["json"])
+        self.assertEqual("token", kwargs["headers"]["Authorization"])
+
+    @patch("eosc_publisher.provider_utils.construct_resource_payload")
+    def test_existing_resource_is_fetched_before_update(self, mock_construct):
+        mock_construct.return_value = {"id": "r1", "name": "Compute"}
+        self.responses = [
+            make_response(200, {"id": "r1", "name": "Old"}),
+            make_response(200, {"id": "r1", "name": "Compute"}),
+        ]
+
+        resource = self.run_publisher(
+            lambda publisher: publisher.update_eosc_resource(
+                {"name": "Compute"}, "p1", "r1"
+            )
+        )
+
+        self.assertEqual("Compute", resource["name"])
+        methods = [call[0] for call in self.get_calls(http_utils.PROVIDER_PORTAL)]
+        self.assertEqual(["get", "put"], methods)
+
+    def test_failed_deletion_is_reported(self):
+        self.responses = [make_response(500, {"error": "Unavailable"})]
+
+        with self.assertLogs("eosc_publisher", level="ERROR"):
+            result = self.run_publisher(
+                lambda publisher: publisher.delete_eosc_resource("r1")
+            )
+
+        self.assertIsNone(result)
+
+    @patch("eosc_publisher.provider_utils.construct_provider_payload")
+    def test_unchanged_provider_is_not_pushed(self, mock_construct):
+        mock_construct.return_value = {"id": "p1", "name": "Customer", "users": []}
+        self.responses = [make_response(200, {"id": "p1", "name": "Customer"})]
+        existing_provider = {"id": "p1", "users": []}
+        waldur_customer = {"uuid": "c1", "name": "Customer", "abbreviation": "p1"}
+
+        def sync(publisher):
+            return publisher.sync_eosc_provider(
+                waldur_customer, existing_provider, {"description": ""}
+            )
+
+        self.run_publisher(sync)
+        methods = [call[0] for call in self.get_calls(http_utils.PROVIDER_PORTAL)]
+        self.assertEqual(["put"], methods)
+
+        provider = self.run_publisher(sync)
+        self.assertEqual([], self.get_calls(http_utils.PROVIDER_PORTAL))
+        self.assertIs(existing_provider, provider)
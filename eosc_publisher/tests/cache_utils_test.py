@@ -0,0 +1,108 @@
+import math
+import unittest
+from unittest.mock import Mock, patch
+
+from eosc_publisher import cache_utils
+
+
+class TestPushedPayloads(unittest.TestCase):
+    def setUp(self):
+        self.pushed_payloads = cache_utils.PushedPayloads(ttl=60)
+        self.payload = {"name": "Compute", "tags": ["a", "b"], "id": "compute"}
+
+    def test_hash_does_not_depend_on_key_order(self):
+        self.assertEqual(
+            cache_utils.get_payload_hash({"a": 1, "b": {"c": 2, "d": 3}}),
+            cache_utils.get_payload_hash({"b": {"d": 3, "c": 2}, "a": 1}),
+        )
+
+    def test_same_payload_is_unchanged(self):
+        self.pushed_payloads.remember(cache_utils.RESOURCE, "compute", self.payload)
+
+        self.assertTrue(
+            self.pushed_payloads.is_unchanged(
+                cache_utils.RESOURCE, "compute", dict(self.payload)
+            )
+        )
+        self.assertFalse(
+            self.pushed_payloads.is_unchanged(
+                cache_utils.RESOURCE, "compute", dict(self.payload, name="CPU")
+            )
+        )
+        self.assertFalse(
+            self.pushed_payloads.is_unchanged(
+                cache_utils.PROVIDER, "compute", self.payload
+            )
+        )
+        self.assertEqual(1, self.pushed_payloads.skipped)
+
+    def test_forgotten_payload_is_pushed_again(self):
+        self.pushed_payloads.remember(cache_utils.RESOURCE, "compute", self.payload)
+        self.pushed_payloads.forget(cache_utils.RESOURCE, "compute")
+
+        self.assertFalse(
+            self.pushed_payloads.is_unchanged(
+                cache_utils.RESOURCE, "compute", self.payload
+            )
+        )
+
+    @patch("eosc_publisher.cache_utils.time")
+    def test_expired_payload_is_pushed_again(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.pushed_payloads.remember(cache_utils.RESOURCE, "compute", self.payload)
+        mock_time.monotonic.return_value = 1061
+
+        self.assertFalse(
+            self.pushed_payloads.is_unchanged(
+                cache_utils.RESOURCE, "compute", self.payload
+            )
+        )
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache_utils.TTLCache(ttl=60)
+        self.load = Mock(return_value={"WALDUR_CORE": {}})
+
+    def test_value_is_loaded_once(self):
+        self.cache.get_or_load("configuration", self.load)
+        value = self.cache.get_or_load("configuration", self.load)
+
+        self.assertEqual({"WALDUR_CORE": {}}, value)
+        self.load.assert_called_once()
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1}, self.cache.get_stats())
+
+    @patch("eosc_publisher.cache_utils.time")
+    def test_expired_value_is_loaded_again(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.cache.get_or_load("configuration", self.load)
+        mock_time.monotonic.return_value = 1061
+        self.cache.get_or_load("configuration", self.load)
+
+        self.assertEqual(2, self.load.call_count)
+
+    def test_invalidated_value_is_loaded_again(self):
+        self.cache.get_or_load("configuration", self.load)
+        self.cache.invalidate()
+        self.cache.get_or_load("configuration", self.load)
+
+        self.assertEqual(2, self.load.call_count)
+
+    def test_least_recently_used_value_is_evicted(self):
+        cache = cache_utils.TTLCache(ttl=math.inf, maxsize=2)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.get("first")
+        cache.set("third", 3)
+
+        self.assertEqual(1, cache.get("first"))
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(2, cache.get_stats()["size"])
+
+    def test_key_locks_are_dropped_after_load(self):
+        for index in range(10):
+            self.cache.get_or_load(index, self.load)
+        with self.assertRaises(Exception):
+            self.cache.get_or_load("failed", Mock(side_effect=Exception("Unavailable")))
+
+        self.assertEqual({}, self.cache._key_locks)
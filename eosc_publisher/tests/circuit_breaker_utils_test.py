@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher import circuit_breaker_utils
+
+
+@patch("eosc_publisher.circuit_breaker_utils.time")
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = circuit_breaker_utils.CircuitBreaker(
+            "test", failure_threshold=3, reset_timeout=60
+        )
+
+    def open_circuit(self):
+        for _ in range(3):
+            self.breaker.before_request()
+            self.breaker.record_failure()
+
+    def test_circuit_is_opened_after_failures_in_a_row(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.breaker.record_failure()
+        self.breaker.record_status(200)
+        self.assertEqual(circuit_breaker_utils.CLOSED, self.breaker.state)
+
+        self.open_circuit()
+
+        self.assertEqual(circuit_breaker_utils.OPEN, self.breaker.state)
+        self.assertRaises(
+            circuit_breaker_utils.CircuitOpenError, self.breaker.before_request
+        )
+        self.assertEqual(1, self.breaker.get_stats()["rejected"])
+
+    def test_single_probe_closes_circuit(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.open_circuit()
+
+        mock_time.monotonic.return_value = 1060
+        self.breaker.before_request()
+        self.assertEqual(circuit_breaker_utils.HALF_OPEN, self.breaker.state)
+        # Only one request is let through while the probe is in flight
+        self.assertRaises(
+            circuit_breaker_utils.CircuitOpenError, self.breaker.before_request
+        )
+
+        self.breaker.record_status(404)
+        self.assertEqual(circuit_breaker_utils.CLOSED, self.breaker.state)
+        self.breaker.before_request()
+
+    def test_unrecorded_probe_is_replaced(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.open_circuit()
+
+        mock_time.monotonic.return_value = 1060
+        self.breaker.before_request()
+        mock_time.monotonic.return_value = 1119
+        self.assertRaises(
+            circuit_breaker_utils.CircuitOpenError, self.breaker.before_request
+        )
+
+        mock_time.monotonic.return_value = 1120
+        self.breaker.before_request()
+        self.assertEqual(circuit_breaker_utils.HALF_OPEN, self.breaker.state)
+
+    def test_failed_probe_reopens_circuit(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        self.open_circuit()
+
+        mock_time.monotonic.return_value = 1060
+        self.breaker.before_request()
+        self.breaker.record_status(502)
+
+        self.assertEqual(circuit_breaker_utils.OPEN, self.breaker.state)
+        self.assertRaises(
+            circuit_breaker_utils.CircuitOpenError, self.breaker.before_request
+        )
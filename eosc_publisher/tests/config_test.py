@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher.config import MissingSettingError, Settings
+
+
+class TestSettings(unittest.TestCase):
+    def test_settings_are_read_on_first_use(self):
+        settings = Settings()
+        with patch.dict(os.environ, {"EOSC_CUSTOMER_WORKERS": "3"}):
+            self.assertEqual(3, settings.EOSC_CUSTOMER_WORKERS)
+        with patch.dict(os.environ, {"EOSC_CUSTOMER_WORKERS": "5"}):
+            self.assertEqual(3, settings.EOSC_CUSTOMER_WORKERS)
+            settings.reload()
+            self.assertEqual(5, settings.EOSC_CUSTOMER_WORKERS)
+
+    def test_missing_settings_are_reported(self):
+        settings = Settings()
+        with patch.dict(os.environ, {"WALDUR_URL": "", "WALDUR_TOKEN": ""}):
+            with self.assertRaises(MissingSettingError):
+                settings.WALDUR_API_URL
+            with self.assertRaisesRegex(
+                MissingSettingError, "WALDUR_TOKEN.*WALDUR_URL"
+            ):
+                settings.validate()
+
+    def test_webhook_token_is_required_by_listener(self):
+        settings = Settings()
+        with patch.dict(
+            os.environ, {"EOSC_WEBHOOK_PORT": "8001", "EOSC_WEBHOOK_TOKEN": ""}
+        ):
+            with self.assertRaisesRegex(MissingSettingError, "EOSC_WEBHOOK_TOKEN"):
+                settings.validate()
+        with patch.dict(
+            os.environ, {"EOSC_WEBHOOK_PORT": "0", "EOSC_WEBHOOK_TOKEN": ""}
+        ):
+            settings.reload()
+            self.assertEqual("", settings.EOSC_WEBHOOK_TOKEN)
+
+    def test_catalogue_urls_include_catalogue_id(self):
+        settings = Settings()
+        with patch.dict(os.environ, {"EOSC_CATALOGUE_ID": "eosc"}):
+            self.assertEqual("/api/catalogue/eosc/provider/", settings.PROVIDER_URL)
+
+    @patch("socket.gethostname", return_value="eosc-publisher-2")
+    def test_shard_index_is_statefulset_ordinal(self, mock_gethostname):
+        settings = Settings()
+        with patch.dict(os.environ, {"EOSC_SHARD_COUNT": "3", "EOSC_SHARD_INDEX": ""}):
+            self.assertEqual(2, settings.EOSC_SHARD_INDEX)
+            settings.reload()
+            mock_gethostname.return_value = "eosc-publisher"
+            with self.assertRaises(MissingSettingError):
+                settings.EOSC_SHARD_INDEX
+        with patch.dict(os.environ, {"EOSC_SHARD_COUNT": "2", "EOSC_SHARD_INDEX": "2"}):
+            settings.reload()
+            with self.assertRaisesRegex(MissingSettingError, "out of the range"):
+                settings.validate()
+
+    def test_modules_are_imported_without_environment(self):
+        environment = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": os.getcwd()}
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import eosc_publisher.provider_utils, eosc_publisher.marketplace_utils",
+            ],
+            env=environment,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(0, result.returncode, result.stderr)
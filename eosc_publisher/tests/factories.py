@@ -0,0 +1,8 @@
+def make_offering(customer_uuid, name, state="Active"):
+    return {
+        "uuid": "offering-" + name,
+        "name": name,
+        "state": state,
+        "customer_uuid": customer_uuid,
+        "customer_name": "Customer " + customer_uuid,
+    }
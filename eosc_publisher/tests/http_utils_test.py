@@ -0,0 +1,127 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+import requests
+
+from eosc_publisher import circuit_breaker_utils, http_utils, settings
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    throttled_requests = 0
+    throttled_status = 429
+
+    def do_GET(self):
+        body = self.headers.get("X-User-Token", "").encode()
+        if Handler.throttled_requests:
+            Handler.throttled_requests -= 1
+            self.send_response(Handler.throttled_status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessions(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%s/" % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        Handler.throttled_requests = 0
+        Handler.throttled_status = 429
+        http_utils.close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_is_shared_per_upstream(self):
+        self.assertIs(
+            http_utils.get_session(http_utils.MARKETPLACE),
+            http_utils.get_session(http_utils.MARKETPLACE),
+        )
+        self.assertIsNot(
+            http_utils.get_session(http_utils.MARKETPLACE),
+            http_utils.get_session(http_utils.PROVIDER_PORTAL),
+        )
+
+    def test_connection_is_reused(self):
+        session = http_utils.get_session(http_utils.MARKETPLACE)
+        for _ in range(3):
+            response = session.get(self.url)
+            self.assertEqual(settings.EOSC_MARKETPLACE_OFFERING_TOKEN, response.text)
+
+        stats = http_utils.get_connection_stats()[http_utils.MARKETPLACE]
+        self.assertEqual({"requests": 3, "connections": 1, "reused": 2}, stats)
+
+    def test_throttled_request_is_retried(self):
+        Handler.throttled_requests = 2
+        bucket = http_utils.rate_limit_utils.get_bucket(http_utils.MARKETPLACE)
+        throttled = bucket.throttled
+
+        response = http_utils.get_session(http_utils.MARKETPLACE).get(self.url)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(throttled + 2, bucket.throttled)
+
+    def test_throttling_does_not_open_circuit(self):
+        Handler.throttled_requests = 100
+        Handler.throttled_status = 503
+        breaker = circuit_breaker_utils.CircuitBreaker("test", failure_threshold=5)
+        bucket = http_utils.rate_limit_utils.TokenBucket("test", 1000)
+
+        with patch.object(
+            circuit_breaker_utils, "get_breaker", return_value=breaker
+        ), patch.object(
+            http_utils.rate_limit_utils, "get_bucket", return_value=bucket
+        ), patch.object(
+            settings, "EOSC_MAX_RETRIES", 4
+        ):
+            session = http_utils.get_session(http_utils.MARKETPLACE)
+            for _ in range(2):
+                self.assertEqual(503, session.get(self.url).status_code)
+
+        self.assertEqual(10, bucket.throttled)
+        self.assertEqual(circuit_breaker_utils.CLOSED, breaker.state)
+        self.assertEqual(0, breaker.failures)
+
+    def test_open_circuit_fails_fast(self):
+        breaker = circuit_breaker_utils.CircuitBreaker("test", failure_threshold=1)
+        breaker.record_failure()
+
+        with patch.object(circuit_breaker_utils, "get_breaker", return_value=breaker):
+            session = http_utils.get_session(http_utils.MARKETPLACE)
+            with self.assertRaises(circuit_breaker_utils.CircuitOpenError):
+                session.get(self.url)
+
+        stats = http_utils.get_connection_stats()[http_utils.MARKETPLACE]
+        self.assertEqual(0, stats["requests"])
+
+    def test_probe_failing_with_any_error_reopens_circuit(self):
+        breaker = circuit_breaker_utils.CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout=0
+        )
+        breaker.record_failure()
+
+        with patch.object(
+            circuit_breaker_utils, "get_breaker", return_value=breaker
+        ), patch.object(
+            requests.Session,
+            "request",
+            side_effect=requests.exceptions.ChunkedEncodingError("Broken"),
+        ):
+            session = http_utils.get_session(http_utils.MARKETPLACE)
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                session.get(self.url)
+
+        self.assertEqual(circuit_breaker_utils.OPEN, breaker.state)
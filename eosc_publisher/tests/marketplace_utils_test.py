@@ -0,0 +1,146 @@
+import math
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher import cache_utils, marketplace_utils, state_utils
+
+
+def make_plan(uuid, name, **kwargs):
+    return dict({"uuid": uuid, "name": name, "description": name}, **kwargs)
+
+
+class TestOfferChanges(unittest.TestCase):
+    def setUp(self):
+        state_utils.get_state_store().clear()
+        self.waldur_offering = {
+            "name": "Compute",
+            "components": [],
+            "plans": [
+                make_plan("plan-small", "Small"),
+                make_plan("plan-large", "Large"),
+                make_plan("plan-old", "Old", archived=True),
+            ],
+        }
+
+    def make_offer(self, offer_id, plan, **kwargs):
+        offer = marketplace_utils.construct_offer_payload(
+            plan["name"],
+            plan["description"],
+            marketplace_utils.construct_offer_parameters(self.waldur_offering, plan),
+        )
+        offer.update(id=offer_id, **kwargs)
+        return offer
+
+    def get_actions(self, eosc_offers):
+        return [
+            (action, plan and plan["uuid"], eosc_offer and eosc_offer["id"])
+            for action, plan, eosc_offer, _ in marketplace_utils.get_offer_changes(
+                eosc_offers, self.waldur_offering
+            )
+        ]
+
+    def test_all_missing_plans_are_created(self):
+        self.assertEqual(
+            [
+                (marketplace_utils.CREATE_OFFER, "plan-small", None),
+                (marketplace_utils.CREATE_OFFER, "plan-large", None),
+            ],
+            self.get_actions([]),
+        )
+
+    def test_up_to_date_offers_are_not_changed(self):
+        plans = self.waldur_offering["plans"]
+        eosc_offers = [
+            # The fields added by the Marketplace are ignored
+            self.make_offer(1, plans[0], status="published"),
+            self.make_offer(2, plans[1]),
+        ]
+
+        self.assertEqual([], self.get_actions(eosc_offers))
+
+    def test_renamed_plan_is_updated_and_unknown_offers_are_deleted(self):
+        plans = self.waldur_offering["plans"]
+        eosc_offers = [
+            self.make_offer(1, make_plan("plan-small", "Tiny")),
+            self.make_offer(2, plans[1]),
+            self.make_offer(3, plans[1]),
+            self.make_offer(4, plans[2]),
+        ]
+        state_utils.get_state_store().set_offer_id("plan-small", 1)
+
+        self.assertEqual(
+            [
+                (marketplace_utils.UPDATE_OFFER, "plan-small", 1),
+                (marketplace_utils.DELETE_OFFER, None, 3),
+                (marketplace_utils.DELETE_OFFER, None, 4),
+            ],
+            self.get_actions(eosc_offers),
+        )
+
+    def test_report_counts_calls(self):
+        changes = [
+            (marketplace_utils.CREATE_OFFER, None, None, None),
+            (marketplace_utils.UPDATE_OFFER, None, None, None),
+            (marketplace_utils.DELETE_OFFER, None, None, None),
+        ]
+
+        self.assertEqual(
+            {"create": 1, "update": 0, "delete": 1, "failed": 1, "calls": 4},
+            marketplace_utils.get_reconciliation_report(changes, [True, False, True]),
+        )
+
+
+class TestParameterSchema(unittest.TestCase):
+    def setUp(self):
+        patcher = patch(
+            "eosc_publisher.cache_utils.parameter_schemas",
+            cache_utils.TTLCache(ttl=math.inf),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.waldur_offering = {
+            "name": "Compute",
+            "components": [
+                {
+                    "billing_type": "limit",
+                    "type": "ram",
+                    "name": "RAM",
+                    "description": "",
+                    "measured_unit": "GB",
+                    "min_value": 1024,
+                    "max_value": None,
+                }
+            ],
+        }
+
+    def test_schema_is_compiled_once_for_all_plans(self):
+        small = marketplace_utils.construct_offer_parameters(
+            self.waldur_offering, {"name": "Small"}
+        )
+        large = marketplace_utils.construct_offer_parameters(
+            self.waldur_offering, {"name": "Large"}
+        )
+
+        self.assertEqual("Amount of RAM in Small.", small[1]["description"])
+        self.assertEqual("Amount of RAM in Large.", large[1]["description"])
+        self.assertEqual(
+            {"minimum": 1, "maximum": 0},
+            {key: large[1]["config"][key] for key in ["minimum", "maximum"]},
+        )
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "size": 1},
+            cache_utils.parameter_schemas.get_stats(),
+        )
+
+    def test_schema_is_compiled_again_when_components_change(self):
+        marketplace_utils.construct_offer_parameters(
+            self.waldur_offering, {"name": "Small"}
+        )
+        self.waldur_offering["components"][0]["max_value"] = 4096
+
+        parameters = marketplace_utils.construct_offer_parameters(
+            self.waldur_offering, {"name": "Small"}
+        )
+
+        self.assertEqual(4, parameters[1]["config"]["maximum"])
+        self.assertEqual(2, cache_utils.parameter_schemas.get_stats()["size"])
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from eosc_publisher import (
+    OFFER_LIST_URL,
+    OFFER_URL,
+    cache_utils,
+    metrics_utils,
+    provider_utils,
+    settings,
+)
+
+
+def get_change_count(object_type, action):
+    return (
+        REGISTRY.get_sample_value(
+            "eosc_publisher_sync_changes_total",
+            {"object": object_type, "action": action},
+        )
+        or 0
+    )
+
+
+class TestEndpoints(unittest.TestCase):
+    def test_marketplace_urls_are_templated(self):
+        self.assertEqual(
+            "/api/v1/resources/{id}/offers/",
+            metrics_utils.get_endpoint(
+                settings.EOSC_MARKETPLACE_BASE_URL.rstrip("/")
+                + OFFER_LIST_URL % "res-1"
+            ),
+        )
+        self.assertEqual(
+            "/api/v1/resources/{id}/offers/{id}",
+            metrics_utils.get_endpoint(
+                settings.EOSC_MARKETPLACE_BASE_URL.rstrip("/")
+                + OFFER_URL % ("res-1", 10)
+            ),
+        )
+
+    def test_catalogue_urls_are_templated(self):
+        base_url = settings.EOSC_PROVIDER_PORTAL_BASE_URL.rstrip("/")
+        self.assertEqual(
+            settings.PROVIDER_RESOURCE_URL,
+            metrics_utils.get_endpoint(base_url + settings.PROVIDER_RESOURCE_URL),
+        )
+        self.assertEqual(
+            settings.PROVIDER_RESOURCE_URL + "{id}",
+            metrics_utils.get_endpoint(
+                base_url + settings.PROVIDER_RESOURCE_URL + "res-1"
+            ),
+        )
+        self.assertEqual(
+            "resource/all",
+            metrics_utils.get_endpoint(base_url + "/resource/all?from=0&quantity=100"),
+        )
+
+    def test_waldur_ids_are_replaced(self):
+        self.assertEqual(
+            "/api/customers/{id}/",
+            metrics_utils.get_endpoint(
+                "http://waldur.example.com/api/customers/a4b5c6d7e8f90123456789abcdef0123/"
+            ),
+        )
+        self.assertTrue(
+            metrics_utils.get_endpoint(
+                settings.WALDUR_API_URL + "configuration/"
+            ).endswith("configuration/")
+        )
+
+
+class TestChanges(unittest.TestCase):
+    def test_offer_changes_are_counted(self):
+        def get_count(action):
+            return get_change_count(metrics_utils.OFFER, action)
+
+        created, deleted = get_count("create"), get_count("delete")
+
+        metrics_utils.count_offer_changes(
+            {"create": 2, "update": 0, "delete": 1, "failed": 0, "calls": 4}
+        )
+
+        self.assertEqual(created + 2, get_count("create"))
+        self.assertEqual(deleted + 1, get_count("delete"))
+
+    @patch("eosc_publisher.provider_utils.update_resource")
+    @patch("eosc_publisher.provider_utils.get_resource_by_id")
+    @patch("eosc_publisher.provider_utils.get_provider_token")
+    @patch("eosc_publisher.provider_utils.construct_resource_payload")
+    def test_unchanged_resource_is_counted_as_skipped(
+        self, mock_construct, mock_token, mock_get_resource, mock_update_resource
+    ):
+        mock_construct.return_value = {"name": "Resource"}
+        pushed_payloads = cache_utils.PushedPayloads(ttl=60)
+        updated = get_change_count(metrics_utils.RESOURCE, metrics_utils.UPDATE)
+        skipped = get_change_count(metrics_utils.RESOURCE, metrics_utils.SKIP)
+
+        with patch.object(cache_utils, "pushed_payloads", pushed_payloads):
+            provider_utils.update_eosc_resource({"name": "Offering"}, "p1", "r1")
+            pushed_payloads.remember(cache_utils.RESOURCE, "r1", {"name": "Resource"})
+            provider_utils.update_eosc_resource({"name": "Offering"}, "p1", "r1")
+
+        mock_update_resource.assert_called_once()
+        self.assertEqual(
+            updated + 1, get_change_count(metrics_utils.RESOURCE, metrics_utils.UPDATE)
+        )
+        self.assertEqual(
+            skipped + 1, get_change_count(metrics_utils.RESOURCE, metrics_utils.SKIP)
+        )
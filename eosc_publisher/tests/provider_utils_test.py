@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from eosc_publisher import provider_utils
+
+
+def make_catalogue(total, max_quantity=None, reported_total=None):
+    resources = [{"id": "id-%s" % i, "name": "Resource %s" % i} for i in range(total)]
+
+    def get(url, headers, params):
+        quantity = params["quantity"]
+        if max_quantity:
+            quantity = min(quantity, max_quantity)
+        start = params["from"]
+        end = start + quantity
+        results = resources[start:end]
+        response = Mock(status_code=200)
+        response.json.return_value = {
+            "total": reported_total or total,
+            "from": params["from"],
+            "to": params["from"] + len(results),
+            "results": results,
+        }
+        return response
+
+    return get
+
+
+@patch("eosc_publisher.provider_utils.get_session")
+class TestCatalogueFetch(unittest.TestCase):
+    def test_all_pages_are_fetched(self, mock_get_session):
+        mock_get_session.return_value.get.side_effect = make_catalogue(250)
+
+        resources = provider_utils.get_all_resources_from_catalogue("token")
+
+        self.assertEqual(250, len(resources))
+        self.assertEqual("id-249", resources["Resource 249"])
+        self.assertEqual(3, mock_get_session.return_value.get.call_count)
+
+    def test_page_size_limited_by_portal_is_used(self, mock_get_session):
+        mock_get_session.return_value.get.side_effect = make_catalogue(
+            250, max_quantity=50
+        )
+
+        resources = provider_utils.get_all_resources_from_catalogue("token")
+
+        self.assertEqual(250, len(resources))
+        self.assertEqual(5, mock_get_session.return_value.get.call_count)
+
+    def test_incomplete_catalogue_is_discarded(self, mock_get_session):
+        mock_get_session.return_value.get.side_effect = make_catalogue(
+            150, reported_total=160
+        )
+
+        with self.assertLogs("eosc_publisher", level="ERROR"):
+            resources = provider_utils.get_all_resources_from_catalogue("token")
+
+        self.assertEqual([], resources)
+
+    def test_failed_page_fetch_is_reported(self, mock_get_session):
+        mock_get_session.return_value.get.return_value = Mock(
+            status_code=500, text="Internal error"
+        )
+
+        with self.assertLogs("eosc_publisher", level="ERROR"):
+            resources = provider_utils.get_all_resources_from_catalogue("token")
+
+        self.assertEqual([], resources)
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher import rate_limit_utils, settings
+
+
+@patch("eosc_publisher.rate_limit_utils.time")
+class TestTokenBucket(unittest.TestCase):
+    def test_requests_over_burst_wait(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        bucket = rate_limit_utils.TokenBucket("test", rate=2)
+
+        delays = [bucket.reserve() for _ in range(4)]
+
+        self.assertEqual([0, 0, 0.5, 1], delays)
+
+    def test_rate_is_lowered_on_throttling_and_recovers(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        bucket = rate_limit_utils.TokenBucket("test", rate=10)
+
+        bucket.throttle()
+        bucket.throttle()
+        self.assertEqual(2.5, bucket.rate)
+
+        for _ in range(100):
+            bucket.recover()
+        self.assertEqual(10, bucket.rate)
+
+    def test_requests_wait_for_retry_after(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        bucket = rate_limit_utils.TokenBucket("test", rate=10)
+
+        bucket.throttle(retry_after=30)
+
+        self.assertEqual(30, bucket.reserve())
+
+
+class TestRetries(unittest.TestCase):
+    def test_retry_after_is_parsed(self):
+        self.assertEqual(5, rate_limit_utils.parse_retry_after("5"))
+        self.assertEqual(
+            0, rate_limit_utils.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT")
+        )
+        self.assertIsNone(rate_limit_utils.parse_retry_after("soon"))
+
+    def test_backoff_is_exponential_with_jitter(self):
+        for attempt in range(10):
+            delay = rate_limit_utils.get_retry_delay(attempt)
+            self.assertLessEqual(
+                delay, min(rate_limit_utils.MAX_RETRY_DELAY, 2**attempt)
+            )
+
+    def test_only_idempotent_requests_are_retried(self):
+        self.assertIsNotNone(
+            rate_limit_utils.handle_response_status("test", "get", 503, {}, 0)
+        )
+        self.assertIsNone(
+            rate_limit_utils.handle_response_status("test", "post", 503, {}, 0)
+        )
+        self.assertIsNone(
+            rate_limit_utils.handle_response_status("test", "get", 404, {}, 0)
+        )
+        self.assertIsNone(
+            rate_limit_utils.handle_response_status(
+                "test", "get", 503, {}, settings.EOSC_MAX_RETRIES
+            )
+        )
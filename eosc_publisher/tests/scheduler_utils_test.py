@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher import scheduler_utils
+
+
+@patch("eosc_publisher.scheduler_utils.metrics_utils.get_write_count")
+@patch("eosc_publisher.scheduler_utils.time")
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.report = {"offerings": 1, "customers": 1, "failed_customers": []}
+
+    def build_scheduler(self, mock_time):
+        mock_time.monotonic.return_value = 0
+        return scheduler_utils.Scheduler(
+            period=60, jitter=0, max_period=240, retry_delay=10, max_retries=2
+        )
+
+    def run_cycle(self, scheduler, mock_time, duration, report):
+        scheduler.start_cycle()
+        mock_time.monotonic.return_value += duration
+        scheduler.finish_cycle(report)
+
+    def test_period_is_measured_from_start_to_start(
+        self, mock_time, mock_get_write_count
+    ):
+        mock_get_write_count.side_effect = [0, 5]
+        scheduler = self.build_scheduler(mock_time)
+        self.assertTrue(scheduler.is_cycle_due())
+        self.run_cycle(scheduler, mock_time, 20, self.report)
+        self.assertEqual(40, scheduler.get_delay())
+
+    def test_period_grows_while_nothing_changes(self, mock_time, mock_get_write_count):
+        mock_get_write_count.return_value = 0
+        scheduler = self.build_scheduler(mock_time)
+        periods = []
+        for _ in range(4):
+            self.run_cycle(scheduler, mock_time, 0, self.report)
+            periods.append(scheduler.get_delay())
+        self.assertEqual([120, 240, 240, 240], periods)
+
+        mock_get_write_count.side_effect = [0, 1]
+        self.run_cycle(scheduler, mock_time, 0, self.report)
+        self.assertEqual(60, scheduler.get_delay())
+
+    def test_failed_customers_are_retried_with_growing_delay(
+        self, mock_time, mock_get_write_count
+    ):
+        mock_get_write_count.return_value = 0
+        scheduler = self.build_scheduler(mock_time)
+        self.run_cycle(
+            scheduler, mock_time, 0, dict(self.report, failed_customers=["c1"])
+        )
+        self.assertEqual(10, scheduler.get_delay())
+        self.assertEqual({}, scheduler.pop_due_retries())
+
+        delays = []
+        for _ in range(2):
+            mock_time.monotonic.return_value += scheduler.get_delay()
+            due = scheduler.pop_due_retries()
+            self.assertEqual(["c1"], list(due))
+            scheduler.finish_retries(due, {"c1": False})
+            delays.append(scheduler.get_delay())
+        # After the last retry the customer waits for the next cycle, which is due at 60
+        self.assertEqual([20, 30], delays)
+        self.assertEqual({}, scheduler.retries)
+
+    def test_cycle_drops_pending_retries(self, mock_time, mock_get_write_count):
+        mock_get_write_count.return_value = 0
+        scheduler = self.build_scheduler(mock_time)
+        scheduler.schedule_retry("c1", 0)
+        self.run_cycle(scheduler, mock_time, 0, None)
+        self.assertEqual({}, scheduler.retries)
+        self.assertEqual(60, scheduler.get_delay())
@@ -0,0 +1,41 @@
+import unittest
+import uuid
+from unittest.mock import patch
+
+from eosc_publisher import settings, shard_utils
+
+CUSTOMER_UUIDS = [uuid.UUID(int=index).hex for index in range(1000)]
+
+
+class TestSharding(unittest.TestCase):
+    def test_customers_are_spread_across_shards(self):
+        shards = [
+            shard_utils.get_shard(customer_uuid, 4) for customer_uuid in CUSTOMER_UUIDS
+        ]
+        for shard_index in range(4):
+            self.assertGreater(shards.count(shard_index), 200)
+
+    def test_resize_moves_customers_only_to_new_shard(self):
+        moved = [
+            shard_utils.get_shard(customer_uuid, 5)
+            for customer_uuid in CUSTOMER_UUIDS
+            if shard_utils.get_shard(customer_uuid, 4)
+            != shard_utils.get_shard(customer_uuid, 5)
+        ]
+        self.assertEqual({4}, set(moved))
+        self.assertLess(len(moved), 250)
+
+    def test_every_customer_is_handled_by_one_replica(self):
+        offerings = [
+            {"customer_uuid": customer_uuid} for customer_uuid in CUSTOMER_UUIDS
+        ]
+        handled = []
+        for shard_index in range(3):
+            with patch.object(settings, "EOSC_SHARD_INDEX", shard_index), patch.object(
+                settings, "EOSC_SHARD_COUNT", 3
+            ):
+                handled.extend(
+                    offering["customer_uuid"]
+                    for offering in shard_utils.filter_offerings(offerings)
+                )
+        self.assertEqual(sorted(CUSTOMER_UUIDS), sorted(handled))
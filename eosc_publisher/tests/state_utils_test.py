@@ -0,0 +1,55 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from eosc_publisher import settings, state_utils
+from eosc_publisher.state_utils import StateStore
+
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+
+    def test_unknown_offerings_are_omitted(self):
+        self.store.set_resource_id("offering-1", "resource-1")
+        self.store.set_resource_id("offering-2", None)
+
+        self.assertEqual(
+            {"offering-1": "resource-1", "offering-2": None},
+            self.store.get_resource_ids(["offering-1", "offering-2", "offering-3"]),
+        )
+
+    @patch.object(state_utils, "LOOKUP_CHUNK_SIZE", 2)
+    def test_offerings_are_looked_up_in_chunks(self):
+        for index in range(5):
+            self.store.set_resource_id("offering-%s" % index, "resource-%s" % index)
+
+        offering_uuids = ["offering-%s" % index for index in range(1, 7)]
+        self.assertEqual(
+            {"offering-%s" % index: "resource-%s" % index for index in range(1, 5)},
+            self.store.get_resource_ids(offering_uuids),
+        )
+
+    def test_memory_store_is_reported(self):
+        with patch.dict(os.environ, {"EOSC_STATE_DB_PATH": ""}):
+            settings.reload()
+            with self.assertLogs("eosc_publisher", level="WARNING"):
+                StateStore()
+
+    def test_ids_are_replaced(self):
+        self.store.set_provider_id("customer-1", "provider-1")
+        self.store.set_provider_id("customer-1", "provider-2")
+        self.store.set_offer_id("plan-1", 10)
+
+        self.assertEqual("provider-2", self.store.get_provider_id("customer-1"))
+        self.assertEqual("10", self.store.get_offer_id("plan-1"))
+        self.assertIsNone(self.store.get_offer_id("plan-2"))
+
+    def test_clear(self):
+        self.store.set_resource_id("offering-1", "resource-1")
+        self.store.set_value("key", "value")
+
+        self.store.clear()
+
+        self.assertEqual({}, self.store.get_resource_ids(["offering-1"]))
+        self.assertIsNone(self.store.get_value("key"))
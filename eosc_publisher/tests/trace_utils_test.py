@@ -0,0 +1,72 @@
+import glob
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from eosc_publisher import settings, trace_utils
+
+
+def sync_offering():
+    with trace_utils.span("offering", uuid="offering-uuid"):
+        pass
+
+
+def read_spans(directory):
+    [path] = glob.glob(os.path.join(directory, "trace-*.json"))
+    with open(path) as trace_file:
+        payload = json.load(trace_file)
+    return payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch.object(settings, "EOSC_TRACE_DIR", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_spans_are_nested_across_threads(self):
+        with trace_utils.trace("sync_cycle"):
+            with trace_utils.span("customer"):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    executor.submit(trace_utils.bind(sync_offering)).result()
+
+        spans = {span["name"]: span for span in read_spans(self.directory.name)}
+        self.assertEqual("", spans["sync_cycle"]["parentSpanId"])
+        self.assertEqual(
+            spans["sync_cycle"]["spanId"], spans["customer"]["parentSpanId"]
+        )
+        self.assertEqual(spans["customer"]["spanId"], spans["offering"]["parentSpanId"])
+        self.assertEqual(
+            [{"key": "uuid", "value": {"stringValue": "offering-uuid"}}],
+            spans["offering"]["attributes"],
+        )
+
+    def test_span_outside_of_trace_is_not_recorded(self):
+        with trace_utils.span("customer") as span:
+            self.assertIsNone(span)
+
+        self.assertEqual([], os.listdir(self.directory.name))
+
+
+class TestProfile(unittest.TestCase):
+    def test_requested_cycle_is_profiled_with_worker_threads(self):
+        with tempfile.TemporaryDirectory() as directory, patch.object(
+            settings, "EOSC_PROFILE_DIR", directory
+        ):
+            trace_utils.request_profile()
+            with trace_utils.profiled_cycle():
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    executor.submit(trace_utils.bind(sync_offering)).result()
+            # Only the requested cycle is profiled
+            with trace_utils.profiled_cycle():
+                pass
+
+            [path] = glob.glob(os.path.join(directory, "profile-*.prof"))
+            functions = {function for _, _, function in pstats.Stats(path).stats}
+            self.assertIn("sync_offering", functions)
@@ -0,0 +1,107 @@
+import unittest
+
+from eosc_publisher import provider_utils, validation_utils, vocabularies
+
+WALDUR_OFFERING = {
+    "uuid": "offering-uuid",
+    "name": "Offering",
+    "description": "Description",
+    "attributes": {},
+    "thumbnail": None,
+    "privacy_policy_link": "",
+    "terms_of_service_link": "",
+}
+WALDUR_CUSTOMER = {
+    "uuid": "customer-uuid",
+    "name": "Customer",
+    "abbreviation": "CU",
+    "image": None,
+    "address": "Tallinn Street 1",
+    "postal": "12345",
+    "country": "EE",
+    "homepage": "",
+    "email": "customer@example.com",
+    "division": None,
+}
+HOMEPORT_URL = "https://waldur.example.com/"
+
+
+class TestVocabularies(unittest.TestCase):
+    def test_children_are_mapped_to_parents(self):
+        self.assertEqual(
+            "scientific_domain-generic",
+            vocabularies.SCIENTIFIC_SUBDOMAIN_DOMAINS[
+                "scientific_subdomain-generic-generic"
+            ],
+        )
+        categories = vocabularies.categories_and_subcategories_dict
+        for category, subcategories in categories.items():
+            for subcategory in subcategories:
+                self.assertEqual(
+                    category, vocabularies.SUBCATEGORY_CATEGORIES[subcategory]
+                )
+
+
+class TestResourcePayload(unittest.TestCase):
+    def setUp(self):
+        self.payload = provider_utils.construct_resource_payload(
+            WALDUR_OFFERING, "provider-id", homeport_url=HOMEPORT_URL
+        )
+
+    def test_constructed_payload_is_valid(self):
+        self.assertEqual([], validation_utils.validate_resource_payload(self.payload))
+
+    def test_subcategory_of_other_category_is_reported(self):
+        self.payload["categories"] = [
+            {
+                "category": "category-aggregators_and_integrators-aggregators_and_integrators",
+                "subcategory": "subcategory-applications-applications-other",
+            }
+        ]
+        errors = validation_utils.validate_resource_payload(self.payload)
+        self.assertEqual(1, len(errors))
+        self.assertIn("not belonging to", errors[0])
+
+    def test_unknown_terms_are_reported(self):
+        self.payload["accessModes"] = ["access_mode-unknown"]
+        self.payload["geographicalAvailabilities"] = ["XX", "WW"]
+        self.payload["helpdeskEmail"] = "support"
+        with self.assertRaises(validation_utils.PayloadValidationError) as context:
+            validation_utils.check_resource_payload(self.payload)
+        self.assertEqual(3, len(context.exception.errors))
+
+
+class TestProviderPayload(unittest.TestCase):
+    def test_constructed_payload_is_valid(self):
+        payload = provider_utils.construct_provider_payload(
+            WALDUR_CUSTOMER,
+            homeport_url=HOMEPORT_URL,
+            service_provider={"description": "Description"},
+        )
+        self.assertEqual([], validation_utils.validate_provider_payload(payload))
+
+    def test_customer_without_country_is_valid(self):
+        for country in ("", None):
+            payload = provider_utils.construct_provider_payload(
+                dict(WALDUR_CUSTOMER, country=country),
+                homeport_url=HOMEPORT_URL,
+                service_provider={"description": "Description"},
+            )
+            self.assertEqual(["OT"], payload["participatingCountries"])
+
+    def test_homepage_without_scheme_is_normalised(self):
+        payload = provider_utils.construct_provider_payload(
+            dict(WALDUR_CUSTOMER, homepage="acme.org"),
+            homeport_url=HOMEPORT_URL,
+            service_provider={"description": "Description"},
+        )
+        self.assertEqual("https://acme.org", payload["website"])
+
+    def test_invalid_customer_fails_locally(self):
+        customer = dict(WALDUR_CUSTOMER, country="Estonia", email="customer")
+        with self.assertRaises(validation_utils.PayloadValidationError):
+            provider_utils.construct_provider_payload(
+                customer,
+                homeport_url=HOMEPORT_URL,
+                service_provider={"description": "Description"},
+            )
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from eosc_publisher import waldur_utils
+
+WALDUR_OFFERING = {
+    "uuid": "offering-uuid",
+    "name": "Offering",
+    "state": "Active",
+    "customer_uuid": "customer-uuid",
+    "customer_name": "Customer",
+    "description": "Description",
+    "full_description": "Full description",
+    "attributes": {"vpc_Support_email": "support@example.com", "cpu": 2},
+    "plans": [{"uuid": "plan-uuid", "name": "Plan", "prices": {"cpu": 1}}],
+    "components": [],
+}
+
+
+def make_response(page, next_url=None):
+    response = MagicMock(status_code=200, links={})
+    response.json.return_value = page
+    if next_url:
+        response.links = {"next": {"url": next_url}}
+    return response
+
+
+class TestOfferingRecord(unittest.TestCase):
+    def test_only_read_fields_are_kept(self):
+        record = waldur_utils.OfferingRecord(WALDUR_OFFERING)
+
+        self.assertEqual("Offering", record["name"])
+        self.assertIsNone(record["thumbnail"])
+        self.assertEqual(
+            {"vpc_Support_email": "support@example.com"}, record["attributes"]
+        )
+        self.assertEqual([{"uuid": "plan-uuid", "name": "Plan"}], record["plans"])
+        self.assertIsNone(record.get("full_description"))
+        with self.assertRaises(KeyError):
+            record["full_description"]
+
+
+class TestOfferingPages(unittest.TestCase):
+    @patch.object(waldur_utils.RateLimitedWaldurClient, "_send")
+    def test_offerings_are_fetched_page_by_page(self, mock_send):
+        mock_send.side_effect = [
+            make_response([WALDUR_OFFERING], next_url="https://waldur/?page=2"),
+            make_response([dict(WALDUR_OFFERING, uuid="second-uuid")]),
+        ]
+        waldur_client = waldur_utils.RateLimitedWaldurClient("https://waldur/", "token")
+
+        offerings = waldur_client.iter_marketplace_provider_offerings(
+            {"state": "Active"}
+        )
+        self.assertEqual("offering-uuid", next(offerings)["uuid"])
+        self.assertEqual(1, mock_send.call_count)
+        self.assertEqual(["second-uuid"], [offering["uuid"] for offering in offerings])
+
+        first_request_params = mock_send.call_args_list[0][1]["params"]
+        self.assertEqual({"page_size": 200, "state": "Active"}, first_request_params)
+        self.assertNotIn("params", mock_send.call_args_list[1][1])
+
+
+class TestWaldurRequests(unittest.TestCase):
+    @patch("eosc_publisher.waldur_utils.verify_ssl", False)
+    @patch("eosc_publisher.waldur_utils.http_utils.get_session")
+    def test_ssl_verification_can_be_disabled(self, mock_get_session):
+        waldur_client = waldur_utils.RateLimitedWaldurClient("https://waldur/", "token")
+
+        waldur_client._send("get", "https://waldur/customers/")
+
+        self.assertFalse(mock_get_session.return_value.request.call_args[1]["verify"])
@@ -0,0 +1,112 @@
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+from eosc_publisher import scheduler_utils, settings, webhook_utils
+
+
+class TestWebhook(unittest.TestCase):
+    def setUp(self):
+        webhook_utils.get_offering_customer_uuid.cache_clear()
+        self.scheduler = scheduler_utils.Scheduler(period=600, debounce=5)
+
+    def send(self, event, token=None):
+        return webhook_utils.handle_event(self.scheduler, json.dumps(event), token)
+
+    def test_burst_of_changes_is_synced_once(self):
+        results = [self.send({"context": {"customer_uuid": "c1"}}) for _ in range(3)]
+
+        self.assertEqual(
+            [webhook_utils.QUEUED, webhook_utils.DUPLICATE, webhook_utils.DUPLICATE],
+            results,
+        )
+        self.assertEqual(["c1"], list(self.scheduler.retries))
+        self.assertTrue(self.scheduler.wakeup.is_set())
+        self.assertEqual({}, self.scheduler.pop_due_retries())
+
+    @patch("eosc_publisher.waldur_utils.get_waldur_client.instance")
+    def test_offering_event_schedules_its_provider(self, mock_waldur_client):
+        mock_waldur_client.get_marketplace_provider_offering.return_value = {
+            "uuid": "o1",
+            "customer_uuid": "c1",
+        }
+        # The customer of a resource event is the consumer of the offering
+        event = {"context": {"offering_uuid": "o1", "customer_uuid": "consumer"}}
+
+        self.send(event)
+        self.send(event)
+
+        self.assertEqual(["c1"], list(self.scheduler.retries))
+        mock_waldur_client.get_marketplace_provider_offering.assert_called_once_with(
+            "o1"
+        )
+
+    @patch.object(settings, "EOSC_WEBHOOK_SHARD_URL", "")
+    @patch("eosc_publisher.shard_utils.is_own_customer", return_value=False)
+    def test_event_of_other_shard_is_rejected(self, mock_is_own_customer):
+        result = self.send({"customer_uuid": "c1"})
+
+        self.assertEqual(webhook_utils.MISDIRECTED, result)
+        self.assertEqual({}, self.scheduler.retries)
+
+    @patch.object(settings, "EOSC_WEBHOOK_SHARD_URL", "http://publisher-{shard}:8001/")
+    @patch("eosc_publisher.shard_utils.get_shard", return_value=2)
+    @patch("eosc_publisher.shard_utils.is_own_customer", return_value=False)
+    @patch("eosc_publisher.webhook_utils.requests.post")
+    def test_event_of_other_shard_is_forwarded(
+        self, mock_post, mock_is_own_customer, mock_get_shard
+    ):
+        mock_post.return_value.json.return_value = {"result": "queued"}
+        body = json.dumps({"customer_uuid": "c1"})
+
+        result = webhook_utils.handle_event(self.scheduler, body, "secret")
+        forwarded_result = webhook_utils.handle_event(
+            self.scheduler, body, "secret", forwarded=True
+        )
+
+        self.assertEqual(webhook_utils.QUEUED, result)
+        self.assertEqual(webhook_utils.MISDIRECTED, forwarded_result)
+        mock_post.assert_called_once()
+        self.assertEqual("http://publisher-2:8001/", mock_post.call_args[0][0])
+        self.assertEqual(
+            "Bearer secret", mock_post.call_args[1]["headers"]["Authorization"]
+        )
+
+    @patch.object(settings, "EOSC_WEBHOOK_TOKEN", "secret")
+    def test_non_ascii_token_is_unauthorized(self):
+        result = self.send({"customer_uuid": "c1"}, token="s\xe9cret")
+
+        self.assertEqual(webhook_utils.UNAUTHORIZED, result)
+
+    @patch.object(settings, "EOSC_WEBHOOK_TOKEN", "secret")
+    def test_notifications_are_checked(self):
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), webhook_utils.build_handler(self.scheduler)
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = "http://127.0.0.1:%s/" % server.server_port
+
+        def post(token, data):
+            headers = {"Authorization": "Bearer " + token}
+            request = urllib.request.Request(
+                url, data=data, headers=headers, method="POST"
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        event = json.dumps({"customer_uuid": "c1"}).encode()
+        self.assertEqual(401, post("wrong", event))
+        self.assertEqual(400, post("secret", b"not json"))
+        self.assertEqual(202, post("secret", json.dumps({"type": "x"}).encode()))
+        self.assertEqual({}, self.scheduler.retries)
+        self.assertEqual(202, post("secret", event))
+        self.assertEqual(["c1"], list(self.scheduler.retries))
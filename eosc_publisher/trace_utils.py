@@ -0,0 +1,228 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+from . import logger, settings
+
+SERVICE_NAME = "waldur-eosc-publisher"
+
+# A context variable works both for threads and asyncio tasks,
+# the thread pools get the span of the submitting thread through bind()
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.started_at = time.time_ns()
+        self.ended_at = None
+
+    def end(self):
+        self.ended_at = time.time_ns()
+        self.trace.add(self)
+
+    def to_otlp(self):
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.started_at),
+            "endTimeUnixNano": str(self.ended_at),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+        }
+
+
+class Trace:
+    """The spans finished during a sync cycle."""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_otlp(self):
+        """Returns the trace in the OTLP/JSON encoding, which an OTLP collector accepts on /v1/traces."""
+        with self._lock:
+            spans = [span.to_otlp() for span in self.spans]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+
+
+def is_tracing_enabled():
+    return bool(settings.EOSC_TRACE_DIR or settings.EOSC_TRACE_OTLP_URL)
+
+
+def export_trace(trace):
+    payload = trace.to_otlp()
+    if settings.EOSC_TRACE_DIR:
+        path = os.path.join(
+            settings.EOSC_TRACE_DIR,
+            "trace-%s-%s.json"
+            % (datetime.now().strftime("%Y%m%d-%H%M%S"), trace.trace_id[:8]),
+        )
+        with open(path, "w") as trace_file:
+            json.dump(payload, trace_file)
+        logger.info("%s spans are written to %s", len(trace.spans), path)
+    if settings.EOSC_TRACE_OTLP_URL:
+        try:
+            response = requests.post(
+                settings.EOSC_TRACE_OTLP_URL, json=payload, timeout=10
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.warning("Unable to export the trace: %s", e)
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Starts a new trace with a root span, the trace is exported when the span ends."""
+    if not is_tracing_enabled():
+        yield None
+        return
+    root = Span(Trace(), name, attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        _current_span.reset(token)
+        root.end()
+        try:
+            export_trace(root.trace)
+        except OSError as e:
+            logger.warning("Unable to write the trace: %s", e)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the block as a child of the current span, it is a no-op outside of a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+async def in_span(name, awaitable, **attributes):
+    """Awaits in a child span, e.g. one of the coroutines passed to asyncio.gather."""
+    with span(name, **attributes):
+        return await awaitable
+
+
+def set_attribute(key, value):
+    """Sets an attribute of the current span, e.g. the UUID of the object the decorated function syncs."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+# The profiles of the worker threads of the cycle being profiled
+_thread_profiles = None
+_thread_profiles_lock = threading.Lock()
+_profile_requested = threading.Event()
+
+
+def request_profile(signum=None, frame=None):
+    """Requests profiling of the next sync cycle, it is the handler of SIGUSR1."""
+    logger.info("The next sync cycle is going to be profiled")
+    _profile_requested.set()
+
+
+def bind(function):
+    """
+    Wraps the function submitted to a thread pool, so it runs in the current span
+    and is profiled along with the cycle which submitted it.
+    """
+    parent = _current_span.get()
+    profiles = _thread_profiles
+
+    def run(*args, **kwargs):
+        token = _current_span.set(parent)
+        profiler = None
+        if profiles is not None:
+            # cProfile sees only the thread it has been enabled in
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                with _thread_profiles_lock:
+                    profiles.append(profiler)
+            _current_span.reset(token)
+
+    return run
+
+
+def dump_profile(profiler, thread_profiles):
+    stats = pstats.Stats(profiler)
+    for thread_profile in thread_profiles:
+        stats.add(thread_profile)
+    path = os.path.join(
+        settings.EOSC_PROFILE_DIR,
+        "profile-%s.prof" % datetime.now().strftime("%Y%m%d-%H%M%S"),
+    )
+    stats.dump_stats(path)
+    logger.info("The profile of the sync cycle is written to %s", path)
+
+
+@contextmanager
+def profiled_cycle():
+    """Runs the block under cProfile if profiling has been requested, the profile is written to EOSC_PROFILE_DIR."""
+    global _thread_profiles
+    if not _profile_requested.is_set():
+        yield
+        return
+    _profile_requested.clear()
+    _thread_profiles = thread_profiles = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _thread_profiles = None
+        try:
+            dump_profile(profiler, thread_profiles)
+        except OSError as e:
+            logger.warning("Unable to write the profile: %s", e)
@@ -0,0 +1,179 @@
+import functools
+import re
+
+from . import vocabularies
+
+# The codes the Provider portal accepts besides the ISO 3166 ones: other, Europe and worldwide
+EXTRA_COUNTRY_CODES = frozenset({"OT", "EO", "WW"})
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+URL_PATTERN = re.compile(r"^https?://[^\s/]+")
+
+PROVIDER_REQUIRED_FIELDS = ("abbreviation", "name", "website", "description", "logo")
+PROVIDER_LOCATION_FIELDS = ("streetNameAndNumber", "postalCode", "city", "country")
+RESOURCE_REQUIRED_FIELDS = (
+    "abbreviation",
+    "name",
+    "description",
+    "logo",
+    "resourceOrganisation",
+    "tagline",
+)
+RESOURCE_URL_FIELDS = ("logo", "order", "webpage", "privacyPolicy", "termsOfUse")
+RESOURCE_EMAIL_FIELDS = ("helpdeskEmail", "securityContactEmail")
+
+
+class PayloadValidationError(Exception):
+    """Raised instead of sending a payload the Provider portal would reject."""
+
+    def __init__(self, kind, errors):
+        super().__init__("Invalid %s payload: %s" % (kind, "; ".join(errors)))
+        self.kind = kind
+        self.errors = errors
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_codes():
+    # pycountry loads its database on first use, so it is imported only when a payload is validated
+    import pycountry
+
+    return frozenset(country.alpha_2 for country in pycountry.countries)
+
+
+def is_country_code(value):
+    return value in EXTRA_COUNTRY_CODES or value in get_country_codes()
+
+
+def check_required(payload, fields, errors, prefix=""):
+    for field in fields:
+        if not payload.get(field):
+            errors.append("%s%s is missing" % (prefix, field))
+
+
+def check_url(value, field, errors):
+    if not isinstance(value, str) or not URL_PATTERN.match(value):
+        errors.append("%s is not a URL: %r" % (field, value))
+
+
+def check_email(value, field, errors):
+    if not isinstance(value, str) or not EMAIL_PATTERN.match(value):
+        errors.append("%s is not an email: %r" % (field, value))
+
+
+def check_contacts(payload, errors):
+    check_email(
+        (payload.get("mainContact") or {}).get("email"), "mainContact.email", errors
+    )
+    for contact in payload.get("publicContacts") or []:
+        check_email(contact.get("email"), "publicContacts.email", errors)
+
+
+def check_countries(values, field, errors):
+    for value in values:
+        if not is_country_code(value):
+            errors.append("%s contains an unknown country: %r" % (field, value))
+
+
+def check_vocabulary(values, vocabulary, field, errors):
+    for value in values:
+        if value not in vocabulary:
+            errors.append("%s contains an unknown value: %r" % (field, value))
+
+
+def check_pairs(pairs, parents, parent_index, parent_field, child_field, field, errors):
+    """Checks the pairs of a parent and a child term, e.g. a category and one of its subcategories."""
+    for pair in pairs:
+        parent = pair.get(parent_field)
+        child = pair.get(child_field)
+        if parent not in parents:
+            errors.append(
+                "%s contains an unknown %s: %r" % (field, parent_field, parent)
+            )
+        elif parent_index.get(child) != parent:
+            errors.append(
+                "%s contains a %s not belonging to %s: %r"
+                % (field, child_field, parent, child)
+            )
+
+
+def validate_provider_payload(payload):
+    """Returns the errors of the provider payload, the list is empty for a valid payload."""
+    errors = []
+    check_required(payload, PROVIDER_REQUIRED_FIELDS, errors)
+    location = payload.get("location") or {}
+    check_required(location, PROVIDER_LOCATION_FIELDS, errors, "location.")
+    if location.get("country"):
+        check_countries([location["country"]], "location.country", errors)
+    check_countries(
+        payload.get("participatingCountries") or [], "participatingCountries", errors
+    )
+    check_url(payload.get("website"), "website", errors)
+    check_url(payload.get("logo"), "logo", errors)
+    check_contacts(payload, errors)
+    return errors
+
+
+def validate_resource_payload(payload):
+    """Returns the errors of the resource payload, the list is empty for a valid payload."""
+    errors = []
+    check_required(payload, RESOURCE_REQUIRED_FIELDS, errors)
+    for field in RESOURCE_URL_FIELDS:
+        check_url(payload.get(field), field, errors)
+    for field in RESOURCE_EMAIL_FIELDS:
+        check_email(payload.get(field), field, errors)
+    check_contacts(payload, errors)
+    check_vocabulary(
+        payload.get("accessModes") or [],
+        vocabularies.ACCESS_MODES,
+        "accessModes",
+        errors,
+    )
+    check_vocabulary(
+        payload.get("accessTypes") or [],
+        vocabularies.ACCESS_TYPES,
+        "accessTypes",
+        errors,
+    )
+    check_vocabulary(
+        payload.get("targetUsers") or [],
+        vocabularies.TARGET_USERS,
+        "targetUsers",
+        errors,
+    )
+    check_pairs(
+        payload.get("categories") or [],
+        vocabularies.CATEGORIES,
+        vocabularies.SUBCATEGORY_CATEGORIES,
+        "category",
+        "subcategory",
+        "categories",
+        errors,
+    )
+    check_pairs(
+        payload.get("scientificDomains") or [],
+        vocabularies.SCIENTIFIC_DOMAINS,
+        vocabularies.SCIENTIFIC_SUBDOMAIN_DOMAINS,
+        "scientificDomain",
+        "scientificSubdomain",
+        "scientificDomains",
+        errors,
+    )
+    check_countries(
+        payload.get("geographicalAvailabilities") or [],
+        "geographicalAvailabilities",
+        errors,
+    )
+    return errors
+
+
+def check_provider_payload(payload):
+    errors = validate_provider_payload(payload)
+    if errors:
+        raise PayloadValidationError("provider", errors)
+    return payload
+
+
+def check_resource_payload(payload):
+    errors = validate_resource_payload(payload)
+    if errors:
+        raise PayloadValidationError("resource", errors)
+    return payload
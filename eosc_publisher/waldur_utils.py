@@ -0,0 +1,223 @@
+import sys
+import threading
+import time
+
+import requests
+from waldur_client import WaldurClient, WaldurClientException, verify_ssl
+
+from . import http_utils, lazy_singleton, logger, settings
+
+
+class RateLimitedWaldurClient(WaldurClient):
+    """
+    Sends the requests of the Waldur client through the shared Waldur session,
+    so they are rate limited and retried like the requests to the other upstreams.
+    """
+
+    def _send(self, method, url, **kwargs):
+        # REQUESTS_VERIFY_SSL is read by the library, its requests pass it the same way
+        params = dict(headers=self.headers, verify=verify_ssl)
+        params.update(kwargs)
+        try:
+            return http_utils.get_session(http_utils.WALDUR).request(
+                method, url, **params
+            )
+        except requests.exceptions.RequestException as error:
+            raise WaldurClientException(str(error))
+
+    def _iter_pages(self, url, **kwargs):
+        response = self._send("get", url, **kwargs)
+        if response.status_code != 200:
+            raise WaldurClientException(self._parse_error(response))
+        yield response.json()
+        kwargs.pop("params", None)
+        while "next" in response.links:
+            # The next page URL already contains the query
+            response = self._send("get", response.links["next"]["url"], **kwargs)
+            if response.status_code != 200:
+                raise WaldurClientException(self._parse_error(response))
+            yield response.json()
+
+    def _get_all(self, url, **kwargs):
+        pages = self._iter_pages(url, **kwargs)
+        # Not only lists are fetched this way, e.g. the configuration is a dict
+        result = next(pages)
+        for page in pages:
+            result += page
+        return result
+
+    def iter_marketplace_provider_offerings(self, filters=None):
+        """Yields the offerings as compact records, only a single page of the full offerings is kept in memory."""
+        params = {"page_size": 200}
+        params.update(filters or {})
+        url = self._build_url(self.Endpoints.MarketplaceProviderOffering)
+        for page in self._iter_pages(url, params=params):
+            for waldur_offering in page:
+                yield OfferingRecord(waldur_offering)
+
+    def list_marketplace_provider_offerings(self, filters=None):
+        return list(self.iter_marketplace_provider_offerings(filters))
+
+    def _make_request(self, method, url, valid_states, retry_count=3, **kwargs):
+        for _ in range(retry_count):
+            response = self._send(method, url, **kwargs)
+            # a special treatment for 409 response, which can be due to async operations
+            if response.status_code != 409 or 409 in valid_states:
+                break
+            time.sleep(2)
+        else:
+            raise WaldurClientException(
+                "Reached a limit of retries for the operation: %s %s" % (method, url)
+            )
+        if response.status_code not in valid_states:
+            raise WaldurClientException(self._parse_error(response))
+        if method == "head":
+            return response
+        if response.text:
+            return response.json()
+        return ""
+
+
+# The fields of the offerings, plans and components read by the sync and the payload builders
+OFFERING_FIELDS = (
+    "uuid",
+    "name",
+    "state",
+    "customer_uuid",
+    "customer_name",
+    "description",
+    "thumbnail",
+    "privacy_policy_link",
+    "terms_of_service_link",
+    "attributes",
+    "plans",
+    "components",
+)
+OFFERING_ATTRIBUTES = ("vpc_Support_email",)
+PLAN_FIELDS = ("uuid", "name", "description", "archived")
+COMPONENT_FIELDS = (
+    "type",
+    "name",
+    "description",
+    "billing_type",
+    "measured_unit",
+    "min_value",
+    "max_value",
+)
+# The values shared by many offerings, they are kept once
+INTERNED_FIELDS = ("state", "customer_uuid", "customer_name")
+
+
+def project(item, fields):
+    return {field: item[field] for field in fields if field in item}
+
+
+class OfferingRecord:
+    """
+    An offering with only the fields read by the sync, the rest of the Waldur offering is dropped.
+    The fields are read like the ones of a dict, so a record can be used wherever an offering dict is.
+    """
+
+    __slots__ = OFFERING_FIELDS
+
+    def __init__(self, waldur_offering):
+        for field in OFFERING_FIELDS:
+            setattr(self, field, waldur_offering.get(field))
+        for field in INTERNED_FIELDS:
+            value = getattr(self, field)
+            if isinstance(value, str):
+                setattr(self, field, sys.intern(value))
+        self.attributes = project(self.attributes or {}, OFFERING_ATTRIBUTES)
+        self.plans = [project(plan, PLAN_FIELDS) for plan in self.plans or []]
+        self.components = [
+            project(component, COMPONENT_FIELDS) for component in self.components or []
+        ]
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def __repr__(self):
+        return "<OfferingRecord %s [uuid=%s]>" % (self.name, self.uuid)
+
+
+@lazy_singleton
+def get_waldur_client():
+    return RateLimitedWaldurClient(settings.WALDUR_API_URL, settings.WALDUR_TOKEN)
+
+
+# Below this number of customers the per-customer fetches are cheaper than the listings
+PREFETCH_MIN_CUSTOMERS = 3
+
+
+class WaldurIndex:
+    """
+    Customers and service providers fetched at the start of a sync, indexed by the customer UUID.
+    A miss returns None and the caller fetches the object itself.
+    """
+
+    def __init__(self, customers=(), service_providers=()):
+        self.customers = {customer["uuid"]: customer for customer in customers}
+        self.service_providers = {
+            service_provider["customer_uuid"]: service_provider
+            for service_provider in service_providers
+        }
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _get(self, index, customer_uuid):
+        value = index.get(customer_uuid)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get_customer(self, customer_uuid):
+        return self._get(self.customers, customer_uuid)
+
+    def get_service_provider(self, customer_uuid):
+        return self._get(self.service_providers, customer_uuid)
+
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def build_index(customer_uuids, customers, service_providers):
+    """Indexes only the customers being synced and their service providers."""
+    customer_uuids = set(customer_uuids)
+    return WaldurIndex(
+        [customer for customer in customers if customer["uuid"] in customer_uuids],
+        [
+            service_provider
+            for service_provider in service_providers
+            if service_provider["customer_uuid"] in customer_uuids
+        ],
+    )
+
+
+def prefetch_waldur_index(customer_uuids):
+    if len(customer_uuids) < PREFETCH_MIN_CUSTOMERS:
+        return WaldurIndex()
+    waldur_client = get_waldur_client()
+    customers = waldur_client.list_customers()
+    service_providers = waldur_client.list_service_providers()
+    logger.info(
+        "Prefetched %s customers and %s service providers",
+        len(customers),
+        len(service_providers),
+    )
+    return build_index(customer_uuids, customers, service_providers)
+
+
+def get_customer(customer_uuid):
+    waldur_client = get_waldur_client()
+    return waldur_client._get_resource(waldur_client.Endpoints.Customers, customer_uuid)
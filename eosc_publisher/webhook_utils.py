@@ -0,0 +1,151 @@
+import functools
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from . import logger, metrics_utils, settings, shard_utils
+from .waldur_utils import get_waldur_client
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+IGNORED = "ignored"
+INVALID = "invalid"
+UNAUTHORIZED = "unauthorized"
+MISDIRECTED = "misdirected"
+FAILED = "failed"
+
+RESULT_STATUSES = {
+    QUEUED: 202,
+    DUPLICATE: 202,
+    IGNORED: 202,
+    INVALID: 400,
+    UNAUTHORIZED: 401,
+    MISDIRECTED: 421,
+    FAILED: 503,
+}
+# Marks the notifications forwarded by another replica, they are never forwarded again
+FORWARDED_HEADER = "X-EOSC-Forwarded"
+
+
+@functools.lru_cache(maxsize=1024)
+def get_offering_customer_uuid(offering_uuid):
+    offering = get_waldur_client().get_marketplace_provider_offering(offering_uuid)
+    return offering["customer_uuid"]
+
+
+def get_customer_uuid(event):
+    """
+    Returns the customer whose offerings are to be synced, or None if the event is not about an offering or customer.
+    The events of Waldur web hooks keep the UUIDs in the context, flat payloads are accepted as well.
+    """
+    context = event.get("context")
+    if not isinstance(context, dict):
+        context = event
+    # The customer of an event about a marketplace resource is the consumer, so the offering is looked up first
+    if context.get("offering_uuid"):
+        return get_offering_customer_uuid(context["offering_uuid"])
+    return context.get("customer_uuid")
+
+
+def forward_event(customer_uuid, body, token):
+    """Sends the event to the replica of the shard of the customer and returns its result."""
+    shard = shard_utils.get_shard(customer_uuid, settings.EOSC_SHARD_COUNT)
+    url = settings.EOSC_WEBHOOK_SHARD_URL.format(shard=shard)
+    try:
+        response = requests.post(
+            url,
+            data=body,
+            headers={"Authorization": "Bearer %s" % token, FORWARDED_HEADER: "1"},
+            timeout=(
+                settings.EOSC_HTTP_CONNECT_TIMEOUT,
+                settings.EOSC_HTTP_READ_TIMEOUT,
+            ),
+        )
+        result = response.json()["result"]
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        logger.warning("The event can not be forwarded to the shard %s: %s", shard, e)
+        return FAILED
+    return result if result in RESULT_STATUSES else FAILED
+
+
+def handle_event(scheduler, body, token, forwarded=False):
+    """Schedules the sync of the customer of the event and returns the result of the event."""
+    # The bytes are compared, compare_digest rejects the strings with non-ASCII characters
+    if settings.EOSC_WEBHOOK_TOKEN and not hmac.compare_digest(
+        (token or "").encode(), settings.EOSC_WEBHOOK_TOKEN.encode()
+    ):
+        return UNAUTHORIZED
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return INVALID
+    if not isinstance(event, dict):
+        return INVALID
+    try:
+        customer_uuid = get_customer_uuid(event)
+    except Exception as e:
+        logger.warning("The customer of the event can not be looked up: %s", e)
+        return FAILED
+    if not customer_uuid:
+        return IGNORED
+    if not shard_utils.is_own_customer(customer_uuid):
+        # The change is not dropped: it is forwarded to the replica of its shard or rejected, so the sender can retry
+        if settings.EOSC_WEBHOOK_SHARD_URL and not forwarded:
+            return forward_event(customer_uuid, body, token)
+        return MISDIRECTED
+    if not scheduler.schedule_change(customer_uuid):
+        return DUPLICATE
+    logger.info(
+        "The customer [uuid=%s] is notified as changed, it is synced in %.0f seconds",
+        customer_uuid,
+        scheduler.debounce,
+    )
+    return QUEUED
+
+
+def get_bearer_token(authorization):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return token.strip()
+
+
+def build_handler(scheduler):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            token = get_bearer_token(self.headers.get("Authorization"))
+            forwarded = self.headers.get(FORWARDED_HEADER) is not None
+            result = handle_event(scheduler, body, token, forwarded)
+            metrics_utils.WEBHOOK_EVENTS.labels(result).inc()
+            data = json.dumps({"result": result}).encode()
+            self.send_response(RESULT_STATUSES[result])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return Handler
+
+
+def start_webhook_server(scheduler):
+    """Starts the listener of the Waldur change notifications on a thread of its own."""
+    if not settings.EOSC_WEBHOOK_PORT:
+        return None
+    server = ThreadingHTTPServer(
+        ("", settings.EOSC_WEBHOOK_PORT), build_handler(scheduler)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="webhook", daemon=True).start()
+    logger.info(
+        "Listening to the change notifications on port %s",
+        settings.EOSC_WEBHOOK_PORT,
+    )
+    return server